@@ -0,0 +1,77 @@
+"""
+Microbenchmark: serialisation cost of the /api/menu and /api/stats payloads.
+
+Compares Flask's default provider (dicts built per row, float() on prices)
+against FastJSONProvider fed SQLAlchemy rows directly, at 1k and 10k rows.
+
+    python benchmarks/bench_json.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Numeric, create_engine, text
+
+from json_provider import FastJSONProvider, orjson
+
+MENU_SQL = "SELECT id, name, description, price, category, image_url FROM menu_items"
+
+
+def _rows(n):
+    engine = create_engine("sqlite+pysqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE menu_items (id INTEGER PRIMARY KEY, name TEXT, description TEXT,
+                                     price NUMERIC, category TEXT, image_url TEXT)
+        """))
+        conn.execute(
+            text("INSERT INTO menu_items VALUES (:id, :n, :d, :p, :c, :u)"),
+            [
+                {"id": i, "n": f"Item {i}", "d": "Tasty test item with a description.",
+                 "p": 9.99, "c": "burger", "u": f"https://example.com/{i}.jpg"}
+                for i in range(n)
+            ],
+        )
+        # Numeric -> Decimal prices, like the MySQL DECIMAL(10,2) column
+        return conn.execute(text(MENU_SQL).columns(price=Numeric(10, 2))).fetchall()
+
+
+def _menu_dicts(rows):
+    return [
+        {"id": r.id, "name": r.name, "description": r.description, "price": float(r.price),
+         "category": r.category, "image_url": r.image_url}
+        for r in rows
+    ]
+
+
+def _stats_dicts(rows, fast):
+    base = (r._mapping for r in rows) if fast else _menu_dicts(rows)
+    return [{**m, "review_count": 3, "avg_rating": 4.333, "total_rating": 13.0} for m in base]
+
+
+def main():
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    print(f"encoder: {'orjson' if orjson else 'stdlib json'}")
+
+    for n in (1_000, 10_000):
+        rows = _rows(n)
+        reps = 20 if n == 1_000 else 5
+        cases = {
+            "menu default": lambda: default.dumps(_menu_dicts(rows)),
+            "menu fast":    lambda: fast.dumps(rows),
+            "stats default": lambda: default.dumps(_stats_dicts(rows, fast=False)),
+            "stats fast":    lambda: fast.dumps(_stats_dicts(rows, fast=True)),
+        }
+        for name, fn in cases.items():
+            t = min(timeit.repeat(fn, number=reps, repeat=3)) / reps
+            print(f"{n:>6} rows  {name:<14} {t * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: login throughput (password verifications per second) at the
+configured hash method, inline vs on the PasswordHasher process pool.
+
+Also times a cheap request handled on another thread while the logins run,
+which is what the pool is for: inline hashing holds the GIL.
+
+    PASSWORD_HASH_METHOD=scrypt:32768:8:1 python benchmarks/bench_password.py
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from werkzeug.security import generate_password_hash
+
+from passwords import DEFAULT_METHOD, PasswordHasher
+
+METHOD = os.environ.get("PASSWORD_HASH_METHOD", DEFAULT_METHOD)
+LOGINS = int(os.environ.get("BENCH_LOGINS", "40"))
+
+
+def _cheap_request_latency(stop: threading.Event, out: list):
+    # stand-in for a /menu request served from cache: tiny bit of Python work
+    while not stop.is_set():
+        t = time.perf_counter()
+        sum(range(2_000))
+        out.append(time.perf_counter() - t)
+        time.sleep(0.005)
+
+
+def run(hasher: PasswordHasher, threads: int):
+    stored = generate_password_hash("Password123!", METHOD)
+    hasher.verify(stored, "Password123!")  # warm up (pool start-up)
+
+    stop, lat = threading.Event(), []
+    probe = threading.Thread(target=_cheap_request_latency, args=(stop, lat))
+    probe.start()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as ex:
+        list(ex.map(lambda _: hasher.verify(stored, "Password123!"), range(LOGINS)))
+    elapsed = time.perf_counter() - t0
+
+    stop.set()
+    probe.join()
+    lat.sort()
+    p99 = lat[int(len(lat) * 0.99) - 1] * 1000 if lat else float("nan")
+    return LOGINS / elapsed, p99
+
+
+def main():
+    cores = os.cpu_count() or 1
+    print(f"method: {METHOD}   cores: {cores}   logins: {LOGINS}")
+
+    cases = [("inline", PasswordHasher(METHOD, workers=0), 4)]
+    for workers in sorted({1, cores}):
+        cases.append((f"pool x{workers}", PasswordHasher(METHOD, workers=workers, max_queue=LOGINS), 4 * workers))
+
+    for name, hasher, threads in cases:
+        try:
+            rate, p99 = run(hasher, threads)
+        finally:
+            hasher.shutdown()
+        per_core = rate / max(1, hasher.workers or 1)
+        print(f"{name:<10} {rate:8.1f} logins/s   {per_core:8.1f} /s per core   "
+              f"other-request p99 {p99:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Cache invalidation across instances (and gunicorn workers).
+
+Every process keeps in-memory caches keyed on per-namespace versions
+("menu", "stats", "reviews", "orders", ...). With one process a dict of
+counters was enough; with several, a write on one instance has to reach
+the others. CacheBus keeps the counters in a shared store:
+
+  bump(ns)     increments this process's own counter and the shared version
+               (call it after the writer's commit, not inside: it is one hot
+               row). If the shared version had also been moved by someone
+               else, the subscribers run, as a poll would have run them.
+  bump(ns, defer=True)
+               for bumps on a hot path (every checkout): the own counter moves
+               at once, the shared row gets one increment of the summed count
+               at most every `defer_seconds` per process, from a timer thread.
+               Increments that fail to reach the store are retried that way.
+  version(ns)  last shared version seen + own counter, the key caches use;
+               at most every `poll_seconds` the whole table is re-read (one
+               tiny SELECT) and namespaces whose shared version moved get
+               their subscribers called, so only the affected caches are
+               dropped
+
+The two counters are kept apart so a failed push (own counter ahead of
+the shared row) can't hide a later remote bump: any move of the shared
+version changes version(ns).
+
+Stores: SqlVersionStore (cache_versions table in Cloud SQL, works on
+SQLite too) and MemoryVersionStore (single process, tests).
+"""
+import logging
+import threading
+import time
+
+from queries import sql
+
+log = logging.getLogger(__name__)
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        namespace VARCHAR(32) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    )
+"""
+
+
+class MemoryVersionStore:
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, ns: str, by: int = 1) -> int:
+        with self._lock:
+            self._versions[ns] = self._versions.get(ns, 0) + by
+            return self._versions[ns]
+
+    def read(self) -> dict:
+        with self._lock:
+            return dict(self._versions)
+
+
+class SqlVersionStore:
+    def __init__(self, engine_getter):
+        self._engine = engine_getter
+
+    def bump(self, ns: str, by: int = 1) -> int:
+        with self._engine().begin() as conn:
+            sql.execute(conn, "cache_versions.bump", {"namespace": ns, "version": by})
+            return int(sql.execute(conn, "cache_versions.get", {"ns": ns}).scalar())
+
+    def read(self) -> dict:
+        with self._engine().connect() as conn:
+            return {r.namespace: int(r.version) for r in sql.execute(conn, "cache_versions.all")}
+
+
+class CacheBus:
+    def __init__(self, store, poll_seconds: float = 2.0, clock=time.monotonic, defer_seconds: float = 1.0):
+        self.store = store
+        self.poll_seconds = poll_seconds
+        self.defer_seconds = defer_seconds
+        self._clock = clock
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._timer = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+        self._shared = {}     # ns -> last shared version seen
+        self._local = {}      # ns -> bumps made by this process
+        self._deferred = {}
+        self._polled_at = None
+        self.polls = self.errors = self.remote_changes = self.shared_writes = 0
+
+    def subscribe(self, ns: str, callback):
+        """callback(ns) runs when another process bumped ns."""
+        self._subscribers.setdefault(ns, []).append(callback)
+
+    def version(self, ns: str) -> int:
+        self.maybe_poll()
+        return self._version(ns)
+
+    def _version(self, ns: str) -> int:
+        return self._shared.get(ns, 0) + self._local.get(ns, 0)
+
+    def bump(self, ns: str, defer: bool = False) -> int:
+        """
+        Store errors only cost cross-instance freshness: the own counter
+        still moves, so this process never serves its own stale data.
+        """
+        with self._lock:
+            self._local[ns] = self._local.get(ns, 0) + 1
+            if defer:
+                self._defer(ns, 1)
+        if not defer:
+            self._push(ns, 1)
+        return self._version(ns)
+
+    def _defer(self, ns: str, n: int):
+        # caller holds self._lock
+        self._deferred[ns] = self._deferred.get(ns, 0) + n
+        if self._timer is None:
+            self._timer = threading.Timer(self.defer_seconds, self.flush_deferred)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush_deferred(self):
+        """Writes the deferred bumps to the store (the timer calls this)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            pending, self._deferred, self._timer = self._deferred, {}, None
+        for ns, n in pending.items():
+            self._push(ns, n)
+
+    def _push(self, ns: str, by: int):
+        try:
+            v = self.store.bump(ns, by)
+        except Exception as e:
+            log.warning("cache bus: bump %s failed (%s), retrying", ns, e)
+            with self._lock:
+                self.errors += 1
+                self._defer(ns, by)   # other processes still have to hear of it
+            return
+        with self._lock:
+            self.shared_writes += 1
+            # more than our own increment landed since we last looked: other
+            # processes bumped ns, so what we cached for it is stale
+            missed = v - by > self._shared.get(ns, 0)
+            self._shared[ns] = max(v, self._shared.get(ns, 0))
+        if missed:
+            self._notify(ns)
+
+    def _notify(self, ns: str):
+        self.remote_changes += 1
+        for cb in self._subscribers.get(ns, ()):
+            try:
+                cb(ns)
+            except Exception:
+                log.exception("cache bus: subscriber for %s failed", ns)
+
+    def maybe_poll(self, force: bool = False):
+        now = self._clock()
+        if not force and self._polled_at is not None and now - self._polled_at < self.poll_seconds:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return   # another thread is polling, use what we have
+        try:
+            self._polled_at = now
+            try:
+                shared = self.store.read()
+            except Exception as e:
+                log.warning("cache bus: poll failed (%s)", e)
+                self.errors += 1
+                return
+            self.polls += 1
+            changed = []
+            with self._lock:
+                for ns, v in shared.items():
+                    if v > self._shared.get(ns, 0):
+                        self._shared[ns] = v
+                        changed.append(ns)
+            if self.polls == 1:
+                return   # startup: nothing is cached yet, just adopt the versions
+            for ns in changed:
+                self._notify(ns)
+        finally:
+            self._poll_lock.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            names = set(self._shared) | set(self._local)
+            versions = {ns: self._version(ns) for ns in names}
+        return {"versions": versions, "shared": dict(self._shared), "local": dict(self._local), "polls": self.polls, "errors": self.errors,
+                "remote_changes": self.remote_changes, "shared_writes": self.shared_writes,
+                "deferred": dict(self._deferred), "poll_seconds": self.poll_seconds}
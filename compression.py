@@ -0,0 +1,179 @@
+"""
+Response compression (gzip, and Brotli when the `brotli` package is installed).
+
+register_compression(app) adds an after_request hook that:
+  - negotiates Accept-Encoding (q-values respected, br preferred over gzip)
+  - skips small bodies, non-text types, streamed/passthrough responses and
+    anything that already has a Content-Encoding
+  - adds ETags (and answers If-None-Match with 304) for GET API responses
+  - caches compressed bodies of responses that carry an ETag, keyed by
+    (ETag, encoding), so hot API responses are only compressed once
+"""
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli  # optional
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+DEFAULTS = {
+    "COMPRESS_MIN_SIZE": 1024,   # bytes; below this the headers cost more than we save
+    "COMPRESS_LEVEL": 6,         # gzip level
+    "COMPRESS_BR_QUALITY": 5,    # brotli quality (11 is far too slow per request)
+    "COMPRESS_CACHE_SIZE": 128,  # compressed variants kept in memory
+    "COMPRESS_ETAG_PATHS": ("/api/",),  # GET responses here get an ETag (and 304s)
+}
+
+
+class CompressedCache:
+    """Small thread-safe LRU of compressed bodies."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+def parse_accept_encoding(header: str | None) -> dict:
+    """'gzip, br;q=0.8, *;q=0' -> {"gzip": 1.0, "br": 0.8, "*": 0.0}"""
+    out = {}
+    for part in (header or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+                q = min(max(q, 0.0), 1.0) if q == q else 0.0   # q == q: not nan
+        out[name.strip().lower()] = q
+    return out
+
+
+def choose_encoding(header: str | None) -> str | None:
+    prefs = parse_accept_encoding(header)
+    wildcard = prefs.get("*")
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+
+    best, best_q = None, 0.0
+    for enc in candidates:
+        q = prefs.get(enc, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def compress_bytes(data: bytes, encoding: str, config) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESS_BR_QUALITY"])
+    return gzip.compress(data, compresslevel=config["COMPRESS_LEVEL"], mtime=0)
+
+
+def _is_compressible(mimetype: str | None) -> bool:
+    if not mimetype:
+        return False
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+
+def register_compression(app):
+    for k, v in DEFAULTS.items():
+        app.config.setdefault(k, v)
+
+    cache = CompressedCache(app.config["COMPRESS_CACHE_SIZE"])
+    app.extensions["compression_cache"] = cache
+
+    @app.after_request
+    def _compress_response(response):
+        if not _is_compressible(response.mimetype):
+            return response
+
+        # the body depends on Accept-Encoding from here on, for caches/CDNs too
+        response.vary.add("Accept-Encoding")
+
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or "Content-Range" in response.headers
+            or "no-transform" in (response.headers.get("Cache-Control") or "")
+        ):
+            return response
+
+        if (
+            request.method in ("GET", "HEAD")
+            and response.status_code == 200
+            and not response.get_etag()[0]
+            and request.path.startswith(tuple(app.config["COMPRESS_ETAG_PATHS"]))
+        ):
+            response.add_etag()
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        if not encoding:
+            return response
+
+        data = response.get_data()
+        if len(data) < app.config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        etag, _ = response.get_etag()
+        key = (etag, encoding) if etag and request.method in ("GET", "HEAD") else None
+
+        body = cache.get(key) if key else None
+        if body is None:
+            body = compress_bytes(data, encoding, app.config)
+            if key:
+                cache.put(key, body)
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            # byte-for-byte different representation -> only weakly equal
+            response.set_etag(etag, weak=True)
+        return response
+
+    return cache
@@ -0,0 +1,131 @@
+"""
+Jinja fragment caching + bytecode cache setup.
+
+Usage in a template:
+
+    {% cache "menu-cards", menu_version, stats_version %}
+      ... expensive markup ...
+    {% endcache %}
+
+The rendered block is stored in an LRU keyed on all the arguments, so
+bumping a version argument is enough to invalidate it. Anything that
+differs per user must stay outside the block, or be written as a slot:
+
+    <input type="hidden" name="csrf_token" value="{{ fragment_slot('csrf_token') }}">
+
+Slots are filled from `env.fragment_cache_substitutions` ({name: fn}) on
+every render, cache hit or not. The slot marker is an HTML comment, which
+autoescaped text (review comments etc.) can never contain, so only the
+places the template marked are substituted.
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup, escape
+
+
+def fragment_slot(name: str) -> Markup:
+    """Marks where the per-request value `name` goes inside a cached block."""
+    return Markup(f"<!--fragment-slot:{name}-->")
+
+
+class FragmentLRU:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(
+            fragment_cache=FragmentLRU(),
+            fragment_cache_substitutions={},
+        )
+        environment.globals["fragment_slot"] = fragment_slot
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        # one or more comma separated key parts
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_cached", [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        cache = self.environment.fragment_cache
+        key = tuple(str(p) for p in key_parts)
+
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.put(key, html)
+
+        for name, fn in self.environment.fragment_cache_substitutions.items():
+            slot = fragment_slot(name)
+            if slot in html:
+                html = html.replace(slot, escape(fn()))
+        return Markup(html)
+
+
+def make_bytecode_cache(directory: str | None = None) -> FileSystemBytecodeCache:
+    """
+    Compiled templates are written to disk so a new worker on the same
+    instance loads bytecode instead of re-parsing every template.
+    """
+    directory = directory or os.environ.get("JINJA_BYTECODE_DIR") or os.path.join(
+        tempfile.gettempdir(), "jinja_bytecode"
+    )
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+
+def init_fragment_cache(app):
+    env = app.jinja_env
+    env.add_extension(FragmentCacheExtension)
+    env.fragment_cache.maxsize = int(app.config.get("FRAGMENT_CACHE_SIZE", 256))
+    try:
+        env.bytecode_cache = make_bytecode_cache(app.config.get("JINJA_BYTECODE_DIR"))
+    except OSError as e:
+        # read-only filesystem etc. -> just compile in memory like before
+        app.logger.warning("Jinja bytecode cache disabled: %s", e)
+    return env.fragment_cache
@@ -0,0 +1,95 @@
+import os
+import gzip
+import json
+from datetime import datetime, timezone, timedelta
+from google.cloud import firestore
+
+FIRESTORE_DB = os.environ.get("FIRESTORE_DB", "resturantdb2")
+INTERNAL_TOKEN = os.environ.get("INTERNAL_TOKEN", "")
+RETENTION_DAYS = int(os.environ.get("AUDIT_LOG_RETENTION_DAYS", "90"))
+# gs bucket for gzip NDJSON archives; unset = delete without archiving
+ARCHIVE_BUCKET = os.environ.get("AUDIT_ARCHIVE_BUCKET", "")
+
+BATCH_SIZE = 500      # Firestore batched write limit
+MAX_BATCHES = 40      # bounds one invocation (Cloud Scheduler calls again)
+
+db = firestore.Client(database=FIRESTORE_DB)
+
+
+def _json_default(o):
+    if hasattr(o, "isoformat"):
+        return o.isoformat()
+    return str(o)
+
+
+def _to_ndjson_gz(docs) -> bytes:
+    lines = []
+    for d in docs:
+        data = d.to_dict() or {}
+        data["id"] = d.id
+        lines.append(json.dumps(data, default=_json_default, separators=(",", ":")))
+    return gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def _archive(blob_name: str, payload: bytes):
+    from google.cloud import storage  # only needed when archiving
+
+    bucket = storage.Client().bucket(ARCHIVE_BUCKET)
+    blob = bucket.blob(blob_name)
+    blob.content_encoding = "gzip"
+    blob.upload_from_string(payload, content_type="application/x-ndjson")
+
+
+def purge_expired(cutoff: datetime, archive=None, batch_size: int = BATCH_SIZE,
+                  max_batches: int = MAX_BATCHES) -> dict:
+    """
+    Deletes audit_logs created before `cutoff`, oldest first, in batches.
+    With `archive(name, gz_bytes)` each batch is archived before it is deleted,
+    so a failed upload leaves the logs in place for the next run.
+    """
+    deleted = batches = 0
+    while batches < max_batches:
+        docs = list(
+            db.collection("audit_logs")
+            .where("created_at", "<", cutoff)
+            .order_by("created_at")
+            .limit(batch_size)
+            .stream()
+        )
+        if not docs:
+            break
+
+        if archive is not None:
+            first = (docs[0].to_dict() or {}).get("created_at")
+            stamp = first.strftime("%Y/%m/%d/%H%M%S") if hasattr(first, "strftime") else "unknown"
+            archive(f"audit_logs/{stamp}-{docs[0].id}-{len(docs)}.ndjson.gz", _to_ndjson_gz(docs))
+
+        batch = db.batch()
+        for d in docs:
+            batch.delete(d.reference)
+        batch.commit()
+
+        deleted += len(docs)
+        batches += 1
+        if len(docs) < batch_size:
+            break
+
+    return {"deleted": deleted, "batches": batches, "more": batches >= max_batches}
+
+
+def purge_audit_logs_http(request):
+    # --- Token auth ---
+    token = request.headers.get("X-Internal-Token", "")
+    if INTERNAL_TOKEN and token != INTERNAL_TOKEN:
+        return ("Unauthorized", 401)
+
+    days_raw = request.args.get("days", str(RETENTION_DAYS))
+    try:
+        days = max(1, int(days_raw))
+    except ValueError:
+        days = RETENTION_DAYS
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    result = purge_expired(cutoff, archive=_archive if ARCHIVE_BUCKET else None)
+    result["cutoff"] = cutoff.isoformat()
+    return (json.dumps(result), 200, {"Content-Type": "application/json"})
@@ -0,0 +1,126 @@
+"""
+Gunicorn config for App Engine.
+
+Picks worker class + worker/thread counts from the CPU count and the
+App Engine instance class, then derives the SQLAlchemy pool size from the
+same numbers so workers x pool never goes over the Cloud SQL connection budget.
+The budget is per instance: DB_CONN_BUDGET directly, or DB_CONN_BUDGET_TOTAL
+(the database's whole allowance for this service) split over MAX_INSTANCES,
+which must match automatic_scaling.max_instances in app.yaml.
+The pool values are handed to main.get_engine() through env vars
+(workers are forked from this process so they inherit os.environ).
+"""
+import multiprocessing
+import os
+
+# ---- Instance profiles ----
+# (workers, threads per worker). Most request time is spent waiting on
+# Firestore / Cloud SQL, so we lean on threads rather than extra processes
+# (each worker costs another copy of the app in memory).
+INSTANCE_PROFILES = {
+    "F1": (1, 8),
+    "F2": (2, 8),
+    "F4": (4, 8),
+    "F4_1G": (4, 16),
+}
+
+DEFAULT_THREADS = 8
+DEFAULT_DB_CONN_BUDGET = 10
+
+
+def _env_int(key: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(key, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def instance_db_budget() -> int:
+    """Connections one instance may open; every instance can be up at once."""
+    if os.environ.get("DB_CONN_BUDGET_TOTAL"):
+        total = _env_int("DB_CONN_BUDGET_TOTAL", DEFAULT_DB_CONN_BUDGET)
+        return max(1, total // _env_int("MAX_INSTANCES", 1))
+    return _env_int("DB_CONN_BUDGET", DEFAULT_DB_CONN_BUDGET)
+
+
+def compute_sizing(cpu_count: int, instance_class: str | None, db_budget: int, on_app_engine: bool = False):
+    """
+    Returns a dict with worker_class, workers, threads, pool_size, max_overflow
+    and clamped_from (the worker count asked for, if the DB budget cut it).
+    Env overrides (GUNICORN_WORKERS / GUNICORN_THREADS / GUNICORN_WORKER_CLASS) win.
+    """
+    profile = INSTANCE_PROFILES.get((instance_class or "").upper())
+    if profile:
+        workers, threads = profile
+    elif on_app_engine:
+        # cpu_count() there is the host's, not the instance class's share of it
+        workers, threads = INSTANCE_PROFILES["F1"]
+    else:
+        workers, threads = cpu_count * 2 + 1, DEFAULT_THREADS
+
+    workers = _env_int("GUNICORN_WORKERS", workers)
+    threads = _env_int("GUNICORN_THREADS", threads)
+
+    # a worker can't run on less than one connection, so more workers than
+    # the budget would put the total over it: run fewer instead
+    clamped_from = None
+    if workers > db_budget:
+        clamped_from, workers = workers, db_budget
+
+    # threaded workers for I/O bound requests; gevent etc. can be forced via env
+    worker_class = os.environ.get("GUNICORN_WORKER_CLASS") or ("gthread" if threads > 1 else "sync")
+
+    # every worker gets an equal share of the DB budget, and never needs more
+    # connections than it has threads (a thread only ever holds one connection)
+    per_worker = max(1, db_budget // workers)
+    conns = min(threads, per_worker)
+    pool_size = max(1, (conns * 3) // 4)
+    max_overflow = conns - pool_size
+
+    return {
+        "worker_class": worker_class,
+        "workers": workers,
+        "threads": threads,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "clamped_from": clamped_from,
+    }
+
+
+_sizing = compute_sizing(
+    multiprocessing.cpu_count(),
+    os.environ.get("INSTANCE_CLASS"),
+    instance_db_budget(),
+    on_app_engine=bool(os.environ.get("GAE_ENV")),
+)
+
+worker_class = _sizing["worker_class"]
+workers = _sizing["workers"]
+threads = _sizing["threads"]
+
+# keep requests flowing while a worker restarts
+graceful_timeout = 20
+timeout = 60
+
+os.environ.setdefault("DB_POOL_SIZE", str(_sizing["pool_size"]))
+os.environ.setdefault("DB_MAX_OVERFLOW", str(_sizing["max_overflow"]))
+
+
+def when_ready(server):
+    if _sizing["clamped_from"]:
+        server.log.warning(
+            "gunicorn sizing: %s workers asked for but the DB budget is %s connections, running %s",
+            _sizing["clamped_from"], instance_db_budget(), workers,
+        )
+    server.log.info(
+        "gunicorn sizing: instance_class=%s cpus=%s worker_class=%s workers=%s threads=%s "
+        "db_pool_size=%s db_max_overflow=%s db_budget=%s",
+        os.environ.get("INSTANCE_CLASS", "?"),
+        multiprocessing.cpu_count(),
+        worker_class,
+        workers,
+        threads,
+        os.environ["DB_POOL_SIZE"],
+        os.environ["DB_MAX_OVERFLOW"],
+        instance_db_budget(),
+    )
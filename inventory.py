@@ -0,0 +1,135 @@
+"""
+Stock for limited menu items.
+
+menu_items.stock is NULL for the normal, unlimited items and a count for
+limited ones. Checkout never reads-then-writes the count: every limited
+line is one conditional decrement
+
+    UPDATE menu_items SET stock = stock - :q
+    WHERE id = :id AND (stock IS NULL OR stock >= :q)
+
+sent as a single executemany, and the matched row count tells us whether
+all of them got their stock (SQLAlchemy connects to MySQL with FOUND_ROWS,
+so rowcount is matched rows, not changed ones). Each UPDATE only row-locks its own item until
+commit, so concurrent checkouts queue on a hot item for the length of one
+transaction instead of a SELECT ... FOR UPDATE round trip, and two orders
+can never both take the last one. Lines are sent in item id order so two
+carts with the same items lock them in the same order (no deadlocks).
+
+Unlimited items are not touched at all (their lines carry limited=False
+from the cart lookup), so the usual menu doesn't get any new locking.
+
+Cancelling an order gives its lines back to the items that are still
+limited (release_stock). Order lines don't record whether the item was
+limited when it was bought, so an item made limited after the sale gets
+those units too; items made unlimited since just stay unlimited.
+"""
+from sqlalchemy import text
+
+from queries import sql
+
+
+class SoldOut(Exception):
+    """Not enough stock for some lines; nothing was taken."""
+
+    def __init__(self, items):
+        self.items = items   # [{"id", "name", "left"}]
+        super().__init__(", ".join(f"{i['name']} ({i['left']} left)" for i in items))
+
+
+def is_limited(line) -> bool:
+    # lines journalled before stock existed don't say: treat them as limited,
+    # for an unlimited item the decrement just matches and leaves NULL
+    return line.get("limited", True)
+
+
+def wanted(lines) -> dict:
+    """{item_id: qty} for the limited lines of an order."""
+    out = {}
+    for ln in lines:
+        if is_limited(ln):
+            mid = int(ln["menu_item_id"])
+            out[mid] = out.get(mid, 0) + int(ln["qty"])
+    return out
+
+
+def reserve_stock(conn, lines) -> list[int]:
+    """
+    Takes stock for every limited line, inside the caller's transaction.
+    Raises SoldOut (with the savepoint rolled back, nothing taken) if any
+    line can't be covered. Returns the ids that just sold out, so the
+    caller can mark them changed and bump the menu version.
+    """
+    need = wanted(lines)
+    if not need:
+        return []
+
+    params = [{"id": mid, "q": q} for mid, q in sorted(need.items())]
+    sp = conn.begin_nested()
+    try:
+        matched = sql.execute(conn, "stock.reserve", params).rowcount
+    except Exception:
+        sp.rollback()
+        raise
+    if matched != len(params):
+        sp.rollback()
+        raise SoldOut(_short_lines(conn, need))
+    sp.commit()
+
+    levels = sql.execute(conn, "stock.levels", {"ids": list(need)}).fetchall()
+    return sorted(r.id for r in levels if r.stock == 0)
+
+
+def short_lines(conn, lines) -> list[dict]:
+    """
+    The lines that current stock can't cover, read without locking. For the
+    intake path, which acknowledges an order before reserve_stock runs: it
+    turns away what is already sold out, the drain still has the last word.
+    """
+    need = wanted(lines)
+    return _short_lines(conn, need) if need else []
+
+
+def release_stock(conn, order_ids) -> list[int]:
+    """
+    Puts the lines of (just cancelled) orders back on the shelf, inside the
+    caller's transaction. Returns the ids that were sold out and are
+    available again, so the caller can mark them changed like reserve_stock's.
+    """
+    rows = sql.execute(conn, "stock.ordered", {"oids": [int(o) for o in order_ids]}).fetchall()
+    back = {int(r.menu_item_id): int(r.qty) for r in rows if r.qty}
+    if not back:
+        return []
+    sql.execute(conn, "stock.release", [{"id": mid, "q": q} for mid, q in sorted(back.items())])
+    levels = sql.execute(conn, "stock.levels", {"ids": list(back)}).fetchall()
+    return sorted(r.id for r in levels if r.stock is not None and r.stock == back[r.id])
+
+
+def _short_lines(conn, need) -> list[dict]:
+    rows = sql.execute(conn, "stock.levels", {"ids": list(need)}).fetchall()
+    found = {r.id: r for r in rows}
+    short = []
+    for mid, q in sorted(need.items()):
+        r = found.get(mid)
+        if r is None:
+            short.append({"id": mid, "name": f"item {mid}", "left": 0})
+        elif r.stock is not None and r.stock < q:
+            short.append({"id": mid, "name": r.name, "left": int(r.stock)})
+    return short
+
+
+def set_stock(conn, item_id: int, stock: int | None) -> bool:
+    """Admin restock / make unlimited (None). False if the item doesn't exist."""
+    res = conn.execute(text("UPDATE menu_items SET stock = :s WHERE id = :id"),
+                       {"s": stock, "id": int(item_id)})
+    return res.rowcount == 1
+
+
+def parse_stock(raw) -> int | None:
+    """Form/JSON value -> stock. Blank means unlimited."""
+    if raw is None or str(raw).strip() == "":
+        return None
+    value = int(str(raw).strip())
+    if value < 0:
+        raise ValueError("stock must be >= 0")
+    return value
@@ -1,15 +1,24 @@
 import os
 from functools import wraps
 from decimal import Decimal
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+import csv
+import io
 import json
+import math
+import re
+import tempfile
+import threading
+import time
+import uuid
 import requests
 from datetime import datetime, timezone
 from google.cloud import firestore
 from google.cloud.firestore_v1.field_path import FieldPath
 from google.cloud import secretmanager
-from flask_wtf.csrf import CSRFProtect
-from sqlalchemy import create_engine, text, bindparam
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from sqlalchemy import create_engine, text, bindparam, inspect
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
 
 
 
@@ -21,13 +30,40 @@ from flask import Response
 
 
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g
 
 from sqlalchemy import create_engine, text, bindparam
 
 from google.cloud import firestore
 
+from cache_bus import CREATE_TABLE as CACHE_VERSIONS_TABLE
+from cache_bus import CacheBus, MemoryVersionStore, SqlVersionStore
+from compression import register_compression
+from fragment_cache import init_fragment_cache
+from inventory import SoldOut, parse_stock, release_stock, reserve_stock, set_stock, short_lines
+from json_provider import FastJSONProvider
+from order_archive import CREATE_TABLES as ARCHIVE_TABLES
+from order_archive import INDEXES as ARCHIVE_INDEXES
+from order_archive import ORDER_SOURCES, archive_cutoff, archive_orders
+from order_export import gzip_chunks, iter_order_lines, write_order_csv
+from order_feed import OrderFeed, format_sse, order_cursor, parse_order_cursor
+from order_intake import IntakeWorker, OrderIntakeQueue, QueueFull
+from passwords import HasherBusy, PasswordHasher
+from recommendations import CREATE_TABLE as ITEM_PAIRS_TABLE
+from recommendations import CoOccurrenceIndex, load_pairs, rebuild_pairs, record_order_pairs
+from resilience import Resilience, Unavailable
+from review_cache import LatestReviewsCache
+from sales import CREATE_TABLES as SALES_TABLES
+from sales import RollupFlusher, apply_pending, create_pending_table, query_sales, queue_rollups, rebuild_rollups, utc_naive
+from queries import sql
+from rate_limit import InFlight, TokenBucketLimiter, parse_limits
+from menu_io import MenuImportError, diff_menu, iter_upload, normalise_row, write_csv
+from menu_search import MenuSearchIndex, rating_boosts
+from review_store import (
+    FirestoreReviewRepository, SqlReviewRepository, backfill_reviews_to_sql,
+    encode_cursor, make_review_repository,
+)
+
 _secret_cache = {}
 
 def get_secret(name: str) -> str | None:
@@ -63,6 +99,9 @@ db_fs = firestore.Client(database=FIRESTORE_DB)
 
 app = Flask(__name__)
 
+# orjson when available, handles Decimal / datetime / Row natively (json_provider.py)
+app.json = FastJSONProvider(app)
+
 
 
 app.secret_key = env_or_secret("SECRET_KEY", "SECRET_KEY", "dev-secret-change-me")
@@ -74,8 +113,196 @@ app.config.update(
     SESSION_COOKIE_SAMESITE="Lax",   # helps protect against CSRF
 )
 
+# ---- Optional write-behind order intake (see order_intake.py) ----
+app.config.update(
+    ORDER_INTAKE_ENABLED=os.environ.get("ORDER_INTAKE_ENABLED", "0") == "1",
+    ORDER_INTAKE_PATH=os.environ.get(
+        "ORDER_INTAKE_PATH", os.path.join(tempfile.gettempdir(), "order_intake.sqlite3")
+    ),
+    ORDER_INTAKE_MAX_PENDING=int(os.environ.get("ORDER_INTAKE_MAX_PENDING", "500")),
+    ORDER_INTAKE_BATCH_SIZE=int(os.environ.get("ORDER_INTAKE_BATCH_SIZE", "50")),
+    ORDER_INTAKE_WORKER=True,  # tests turn the background drainer off
+)
+
+# ---- Rate limiting / load shedding (see rate_limit.py) ----
+app.config.update(
+    # endpoint -> (methods, limits). Override with RATE_LIMIT_<ENDPOINT>, "" turns it off.
+    RATE_LIMITS={
+        "login": (("POST",), parse_limits(os.environ.get("RATE_LIMIT_LOGIN", "ip:20/60,user:5/60"))),
+        "register": (("POST",), parse_limits(os.environ.get("RATE_LIMIT_REGISTER", "ip:5/300"))),
+        "reviews": (("POST",), parse_limits(os.environ.get("RATE_LIMIT_REVIEWS", "ip:20/60,user:5/60"))),
+        "api_menu_search": (("GET",), parse_limits(os.environ.get("RATE_LIMIT_API_MENU_SEARCH", "ip:120/60"))),
+    },
+    # header the front end puts the real client address in. On App Engine
+    # remote_addr is the Google front end for every request, so without this
+    # all clients would share one "ip:" bucket. The GFE overwrites the header,
+    # so clients can't spoof it.
+    CLIENT_IP_HEADER=os.environ.get(
+        "CLIENT_IP_HEADER", "X-Appengine-User-Ip" if os.environ.get("GAE_ENV") else ""
+    ),
+    # elsewhere: proxies in front of us that append to X-Forwarded-For (0 = use the socket address)
+    TRUSTED_PROXY_COUNT=int(os.environ.get("TRUSTED_PROXY_COUNT", "0")),
+    # nice-to-have pages, refused first when this process already has
+    # SHED_MAX_INFLIGHT requests running (checkout, orders and auth are never shed)
+    SHED_ENDPOINTS=("stats", "api_stats", "api_reviews", "api_menu_search"),
+    SHED_MAX_INFLIGHT=int(os.environ.get("SHED_MAX_INFLIGHT", "0")),  # 0 = off
+)
+
+# ---- Sales rollups / item_pairs are applied in batches (see sales.py) ----
+app.config.update(
+    ROLLUP_FLUSH_SECONDS=float(os.environ.get("ROLLUP_FLUSH_SECONDS", "2")),
+    ROLLUP_FLUSH_BATCH=int(os.environ.get("ROLLUP_FLUSH_BATCH", "500")),
+    ROLLUP_WORKER=True,  # tests flush by hand
+)
+
+# ---- "Customers also ordered" (see recommendations.py) ----
+app.config.update(
+    RECS_TOP_K=int(os.environ.get("RECS_TOP_K", "5")),
+    RECS_MIN_SUPPORT=int(os.environ.get("RECS_MIN_SUPPORT", "2")),
+    # item_pairs is written by every instance; reload our copy this often
+    RECS_REFRESH_SECONDS=float(os.environ.get("RECS_REFRESH_SECONDS", "300")),
+)
+
+# ---- Order archival (see order_archive.py) ----
+app.config.update(
+    ORDER_ARCHIVE_AFTER_DAYS=int(os.environ.get("ORDER_ARCHIVE_AFTER_DAYS", "180")),
+    ORDER_ARCHIVE_BATCH_SIZE=int(os.environ.get("ORDER_ARCHIVE_BATCH_SIZE", "500")),
+    # the admin button runs this long at most, then says "run again"
+    ORDER_ARCHIVE_REQUEST_SECONDS=float(os.environ.get("ORDER_ARCHIVE_REQUEST_SECONDS", "20")),
+    # rows fetched per round trip by the streaming order export
+    ORDER_EXPORT_YIELD_PER=int(os.environ.get("ORDER_EXPORT_YIELD_PER", "1000")),
+)
+
+rate_limiter = TokenBucketLimiter()
+_inflight = InFlight()
+
+
+def client_ip() -> str:
+    header = app.config["CLIENT_IP_HEADER"]
+    if header and request.headers.get(header):
+        return request.headers[header].strip()
+    hops = app.config["TRUSTED_PROXY_COUNT"]
+    route = request.access_route
+    if hops and len(route) >= hops:
+        return route[-hops]
+    return request.remote_addr or "unknown"
+
+
+def _refuse(status: int, retry_after: float, message: str):
+    retry = max(1, math.ceil(retry_after))
+    if request.path.startswith("/api/"):
+        resp = jsonify({"error": message, "retry_after": retry})
+    else:
+        resp = Response(message + "\n", mimetype="text/plain")
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(retry)
+    return resp
+
+
+@app.before_request
+def guard_request_rate():
+    # registered before ensure_db_ready so refused requests cost no DB work
+    g.counted_inflight = True
+    _inflight.enter()
+
+    endpoint = request.endpoint
+    # neither App Engine nor gunicorn tells us how long a request queued, so
+    # the busy signal is how many requests this process is already running
+    max_inflight = app.config["SHED_MAX_INFLIGHT"]
+    if endpoint in app.config["SHED_ENDPOINTS"] and max_inflight and _inflight.count > max_inflight:
+        app.logger.warning("shedding %s (in flight %d)", endpoint, _inflight.count)
+        return _refuse(503, 5, "Server busy, please try again shortly.")
+
+    rule = app.config["RATE_LIMITS"].get(endpoint)
+    if not rule or request.method not in rule[0]:
+        return None
+
+    wait = 0.0
+    for limit in rule[1]:
+        if limit.scope == "ip":
+            who = client_ip()
+        else:
+            # logged-in user, or the account being logged into (slows password guessing)
+            who = ((current_user() or {}).get("username") or request.form.get("username", "")).strip().lower()
+            if not who:
+                continue
+        wait = max(wait, rate_limiter.hit(f"{endpoint}:{limit.scope}:{who}", limit))
+
+    if wait > 0:
+        app.logger.warning("rate limited %s for %s", endpoint, client_ip())
+        return _refuse(429, wait, "Too many requests, please slow down.")
+    return None
+
+
+@app.teardown_request
+def _release_inflight(exc=None):
+    if g.pop("counted_inflight", False):
+        _inflight.leave()
+
+
+# ---- Password hashing (see passwords.py) ----
+# hashes run in a small process pool so login storms don't hold the GIL;
+# PASSWORD_HASH_WORKERS=0 hashes inline
+password_hasher = PasswordHasher(
+    method=os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1"),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "2")),
+    max_queue=int(os.environ.get("PASSWORD_HASH_QUEUE", "16")),
+)
+
+
+# ---- Deadlines / circuit breakers for Firestore + Cloud Functions (see resilience.py) ----
+guard = Resilience(max_workers=int(os.environ.get("RESILIENCE_THREADS", "16")))
+_breaker = {
+    "failures": int(os.environ.get("BREAKER_FAILURES", "5")),
+    "reset_seconds": float(os.environ.get("BREAKER_RESET_SECONDS", "30")),
+}
+guard.policy("firestore.read", breaker="firestore",
+             timeout=float(os.environ.get("FIRESTORE_READ_TIMEOUT", "2.0")),
+             # 0 = off; e.g. 0.3 starts a second read when the first is slower than that
+             hedge_after=float(os.environ.get("FIRESTORE_HEDGE_AFTER", "0")), **_breaker)
+guard.policy("firestore.write", breaker="firestore",
+             timeout=float(os.environ.get("FIRESTORE_WRITE_TIMEOUT", "3.0")), **_breaker)
+guard.policy("functions.review_stats", breaker="functions", timeout=5.0, **_breaker)
+guard.policy("functions.export_reviews", breaker="functions", timeout=10.0, **_breaker)
+
+
+# ---- Review storage (see review_store.py) ----
+# REVIEW_STORE=firestore (default) | dual (Firestore + shadow writes to the
+# Cloud SQL reviews table, for the migration) | sql
+# getters, not objects: the engine is created lazily (and tests swap both)
+review_repo = make_review_repository(
+    os.environ.get("REVIEW_STORE", "firestore"),
+    lambda: db_fs,
+    lambda: get_engine(),
+    guard=guard.call,
+)
+
+# newest reviews kept in memory for the reviews/stats pages and /api/reviews
+review_feed = LatestReviewsCache(
+    lambda: review_repo,
+    depth=int(os.environ.get("REVIEW_CACHE_DEPTH", "100")),
+    item_depth=int(os.environ.get("REVIEW_CACHE_ITEM_DEPTH", "20")),
+    reconcile_seconds=float(os.environ.get("REVIEW_CACHE_RECONCILE_SECONDS", "30")),
+)
+
+
+def latest_reviews(limit: int, item_id: int | None = None, cursor: str | None = None) -> list[dict]:
+    """Newest reviews from the in-memory window, or the store when beyond it."""
+    if cursor is None:
+        cached = review_feed.latest(limit, item_id=item_id)
+        if cached is not None:
+            return cached
+    return review_repo.latest(limit, item_id=item_id, cursor=cursor)
+
 csrf = CSRFProtect(app)
 
+# gzip/br for HTML, JSON and CSV bodies (see compression.py)
+register_compression(app)
+
+# {% cache %} blocks + on-disk template bytecode (see fragment_cache.py)
+init_fragment_cache(app)
+app.jinja_env.fragment_cache_substitutions["csrf_token"] = generate_csrf
+
 
 # ---- DB / Engine ----
 _engine = None
@@ -123,18 +350,37 @@ def get_engine():
         f"&charset=utf8mb4"
     )
 
+    # sized by gunicorn.conf.py so workers x pool stays inside the Cloud SQL budget
+    pool_size = int(os.environ.get("DB_POOL_SIZE", "5"))
+    max_overflow = int(os.environ.get("DB_MAX_OVERFLOW", "2"))
+
     _engine = create_engine(
         uri,
         pool_pre_ping=True,
         pool_recycle=1800,
-        pool_size=5,
-        max_overflow=2,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
     )
+    app.logger.info("DB pool: pool_size=%s max_overflow=%s", pool_size, max_overflow)
     return _engine
 
 
 
 
+def _ensure_columns(conn, table: str, columns: dict):
+    """Adds any missing columns (name -> column DDL) to an existing table."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _ensure_index(conn, table: str, name: str, columns: str):
+    existing = {i["name"] for i in inspect(conn).get_indexes(table)}
+    if name not in existing:
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+
+
 def init_db():
     """
     Ensure required tables exist and seed starter data.
@@ -148,7 +394,42 @@ def init_db():
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 name VARCHAR(100) NOT NULL,
                 description VARCHAR(255) NOT NULL DEFAULT '',
-                price DECIMAL(10,2) NOT NULL
+                price DECIMAL(10,2) NOT NULL,
+                category VARCHAR(50) NOT NULL DEFAULT 'other',
+                image_url VARCHAR(500) NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                row_version BIGINT NOT NULL DEFAULT 0,
+                stock INT NULL,
+                INDEX idx_menu_items_row_version (row_version)
+            )
+        """))
+
+        # older databases were created before delta sync existed
+        _ensure_columns(conn, "menu_items", {
+            "category": "VARCHAR(50) NOT NULL DEFAULT 'other'",
+            "image_url": "VARCHAR(500) NULL",
+            "updated_at": "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP",
+            "row_version": "BIGINT NOT NULL DEFAULT 0",
+            # NULL = unlimited, see inventory.py
+            "stock": "INT NULL",
+        })
+        _ensure_index(conn, "menu_items", "idx_menu_items_row_version", "row_version")
+
+        # Menu delta sync: one global version counter + tombstones for deleted items
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS menu_version (
+                id TINYINT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        """))
+        conn.execute(text("INSERT IGNORE INTO menu_version (id, version) VALUES (1, 0)"))
+
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS menu_item_tombstones (
+                menu_item_id INT PRIMARY KEY,
+                row_version BIGINT NOT NULL,
+                deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_menu_tombstones_row_version (row_version)
             )
         """))
 
@@ -171,7 +452,9 @@ def init_db():
             status VARCHAR(20) NOT NULL DEFAULT 'pending',
             total_price DECIMAL(10,2) NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
             INDEX (user_id),
+            INDEX idx_orders_updated_at (updated_at),
             CONSTRAINT fk_orders_user FOREIGN KEY (user_id) REFERENCES users(id)
             )
         """))
@@ -189,8 +472,59 @@ def init_db():
             CONSTRAINT fk_items_menu FOREIGN KEY (menu_item_id) REFERENCES menu_items(id)
             )
         """))
+        # the order stream resumes from updated_at (see order_feed.py)
+        _ensure_columns(conn, "orders", {
+            "updated_at": "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP",
+        })
+        _ensure_index(conn, "orders", "idx_orders_updated_at", "updated_at")
 
 
+        # Checkout idempotency keys (expired rows swept by sweep_checkout_keys)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS checkout_keys (
+            idem_key VARCHAR(64) PRIMARY KEY,
+            user_id INT NOT NULL,
+            order_id INT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            INDEX idx_checkout_keys_expires (expires_at)
+            )
+        """))
+
+        # Reviews (used when REVIEW_STORE is sql or dual; fs_id links a row
+        # to the Firestore document it was copied from)
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS reviews (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            fs_id VARCHAR(64) NULL,
+            username VARCHAR(50) NOT NULL,
+            item_id INT NOT NULL,
+            rating TINYINT NOT NULL,
+            comment TEXT NOT NULL,
+            created_at DATETIME(6) NOT NULL,
+            UNIQUE KEY uq_reviews_fs_id (fs_id),
+            INDEX idx_reviews_item_created (item_id, created_at),
+            INDEX idx_reviews_created (created_at)
+            )
+        """))
+
+        # Sales rollups + the queue of order changes not yet applied to them (see sales.py)
+        for ddl in SALES_TABLES:
+            conn.execute(text(ddl))
+        create_pending_table(conn)
+
+        # Co-occurrence counts for "customers also ordered"
+        conn.execute(text(ITEM_PAIRS_TABLE))
+
+        # Shared cache versions (cross-instance invalidation, see cache_bus.py)
+        conn.execute(text(CACHE_VERSIONS_TABLE))
+
+        # Cold storage for finished orders + the indexes the hot queries need
+        for ddl in ARCHIVE_TABLES:
+            conn.execute(text(ddl))
+        for table, name, columns in ARCHIVE_INDEXES:
+            _ensure_index(conn, table, name, columns)
+
         # Seed menu if empty
         count = conn.execute(text("SELECT COUNT(*) FROM menu_items")).scalar()
         if int(count) == 0:
@@ -214,14 +548,64 @@ def init_db():
             if not existing:
                 conn.execute(
                     text("INSERT INTO users (username, password_hash, role) VALUES (:u, :ph, 'admin')"),
-                    {"u": admin_user, "ph": generate_password_hash(admin_pass)}
+                    {"u": admin_user, "ph": password_hasher.hash(admin_pass)}
                 )
 
 
+_db_ready = False
+
+
 @app.before_request
 def ensure_db_ready():
-    # Ensures DB tables exist before routes execute.
-    init_db()
+    # Ensures DB tables exist before routes execute (once per process,
+    # the schema checks are too heavy to repeat on every request).
+    global _db_ready
+    if not _db_ready:
+        init_db()
+        review_feed.seed()
+        start_rollup_flusher()
+        _db_ready = True
+
+
+# ---- Cache versions ----
+# Writers bump a namespace ("menu", "stats", "reviews", "orders", "recs")
+# whenever the underlying data changes; in-process caches remember the
+# version they were built from. Versions are shared through the
+# cache_versions table (CACHE_BUS=sql), so a write on one instance reaches
+# the others within CACHE_BUS_POLL_SECONDS (see cache_bus.py).
+cache_bus = CacheBus(
+    MemoryVersionStore() if os.environ.get("CACHE_BUS", "sql") == "memory" else SqlVersionStore(lambda: get_engine()),
+    poll_seconds=float(os.environ.get("CACHE_BUS_POLL_SECONDS", "2")),
+    defer_seconds=float(os.environ.get("CACHE_BUS_DEFER_SECONDS", "1")),
+)
+# menu/stats/recs caches are keyed on their version and need no hook;
+# these two hold data that isn't
+cache_bus.subscribe("reviews", lambda ns: review_feed.invalidate())
+cache_bus.subscribe("orders", lambda ns: order_feed.publish("sync", {}))   # open boards catch up from the DB
+
+
+def cache_version(ns: str) -> int:
+    return cache_bus.version(ns)
+
+
+def bump_cache_version(ns: str, defer: bool = False) -> int:
+    # defer=True for bumps on every checkout: the shared row then takes one
+    # write per CACHE_BUS_DEFER_SECONDS per process instead of one per order
+    return cache_bus.bump(ns, defer=defer)
+
+
+@app.before_request
+def poll_cache_bus():
+    # throttled to one SELECT per CACHE_BUS_POLL_SECONDS; pages that never read
+    # a version (e.g. /reviews) still need the subscribers to fire
+    cache_bus.maybe_poll()
+
+
+def fragment_epoch() -> int:
+    # item_stats is also written by the Cloud Function (and other instances),
+    # so cached fragments are additionally rolled every FRAGMENT_CACHE_TTL seconds
+    ttl = int(app.config.get("FRAGMENT_CACHE_TTL", 60))
+    return int(time.time() // ttl) if ttl > 0 else 0
 
 
 # ---- Auth helpers ----
@@ -249,15 +633,28 @@ from datetime import datetime, timezone
 
 from datetime import datetime, timezone
 
+# functions/purge_audit_logs archives + deletes logs past AUDIT_LOG_RETENTION_DAYS.
+# audit_logs also has a Firestore TTL policy on expires_at (see
+# firestore.indexes.json) as the backstop for when the purge doesn't run; it
+# fires AUDIT_LOG_TTL_MARGIN_DAYS later, or TTL would delete logs unarchived
+AUDIT_LOG_RETENTION_DAYS = int(os.environ.get("AUDIT_LOG_RETENTION_DAYS", "90"))
+AUDIT_LOG_TTL_MARGIN_DAYS = int(os.environ.get("AUDIT_LOG_TTL_MARGIN_DAYS", "7"))
+AUDIT_LOG_PAGE_SIZE = 50
+
+
 def log_event(event: str, username: str | None, ip: str | None = None, meta: dict | None = None):
     try:
-        db_fs.collection("audit_logs").add({
+        now = datetime.now(timezone.utc)
+        guard.call("firestore.write", lambda doc: db_fs.collection("audit_logs").add(doc), {
             "event": event,
             "username": username,          
             "ip": ip,
             "meta": meta or {},
-            "created_at": datetime.now(timezone.utc),
+            "created_at": now,
+            "expires_at": now + timedelta(days=AUDIT_LOG_RETENTION_DAYS + AUDIT_LOG_TTL_MARGIN_DAYS),
         })
+    except Unavailable as e:
+        app.logger.warning("Firestore audit log skipped (%s): %s", e, event)
     except Exception as e:
         # Log to App Engine logs, but don't crash the page
         app.logger.exception("Firestore audit log failed: %s", e)
@@ -305,18 +702,24 @@ def register():
 
     engine = get_engine()
     with engine.begin() as conn:
-        existing = conn.execute(
-            text("SELECT id FROM users WHERE username=:u"),
-            {"u": username}
-        ).fetchone()
-        if existing:
-            flash("That username is already taken.", "danger")
-            return redirect(url_for("register"))
+        existing = sql.execute(conn, "users.by_username", {"u": username}).fetchone()
+    if existing:
+        flash("That username is already taken.", "danger")
+        return redirect(url_for("register"))
 
-        conn.execute(
-            text("INSERT INTO users (username, password_hash, role) VALUES (:u, :ph, 'customer')"),
-            {"u": username, "ph": generate_password_hash(password)}
-        )
+    # hash without holding a pool connection
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy:
+        return _refuse(503, 2, "Server busy, please try again shortly.")
+
+    try:
+        with engine.begin() as conn:
+            sql.execute(conn, "users.insert", {"u": username, "ph": password_hash, "role": "customer"})
+    except IntegrityError:
+        # someone registered the same name in the meantime
+        flash("That username is already taken.", "danger")
+        return redirect(url_for("register"))
 
     flash("Account created. Please log in.", "success")
     return redirect(url_for("login"))
@@ -332,15 +735,26 @@ def login():
 
     engine = get_engine()
     with engine.begin() as conn:
-        row = conn.execute(
-            text("SELECT id, username, password_hash, role FROM users WHERE username=:u"),
-            {"u": username}
-        ).fetchone()
+        row = sql.execute(conn, "users.by_username", {"u": username}).fetchone()
 
-    if not row or not check_password_hash(row.password_hash, password):
+    try:
+        valid = bool(row) and password_hasher.verify(row.password_hash, password)
+    except HasherBusy:
+        return _refuse(503, 2, "Server busy, please try again shortly.")
+
+    if not valid:
         flash("Invalid username or password.", "danger")
         return redirect(url_for("login"))
 
+    # stored with an older method/cost -> upgrade now that we know the password
+    if password_hasher.needs_rehash(row.password_hash):
+        try:
+            new_hash = password_hasher.hash(password)
+            with engine.begin() as conn:
+                sql.execute(conn, "users.rehash", {"ph": new_hash, "id": row.id, "old": row.password_hash})
+        except HasherBusy:
+            pass  # try again on the next login
+
     # --- reset cart if a different user logs in on same browser session ---
     prev_owner = session.get("cart_owner")
     if prev_owner is not None and int(prev_owner) != int(row.id):
@@ -389,11 +803,7 @@ def reviews():
     # --- Load menu items from Cloud SQL (for dropdown + name lookup) ---
     engine = get_engine()
     with engine.begin() as conn:
-        rows = conn.execute(text("""
-            SELECT id, name
-            FROM menu_items
-            ORDER BY id ASC
-        """)).fetchall()
+        rows = sql.execute(conn, "menu.names").fetchall()
 
     menu_items = [{"id": r.id, "name": r.name} for r in rows]
 
@@ -422,22 +832,42 @@ def reviews():
         rating = max(1, min(5, rating))
         comment = request.form.get("comment", "").strip()
 
-        # Save in Firestore (NoSQL)
-        db_fs.collection("reviews").add({
+        # the form carries its own id: resubmitting after a timeout rewrites
+        # the same review document instead of adding a second one
+        review_key = (request.form.get("review_key") or "").strip()
+        if not _IDEMPOTENCY_KEY_RE.match(review_key):
+            review_key = uuid.uuid4().hex
+
+        # Save via the configured review store (Firestore and/or Cloud SQL)
+        review = {
             "username": user["username"],
             "item_id": int(item_id),     # ensure it's an int
             "rating": int(rating),       # ensure it's an int
             "comment": comment,
             "created_at": datetime.now(timezone.utc),
-})
+        }
+        try:
+            review_id = review_repo.add(review, review_key)
+        except Unavailable:
+            # the write may still land; keep the form (and its key) so "submit" again is safe
+            flash("Reviews are temporarily unavailable, please try again in a minute.", "danger")
+            return render_template(
+                "reviews.html", user=user, menu_items=menu_items, reviews=[], review_key=review_key,
+                form={"item_id": item_id, "rating": rating, "comment": comment},
+            ), 503
+        # same shape as the store's rows (the SQL store joins the item name)
+        item_name = next(m["name"] for m in menu_items if m["id"] == item_id)
+        review_feed.record({**review, "id": review_id, "item_name": item_name})
 
 # Call internal stats function (HTTP Cloud Function)
         try:
             url = os.environ.get("REVIEW_STATS_URL")
             token = env_or_secret("INTERNAL_TOKEN", "INTERNAL_TOKEN")
 
-            if url and token:
-                requests.post(
+            # the SQL store aggregates on read, item_stats is Firestore-only
+            if url and token and review_repo.uses_stats_function:
+                guard.call(
+            "functions.review_stats", requests.post,
             url,
             json={"item_id": int(item_id), "rating": int(rating)},
             headers={"X-Internal-Token": token},
@@ -446,6 +876,10 @@ def reviews():
         except Exception as e:
     # optional: print(e) or log it
             pass
+
+        # ratings moved -> anything built from item_stats is stale
+        bump_cache_version("stats")
+        bump_cache_version("reviews")
         
         
 
@@ -461,53 +895,103 @@ def reviews():
         return redirect(url_for("reviews"))
 
     # --- GET: show latest 20 reviews ---
-    docs = (
-        db_fs.collection("reviews")
-        .order_by("created_at", direction=firestore.Query.DESCENDING)
-        .limit(20)
-        .stream()
-    )
-
-    review_list = []
-    for d in docs:
-        data = d.to_dict() or {}
-        data["id"] = d.id
-        review_list.append(data)
+    try:
+        review_list = latest_reviews(20)
+    except Unavailable:
+        flash("Reviews are temporarily unavailable.", "warning")
+        review_list = []
 
     # Pass menu items to template for dropdown
-    return render_template("reviews.html", user=user, menu_items=menu_items, reviews=review_list)
+    return render_template("reviews.html", user=user, menu_items=menu_items, reviews=review_list,
+                           review_key=uuid.uuid4().hex, form={})
 
 
+def is_document_id(value: str) -> bool:
+    """A string Firestore accepts as a document id (no '/', not '.'/'..', not __x__, <= 1500 bytes)."""
+    return (bool(value) and "/" not in value and value not in (".", "..")
+            and not (value.startswith("__") and value.endswith("__"))
+            and len(value.encode()) <= 1500)
+
 
 @app.route("/admin/logs")
 @admin_required
 def admin_logs():
-    docs = (
-        db_fs.collection("audit_logs")
-        .order_by("created_at", direction=firestore.Query.DESCENDING)
-        .limit(50)
-        .stream()
-    )
+    """
+    Audit log browser, newest first.
+    Query params (all optional):
+      - event, username: exact match
+      - from, to (YYYY-MM-DD, UTC, inclusive)
+      - cursor: id of the last log on the previous page
+    Each filter combination is served by a composite index in firestore.indexes.json.
+    """
+    filters = {k: (request.args.get(k) or "").strip() for k in ("event", "username", "from", "to")}
+
+    q = db_fs.collection("audit_logs")
+    if filters["event"]:
+        q = q.where("event", "==", filters["event"])
+    if filters["username"]:
+        q = q.where("username", "==", filters["username"])
+
+    for key in ("from", "to"):
+        if not filters[key]:
+            continue
+        try:
+            day = datetime.strptime(filters[key], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        except ValueError:
+            flash(f"Ignoring invalid '{key}' date (use YYYY-MM-DD).", "warning")
+            filters[key] = ""
+            continue
+        if key == "from":
+            q = q.where("created_at", ">=", day)
+        else:
+            q = q.where("created_at", "<", day + timedelta(days=1))
+
+    q = q.order_by("created_at", direction=firestore.Query.DESCENDING)
+
+    cursor = request.args.get("cursor")
+    if cursor and not is_document_id(cursor):
+        # the client would raise on it before any request is made
+        flash("Ignoring invalid cursor.", "warning")
+        cursor = None
+    if cursor:
+        # resume after the last doc of the previous page (one extra read, no offset scans)
+        try:
+            snap = guard.call("firestore.read", db_fs.collection("audit_logs").document(cursor).get)
+        except Unavailable:
+            snap = None
+        if snap is not None and snap.exists:
+            q = q.start_after(snap)
+
+    # one extra row tells us whether there is a next page
+    try:
+        docs = guard.call("firestore.read", lambda: list(q.limit(AUDIT_LOG_PAGE_SIZE + 1).stream()))
+    except Unavailable:
+        flash("Audit logs are temporarily unavailable.", "danger")
+        docs = []
+    next_cursor = docs[AUDIT_LOG_PAGE_SIZE - 1].id if len(docs) > AUDIT_LOG_PAGE_SIZE else None
 
     logs = []
-    for d in docs:
+    for d in docs[:AUDIT_LOG_PAGE_SIZE]:
         data = d.to_dict() or {}
         data["id"] = d.id
         logs.append(data)
 
-    return render_template("admin_logs.html", logs=logs, user=current_user())
+    return render_template(
+        "admin_logs.html",
+        logs=logs,
+        filters=filters,
+        next_cursor=next_cursor,
+        paged=bool(cursor),
+        user=current_user(),
+    )
 
 
 
-@app.route("/menu")
-def menu():
+def load_menu_items():
+    """Menu rows + Firestore rating stats, as rendered by menu.html."""
     engine = get_engine()
     with engine.begin() as conn:
-        rows = conn.execute(text("""
-            SELECT id, name, description, price, category, image_url
-            FROM menu_items
-            ORDER BY category ASC, id ASC
-        """)).fetchall()
+        rows = sql.execute(conn, "menu.all").fetchall()
 
     menu_items = [
         {
@@ -517,109 +1001,107 @@ def menu():
             "price": float(r.price),
             "category": r.category,
             "image_url": r.image_url,
+            "sold_out": r.stock is not None and r.stock <= 0,
         }
         for r in rows
     ]
 
-    # --- Pull rating stats from Firestore (item_stats/{item_id}) ---
+    recs = recommendation_index()
     for m in menu_items:
-        try:
-            doc = db_fs.collection("item_stats").document(str(m["id"])).get()
-            if doc.exists:
-                s = doc.to_dict() or {}
-                m["avg_rating"] = s.get("avg_rating")
-                m["review_count"] = int(s.get("review_count", 0))
-            else:
-                m["avg_rating"] = None
-                m["review_count"] = 0
-        except Exception:
-            m["avg_rating"] = None
-            m["review_count"] = 0
+        m["also_ordered"] = recs.for_item(m["id"])
 
-    return render_template("menu.html", menu=menu_items, user=current_user())
+    # --- Pull rating stats from the review store ---
+    try:
+        stats = review_repo.item_stats([m["id"] for m in menu_items])
+    except Exception as e:
+        app.logger.warning("menu: review stats unavailable (%s)", e)
+        stats = {}
+    for m in menu_items:
+        s = stats.get(m["id"])
+        m["avg_rating"] = s["avg_rating"] if s else None
+        m["review_count"] = s["review_count"] if s else 0
 
+    return menu_items
 
-from sqlalchemy import bindparam  
 
-@app.route("/stats")
-def stats():
-    # 1) Read top rated item stats from Firestore
-    docs = (
-        db_fs.collection("item_stats")
-        .order_by("avg_rating", direction=firestore.Query.DESCENDING)
-        .limit(10)
-        .stream()
+@app.route("/menu")
+def menu():
+    # the item cards are fragment-cached on (menu, stats) version; on a hit
+    # the template never calls load_menu, so no SQL/Firestore work happens
+    return render_template(
+        "menu.html",
+        load_menu=load_menu_items,
+        menu_version=cache_version("menu"),
+        stats_version=cache_version("stats"),
+        recs_version=recommendation_index().version,
+        fragment_epoch=fragment_epoch(),
+        user=current_user(),
     )
 
-    stats_list = []
-    item_ids = []
-    for d in docs:
-        data = d.to_dict() or {}
-        data["item_id"] = d.id
-        stats_list.append(data)
-        try:
-            item_ids.append(int(d.id))
-        except Exception:
-            pass
 
-    # 2) Map item_id -> menu item info from Cloud SQL
+from sqlalchemy import bindparam  
+
+def load_stats_tables():
+    """(top_items, latest_reviews) for the dashboard tables."""
+    # 1) Top rated items + latest reviews from the review store
+    # (the SQL store joins names in; Firestore only has item ids)
+    # (falls back to the last good answer / empty tables when Firestore is down)
+    try:
+        top_items = review_repo.top_rated(10)
+    except Unavailable as e:
+        app.logger.warning("stats: top rated unavailable (%s)", e)
+        top_items = []
+    try:
+        recent = latest_reviews(10)
+    except Unavailable as e:
+        app.logger.warning("stats: latest reviews unavailable (%s)", e)
+        recent = []
+
+    # 2) Map item_id -> menu item info from Cloud SQL, for whatever is missing
+    item_ids = {t["item_id"] for t in top_items if "name" not in t}
+    for r in recent:
+        if "item_name" not in r:
+            try:
+                item_ids.add(int(r.get("item_id")))
+            except (TypeError, ValueError):
+                pass
+
     menu_lookup = {}
     if item_ids:
         engine = get_engine()
 
-        stmt = text("""
-            SELECT id, name, price
-            FROM menu_items
-            WHERE id IN :ids
-        """).bindparams(bindparam("ids", expanding=True))
-
         with engine.begin() as conn:
-            rows = conn.execute(stmt, {"ids": item_ids}).fetchall()
+            rows = sql.execute(conn, "menu.by_ids", {"ids": sorted(item_ids)}).fetchall()
 
         menu_lookup = {r.id: {"name": r.name, "price": float(r.price)} for r in rows}
 
     # 3) Merge into a display-friendly list
-    top_items = []
-    for s in stats_list:
-        try:
-            iid = int(s.get("item_id"))
-        except Exception:
-            continue
-
-        mi = menu_lookup.get(iid, {"name": f"Item {iid}", "price": None})
-        top_items.append({
-            "item_id": iid,
-            "name": mi["name"],
-            "price": mi["price"],
-            "avg_rating": s.get("avg_rating", 0),
-            "review_count": s.get("review_count", 0),
-        })
-
-    # 4) Latest reviews
-    rdocs = (
-        db_fs.collection("reviews")
-        .order_by("created_at", direction=firestore.Query.DESCENDING)
-        .limit(10)
-        .stream()
-    )
+    for t in top_items:
+        if "name" not in t:
+            mi = menu_lookup.get(t["item_id"], {"name": f"Item {t['item_id']}", "price": None})
+            t.update(name=mi["name"], price=mi["price"])
 
-    latest_reviews = []
-    for d in rdocs:
-        data = d.to_dict() or {}
-        data["id"] = d.id
-        iid = data.get("item_id")
+    for data in recent:
+        if data.get("item_name"):
+            continue
         try:
-            iid_int = int(iid)
+            iid_int = int(data.get("item_id"))
             data["item_name"] = menu_lookup.get(iid_int, {}).get("name", f"Item {iid_int}")
         except Exception:
             data["item_name"] = "Unknown"
-        latest_reviews.append(data)
 
+    return top_items, recent
+
+
+@app.route("/stats")
+def stats():
     return render_template(
         "stats.html",
         user=current_user(),
-        top_items=top_items,
-        latest_reviews=latest_reviews
+        load_stats=load_stats_tables,
+        menu_version=cache_version("menu"),
+        stats_version=cache_version("stats"),
+        fragment_epoch=fragment_epoch(),
     )
 
 
@@ -640,14 +1122,8 @@ def cart():
     if cart_map:
         item_ids = [int(k) for k in cart_map.keys()]
 
-        stmt = text("""
-            SELECT id, name, price
-            FROM menu_items
-            WHERE id IN :ids
-        """).bindparams(bindparam("ids", expanding=True))
-
         with engine.begin() as conn:
-            rows = conn.execute(stmt, {"ids": item_ids}).fetchall()
+            rows = sql.execute(conn, "menu.by_ids", {"ids": item_ids}).fetchall()
 
         price_lookup = {r.id: Decimal(str(r.price)) for r in rows}
         name_lookup = {r.id: r.name for r in rows}
@@ -667,7 +1143,9 @@ def cart():
                 "line_total": float(line_total),
             })
 
-    return render_template("cart.html", cart_items=cart_items, total=float(total), user=current_user())
+    suggestions = recommendation_index().suggest([row["id"] for row in cart_items]) if cart_items else []
+    return render_template("cart.html", cart_items=cart_items, total=float(total),
+                           suggestions=suggestions, user=current_user())
 
 
 @app.route("/cart/add/<int:item_id>", methods=["POST"])
@@ -685,7 +1163,12 @@ def cart_remove(item_id):
     session.modified = True
     return redirect(url_for("cart"))
 
-def cart_lines_from_session():
+# last name/price/stock seen per menu item, so intake can still price a cart
+# it has shown before while Cloud SQL is unreachable (the drain re-checks)
+_known_items = {}
+
+
+def cart_lines_from_session(allow_stale: bool = False):
     cart_map = get_cart()  # {item_id: qty}
     if not cart_map:
         return [], Decimal("0.00")
@@ -693,16 +1176,16 @@ def cart_lines_from_session():
     item_ids = [int(k) for k in cart_map.keys()]
     engine = get_engine()
 
-    with engine.begin() as conn:
-        stmt = text("""
-            SELECT id, name, price
-            FROM menu_items
-            WHERE id IN :ids
-        """).bindparams(bindparam("ids", expanding=True))
-
-        rows = conn.execute(stmt, {"ids": item_ids}).fetchall()
-
-    lookup = {r.id: {"name": r.name, "price": Decimal(str(r.price))} for r in rows}
+    try:
+        with engine.begin() as conn:
+            rows = sql.execute(conn, "menu.by_ids", {"ids": item_ids}).fetchall()
+    except OperationalError:
+        if not allow_stale or any(i not in _known_items for i in item_ids):
+            raise
+        lookup = {i: _known_items[i] for i in item_ids}
+    else:
+        lookup = {r.id: {"name": r.name, "price": Decimal(str(r.price)), "stock": r.stock} for r in rows}
+        _known_items.update(lookup)
 
     lines = []
     total = Decimal("0.00")
@@ -720,6 +1203,8 @@ def cart_lines_from_session():
             "qty": qty,
             "unit_price": float(info["price"]),
             "line_total": float(line_total),
+            # only limited items go through the stock decrement at checkout
+            "limited": info["stock"] is not None,
         })
 
     return lines, total
@@ -740,28 +1225,13 @@ def admin_orders():
     engine = get_engine()
 
     with engine.begin() as conn:
-        orders = conn.execute(text("""
-            SELECT o.id, o.status, o.total_price, o.created_at, u.username
-            FROM orders o
-            JOIN users u ON u.id = o.user_id
-            ORDER BY o.created_at DESC
-            LIMIT 100
-        """)).fetchall()
+        orders = sql.execute(conn, "orders.recent", {"limit": 100}).fetchall()
 
         order_ids = [o.id for o in orders]
 
         items = []
         if order_ids:
-            # expanding=True makes "IN (:oids)" work on SQLite + MySQL
-            stmt = text("""
-                SELECT oi.order_id, oi.qty, oi.unit_price, mi.name
-                FROM order_items oi
-                JOIN menu_items mi ON mi.id = oi.menu_item_id
-                WHERE oi.order_id IN :oids
-                ORDER BY oi.order_id DESC, mi.name ASC
-            """).bindparams(bindparam("oids", expanding=True))
-
-            items = conn.execute(stmt, {"oids": order_ids}).fetchall()
+            items = sql.execute(conn, "order_lines", {"oids": order_ids}).fetchall()
 
     items_by_order = {}
     for it in items:
@@ -775,25 +1245,241 @@ def admin_orders():
         "admin_orders.html",
         user=current_user(),
         orders=orders,
-        items_by_order=items_by_order
+        items_by_order=items_by_order,
+        feed_cursor=orders_cursor(),
     )
 
 
+# ---- Live order feed (SSE) ----
+# One in-process feed per worker; checkout/status changes publish to it and
+# every open /admin/orders board streams from it (no per-client DB polling).
+# Browsers resume from an orders.updated_at cursor, not the feed's ids, so a
+# reconnect may land on any worker of any instance (see order_feed.py).
+order_feed = OrderFeed(maxlen=500)
+# each open stream holds a gthread thread for up to SSE_MAX_STREAM_SECONDS
+_streams = InFlight()
+
+
+def orders_cursor() -> str:
+    with get_engine().begin() as conn:
+        latest = sql.execute(conn, "orders.cursor").scalar()
+    return order_cursor(latest or datetime(2000, 1, 1))
+
+
+def orders_changed_since(since: str, limit: int):
+    """
+    (events, cursor) for the orders written at or after `since`, as the
+    order_created + order_status pairs the board already applies (both are
+    idempotent on the page). None when more than `limit` changed: the board
+    reloads instead.
+    """
+    with get_engine().begin() as conn:
+        rows = sql.execute(conn, "orders.changed_since", {"since": since, "limit": limit + 1}).fetchall()
+        if len(rows) > limit:
+            return None
+        lines = sql.execute(conn, "order_lines", {"oids": [r.id for r in rows]}).fetchall() if rows else []
+
+    items = {}
+    for ln in lines:
+        items.setdefault(ln.order_id, []).append(
+            {"name": ln.name, "qty": int(ln.qty), "unit_price": float(ln.unit_price)})
+    events = []
+    for r in rows:
+        events.append(("order_created", {
+            "id": int(r.id), "username": r.username, "status": r.status,
+            "total_price": float(r.total_price), "created_at": r.created_at,
+            "items": items.get(r.id, []),
+        }))
+        events.append(("order_status", {"id": int(r.id), "status": r.status}))
+    return events, (order_cursor(rows[-1].updated_at) if rows else None)
+
+
+def _stream_catch_up(cursor: str, grace: float, limit: int):
+    """Yields what changed since `cursor`, then the new cursor as the event id; returns it (None: reload)."""
+    found = orders_changed_since(parse_order_cursor(cursor, grace), limit)
+    if found is None:
+        yield format_sse(None, "reset", {})
+        return None
+    events, moved = found
+    for etype, data in events:
+        yield format_sse(None, etype, data)
+    cursor = moved or cursor
+    yield f"id: {cursor}\n\n"          # no data: only moves Last-Event-ID
+    return cursor
+
+
+@app.route("/admin/orders/stream")
+@admin_required
+def admin_orders_stream():
+    raw = (request.headers.get("Last-Event-ID") or request.args.get("last_id") or "").strip()
+    resuming = bool(raw)
+    if resuming and parse_order_cursor(raw) is None:
+        # a per-process id from before cursors: nothing to resume from
+        return Response("retry: 3000\n\n" + format_sse(None, "reset", {}), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+
+    if not _streams.try_enter(int(app.config.get("SSE_MAX_STREAMS", 2))):
+        # an error status would stop EventSource for good; a 200 with a long
+        # retry makes it come back later, when a slot may be free
+        app.logger.warning("order stream refused, %d open", _streams.count)
+        return Response("retry: 30000\n\n" + format_sse(None, "busy", {}), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+
+    # App Engine cuts long requests, and each open stream holds a worker
+    # thread, so streams end after a while and EventSource reconnects
+    max_seconds = float(app.config.get("SSE_MAX_STREAM_SECONDS", 300))
+    heartbeat = float(app.config.get("SSE_HEARTBEAT_SECONDS", 15))
+    # a row stamped earlier can commit after one we already streamed
+    grace = float(app.config.get("SSE_RESUME_GRACE_SECONDS", 5))
+    limit = int(app.config.get("SSE_RESUME_LIMIT", 100))
+    cursor = raw or orders_cursor()
+    released = []
+
+    def release():
+        # from the generator when it ends, or from close() if it never started
+        if not released:
+            released.append(True)
+            _streams.leave()
+
+    def generate():
+        try:
+            yield from stream()
+        finally:
+            release()
+
+    def stream():
+        nonlocal cursor
+        deadline = time.monotonic() + max_seconds
+        yield "retry: 3000\n\n"
+
+        # taken before any query, so what commits meanwhile is both queried
+        # and in the feed (the board ignores repeats)
+        pos = order_feed.last_id
+        if resuming:
+            cursor = yield from _stream_catch_up(cursor, grace, limit)
+            if cursor is None:
+                return
+        wrote = time.monotonic()
+        while True:
+            events, sync = order_feed.since(pos)
+            for eid, etype, data in events:
+                pos = eid
+                if etype == "sync":
+                    sync = True          # another process changed orders
+                    continue
+                yield format_sse(None, etype, data)
+                wrote = time.monotonic()
+
+            remaining = deadline - time.monotonic()
+            if sync or remaining <= 0:
+                # the closing catch-up leaves the browser a cursor past what it was sent
+                cursor = yield from _stream_catch_up(cursor, grace, limit)
+                if cursor is None or remaining <= 0:
+                    return
+                wrote = time.monotonic()
+            elif time.monotonic() - wrote >= heartbeat:
+                yield ": keepalive\n\n"
+                wrote = time.monotonic()
+
+            # orders taken on other instances only reach this feed through the
+            # bus subscriber, and no request runs poll_cache_bus while we wait
+            cache_bus.maybe_poll()
+            order_feed.wait(pos, timeout=min(heartbeat, cache_bus.poll_seconds, max(0.0, remaining)))
+
+    resp = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    resp.call_on_close(release)
+    return resp
+
+
+# Allowed status moves, for single and bulk changes alike. Finished orders
+# stay finished; "preparing" can go back to "pending" if it was marked by mistake.
+ORDER_TRANSITIONS = {
+    "pending": {"preparing", "completed", "cancelled"},
+    "preparing": {"pending", "completed", "cancelled"},
+    "completed": set(),
+    "cancelled": set(),
+}
+
+
+def move_orders(conn, order_ids, new_status):
+    """
+    Moves orders to new_status inside the caller's transaction, following
+    ORDER_TRANSITIONS. Returns (moved, rejected, restocked): the ids that
+    really changed (only those get published, logged and rolled up),
+    [{"id", "from", "reason"}] for the rest, and the items a cancellation
+    brought back into stock.
+    """
+    from_statuses = sorted(s for s, targets in ORDER_TRANSITIONS.items() if new_status in targets)
+    current = {r.id: r.status for r in sql.execute(conn, "orders.statuses", {"ids": order_ids})}
+
+    rejected, movable = [], []
+    for oid in order_ids:
+        cur = current.get(oid)
+        if cur is None:
+            rejected.append({"id": oid, "from": None, "reason": "not found"})
+        elif cur == new_status:
+            rejected.append({"id": oid, "from": cur, "reason": "unchanged"})
+        elif cur not in from_statuses:
+            rejected.append({"id": oid, "from": cur, "reason": f"cannot move {cur} -> {new_status}"})
+        else:
+            movable.append(oid)
+    if not movable:
+        return [], rejected, []
+
+    # status guard repeated in the WHERE so a concurrent change can't be overwritten
+    res = sql.execute(conn, "orders.move_status",
+                      {"s": new_status, "ids": movable, "from_statuses": from_statuses})
+    moved = movable
+    if res.rowcount != len(movable):
+        # the rows are locked by orders.statuses, so this needs a writer that
+        # skipped the lock; count only what now has the new status
+        app.logger.warning("order move to %s matched %d of %d rows", new_status, res.rowcount, len(movable))
+        after = {r.id: r.status for r in sql.execute(conn, "orders.statuses", {"ids": movable})}
+        moved = [oid for oid in movable if after.get(oid) == new_status]
+        rejected += [{"id": oid, "from": after.get(oid), "reason": "changed meanwhile"}
+                     for oid in movable if after.get(oid) != new_status]
+
+    restocked = []
+    if new_status == "cancelled" and moved:
+        # cancelled orders don't count as sales, and give their stock back
+        queue_rollups(conn, moved, -1)
+        restocked = release_stock(conn, moved)
+        if restocked:
+            # back from zero: delta clients must see them again, like mark_sold_out
+            touch_menu_items(conn, restocked)
+    return moved, rejected, restocked
+
+
+def _published_moves(moved, new_status, restocked):
+    if restocked:
+        bump_cache_version("menu")
+    for oid in moved:
+        order_feed.publish("order_status", {"id": oid, "status": new_status})
+    if moved:
+        bump_cache_version("orders")
+
+
 @app.route("/admin/orders/<int:order_id>/status", methods=["POST"])
 @admin_required
 def admin_update_order_status(order_id):
     new_status = (request.form.get("status") or "").strip().lower()
-    allowed = {"pending", "preparing", "completed", "cancelled"}
-    if new_status not in allowed:
+    if new_status not in ORDER_TRANSITIONS:
         flash("Invalid status.", "danger")
         return redirect(url_for("admin_orders"))
 
     engine = get_engine()
     with engine.begin() as conn:
-        conn.execute(
-            text("UPDATE orders SET status=:s WHERE id=:oid"),
-            {"s": new_status, "oid": int(order_id)}
-        )
+        moved, rejected, restocked = move_orders(conn, [int(order_id)], new_status)
+    _published_moves(moved, new_status, restocked)
+
+    if not moved:
+        reason = rejected[0]["reason"]
+        flash(f"Order #{order_id} not updated ({reason}).", "info" if reason == "unchanged" else "warning")
+        return redirect(url_for("admin_orders"))
 
     user = current_user()
     log_event("order_status_updated", user.get("username"), request.remote_addr, {"order_id": int(order_id), "status": new_status})
@@ -801,15 +1487,80 @@ def admin_update_order_status(order_id):
     return redirect(url_for("admin_orders"))
 
 
+@app.route("/admin/orders/status", methods=["POST"])
+@admin_required
+def admin_bulk_update_order_status():
+    """
+    Bulk status change for the orders board.
+    JSON body: {"order_ids": [1, 2, ...], "status": "preparing"}
+    Returns {"status", "updated": [ids], "rejected": [{"id", "from", "reason"}]}.
+    """
+    payload = request.get_json(silent=True) or {}
+    new_status = str(payload.get("status") or "").strip().lower()
+    if new_status not in ORDER_TRANSITIONS:
+        return jsonify({"error": "invalid status"}), 400
+
+    raw_ids = payload.get("order_ids")
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return jsonify({"error": "order_ids must be a non-empty list"}), 400
+    try:
+        order_ids = sorted({int(i) for i in raw_ids})
+    except (TypeError, ValueError):
+        return jsonify({"error": "order_ids must be integers"}), 400
+    if len(order_ids) > 500:
+        return jsonify({"error": "too many orders (max 500)"}), 400
+
+    engine = get_engine()
+    with engine.begin() as conn:
+        moved, rejected, restocked = move_orders(conn, order_ids, new_status)
+    _published_moves(moved, new_status, restocked)
+
+    user = current_user()
+    if moved:
+        log_event(
+            "order_status_bulk_updated",
+            user.get("username"),
+            request.remote_addr,
+            {"order_ids": moved, "status": new_status, "rejected": len(rejected)},
+        )
+
+    return jsonify({"status": new_status, "updated": moved, "rejected": rejected})
+
+
 from flask import Response
 from datetime import datetime, timezone
 import requests
 import os
 
+REVIEW_EXPORT_LIMIT = 200
+REVIEW_EXPORT_COLUMNS = ["id", "username", "item_id", "rating", "comment", "created_at"]
+
+
+def reviews_csv(reviews) -> str:
+    """Same columns as the export_reviews function, for REVIEW_STORE=sql."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(REVIEW_EXPORT_COLUMNS)
+    for r in reviews:
+        ts = r.get("created_at")
+        writer.writerow([r.get("id", ""), r.get("username", ""), r.get("item_id", ""), r.get("rating", ""),
+                         r.get("comment", ""), ts.isoformat() if hasattr(ts, "isoformat") else ""])
+    return out.getvalue()
+
+
 @app.route("/admin/export-reviews")
 @admin_required
 def admin_export_reviews():
     # Calls the Gen2 HTTP Cloud Function and streams CSV back to the browser
+    filename = f"reviews_export_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
+    if review_repo.name == "sql":
+        # the function reads Firestore, which stopped getting reviews
+        return Response(
+            reviews_csv(review_repo.latest(REVIEW_EXPORT_LIMIT)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
     url = os.environ.get("EXPORT_REVIEWS_URL")
     token = env_or_secret("INTERNAL_TOKEN", "INTERNAL_TOKEN")
 
@@ -818,8 +1569,9 @@ def admin_export_reviews():
         return redirect(url_for("admin"))
 
     try:
-        resp = requests.get(
-            f"{url}?format=csv&limit=200",
+        resp = guard.call(
+            "functions.export_reviews", requests.get,
+            f"{url}?format=csv&limit={REVIEW_EXPORT_LIMIT}",
             headers={"X-Internal-Token": token},
             timeout=10,
         )
@@ -831,7 +1583,6 @@ def admin_export_reviews():
         flash(f"Export failed (status {resp.status_code}).", "danger")
         return redirect(url_for("admin"))
 
-    filename = f"reviews_export_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv"
     return Response(
         resp.content,
         mimetype="text/csv",
@@ -840,18 +1591,511 @@ def admin_export_reviews():
 
 
 
+# ---- Sales analytics (rollups, see sales.py) ----
+SALES_MAX_DAYS = {"hour": 31, "day": 366, "item": 366}
+
+
+@app.route("/api/sales")
+@admin_required
+def api_sales():
+    """
+    Revenue from the rollup tables only (never scans orders).
+    Query params:
+      - from, to (YYYY-MM-DD, UTC, inclusive): default the last 30 days
+      - group: day (default) | hour | item
+    """
+    group = (request.args.get("group") or "day").lower()
+    if group not in SALES_MAX_DAYS:
+        return jsonify({"error": "group must be day, hour or item"}), 400
+
+    today = datetime.now(timezone.utc).date()
+    try:
+        end = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else today
+        start = (datetime.strptime(request.args["from"], "%Y-%m-%d").date()
+                 if request.args.get("from") else end - timedelta(days=29))
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"error": "from is after to"}), 400
+    if (end - start).days + 1 > SALES_MAX_DAYS[group]:
+        return jsonify({"error": f"range too long for group={group} (max {SALES_MAX_DAYS[group]} days)"}), 400
+
+    # read-only: the rollups as the background flush left them, plus how
+    # many order changes it hasn't applied yet (no write locks on this path)
+    engine = get_engine()
+    with engine.connect() as conn:
+        rows = query_sales(conn, start, end, group)
+        backlog = sql.execute(conn, "rollup_pending.backlog").one()
+
+    totals = {"revenue": round(sum(r["revenue"] for r in rows), 2)}
+    if group == "item":
+        totals["qty"] = sum(r["qty"] for r in rows)
+    else:
+        totals["orders"] = sum(r["orders"] for r in rows)
+        totals["items"] = sum(r["items"] for r in rows)
+
+    return jsonify({"from": start.isoformat(), "to": end.isoformat(), "group": group,
+                    "rows": rows, "totals": totals,
+                    "pending": {"changes": int(backlog.changes or 0), "oldest_id": backlog.oldest_id}})
+
+
+_rollups = {"worker": None}
+_rollups_lock = threading.Lock()
+
+
+def flush_rollups(limit: int | None = None) -> int:
+    """Applies one batch of pending order changes to the rollups and item_pairs. Returns rows applied."""
+    with get_engine().begin() as conn:
+        done = apply_pending(conn, limit or app.config["ROLLUP_FLUSH_BATCH"], ORDER_SOURCES)
+        record_order_pairs(conn, done["baskets"])
+    return done["rows"]
+
+
+def start_rollup_flusher():
+    """Background flush every ROLLUP_FLUSH_SECONDS; started with the first request."""
+    if _rollups["worker"] is not None or not app.config["ROLLUP_WORKER"]:
+        return
+    with _rollups_lock:
+        if _rollups["worker"] is None:
+            worker = RollupFlusher(flush_rollups, interval=app.config["ROLLUP_FLUSH_SECONDS"],
+                                   batch_size=app.config["ROLLUP_FLUSH_BATCH"], logger=app.logger)
+            worker.start()
+            _rollups["worker"] = worker
+
+
+@app.cli.command("flush-rollups")
+def flush_rollups_command():
+    """Apply every pending order change to the rollups now: flask --app main flush-rollups"""
+    init_db()
+    total = 0
+    while True:
+        n = flush_rollups()
+        total += n
+        if n < app.config["ROLLUP_FLUSH_BATCH"]:
+            break
+    print(f"applied {total} pending order changes")
+
+
+@app.cli.command("rebuild-sales")
+def rebuild_sales_command():
+    """Recompute the sales rollups from order history: flask --app main rebuild-sales"""
+    init_db()
+    started = time.monotonic()
+    with get_engine().begin() as conn:
+        summary = rebuild_rollups(conn, sources=ORDER_SOURCES)
+    print(f"sales rollups rebuilt from {summary['orders']} orders in {time.monotonic() - started:.1f}s")
+
+
+# ---- Metrics ----
+sql.slow_ms = float(os.environ.get("SLOW_QUERY_MS", "200"))
+
+
+@app.route("/admin/metrics")
+@admin_required
+def admin_metrics():
+    """Per-process counters: named SQL statements, in-memory caches, circuit breakers."""
+    recs = _recs["index"]
+    return jsonify({
+        "pid": os.getpid(),
+        "queries": sql.stats(),
+        "review_cache": {"hits": review_feed.hits, "misses": review_feed.misses, "errors": review_feed.errors},
+        "recommendations": {"items": len(recs) if recs is not None else None},
+        "resilience": guard.stats(),
+        "cache_bus": cache_bus.stats(),
+    })
+
+
+# ---- Order export (accounting) ----
+@app.route("/admin/export-orders")
+@admin_required
+def admin_export_orders():
+    """
+    Orders with their line items as CSV, streamed from a server-side cursor.
+    Query params:
+      - from, to (YYYY-MM-DD, UTC, inclusive): default the last 30 days
+      - gzip=1: download as .csv.gz
+      - archived=0: leave out archived orders (included by default)
+    """
+    today = datetime.now(timezone.utc).date()
+    try:
+        end = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else today
+        start = (datetime.strptime(request.args["from"], "%Y-%m-%d").date()
+                 if request.args.get("from") else end - timedelta(days=29))
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"error": "from is after to"}), 400
+
+    sources = ORDER_SOURCES if request.args.get("archived", "1") != "0" else ORDER_SOURCES[:1]
+    body = write_order_csv(iter_order_lines(get_engine(), start, end, sources,
+                                            yield_per=app.config["ORDER_EXPORT_YIELD_PER"]))
+    filename = f"orders_{start.isoformat()}_{end.isoformat()}.csv"
+    mimetype = "text/csv"
+    if request.args.get("gzip") == "1":
+        body, filename, mimetype = gzip_chunks(body), filename + ".gz", "application/gzip"
+
+    user = current_user()
+    log_event("orders_exported", user.get("username"), request.remote_addr,
+              {"from": start.isoformat(), "to": end.isoformat()})
+    return Response(body, mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+# ---- Order archival ----
+@app.route("/admin/orders/archive", methods=["POST"])
+@admin_required
+def admin_orders_archive():
+    """
+    Moves finished orders older than ORDER_ARCHIVE_AFTER_DAYS to the archive
+    tables, for up to ORDER_ARCHIVE_REQUEST_SECONDS. Batches commit one by
+    one, so pressing it again simply continues.
+    """
+    days = app.config["ORDER_ARCHIVE_AFTER_DAYS"]
+    summary = archive_orders(
+        get_engine(), archive_cutoff(days),
+        batch_size=app.config["ORDER_ARCHIVE_BATCH_SIZE"],
+        deadline=time.monotonic() + app.config["ORDER_ARCHIVE_REQUEST_SECONDS"],
+    )
+    user = current_user()
+    log_event("orders_archived", user.get("username"), request.remote_addr, {**summary, "days": days})
+    if request.is_json:
+        return jsonify(summary)
+    more = "" if summary["done"] else " More to do, run it again."
+    flash(f"Archived {summary['archived']} orders older than {days} days.{more}", "success")
+    return redirect(url_for("admin"))
+
+
+@app.cli.command("archive-orders")
+def archive_orders_command():
+    """Archive all finished orders past ORDER_ARCHIVE_AFTER_DAYS: flask --app main archive-orders"""
+    init_db()
+    started = time.monotonic()
+    summary = archive_orders(get_engine(), archive_cutoff(app.config["ORDER_ARCHIVE_AFTER_DAYS"]),
+                             batch_size=app.config["ORDER_ARCHIVE_BATCH_SIZE"])
+    print(f"archived {summary['archived']} orders in {summary['batches']} batches "
+          f"in {time.monotonic() - started:.1f}s")
+
+
+# ---- Review store migration ----
+@app.route("/admin/reviews/backfill", methods=["POST"])
+@admin_required
+def admin_reviews_backfill():
+    """
+    Copies Firestore reviews into the Cloud SQL reviews table. Re-runnable:
+    rows already copied (by backfill or dual-write) are skipped on fs_id.
+    Run it after switching to REVIEW_STORE=dual, then move to sql.
+    """
+    try:
+        summary = backfill_reviews_to_sql(
+            FirestoreReviewRepository(lambda: db_fs),
+            SqlReviewRepository(get_engine),
+        )
+    except Exception as e:
+        app.logger.exception("review backfill failed")
+        flash(f"Review backfill failed ({e}).", "danger")
+        return redirect(url_for("admin"))
+
+    bump_cache_version("stats")
+    bump_cache_version("reviews")
+    user = current_user()
+    log_event("reviews_backfilled", user.get("username"), request.remote_addr, summary)
+    flash("Review backfill: {scanned} scanned, {inserted} copied to Cloud SQL.".format(**summary), "success")
+    return redirect(url_for("admin"))
+
+
+# ---- Menu versioning (delta sync) ----
+# Every menu write takes the next value from the single-row menu_version
+# counter and stamps it on the changed rows (or on a tombstone for deletes).
+# Clients send back the last version they saw and only get rows above it.
+def next_menu_version(conn) -> int:
+    # the UPDATE row-locks the counter until commit, so versions are handed
+    # out (and become visible) in order even with concurrent writers
+    sql.execute(conn, "menu_version.next")
+    return int(sql.execute(conn, "menu_version.current").scalar())
+
+
+def current_menu_version(conn) -> int:
+    v = sql.execute(conn, "menu_version.current").scalar()
+    return int(v or 0)
+
+
+def touch_menu_items(conn, item_ids, version: int | None = None) -> int:
+    """
+    Marks menu items as changed (inserted/updated) at a new menu version.
+    Call inside the writing transaction; bump_cache_version("menu") after commit.
+    """
+    item_ids = [int(i) for i in item_ids]
+    if version is None:
+        version = next_menu_version(conn)
+    if item_ids:
+        sql.execute(conn, "menu.touch", {"v": version, "now": datetime.now(timezone.utc), "ids": item_ids})
+        # an id that comes back is no longer deleted
+        sql.execute(conn, "menu_tombstones.clear", {"ids": item_ids})
+    return version
+
+
+def delete_menu_items(conn, item_ids, version: int | None = None) -> int:
+    """Deletes menu items and leaves tombstones so delta clients drop them too."""
+    item_ids = [int(i) for i in item_ids]
+    if version is None:
+        version = next_menu_version(conn)
+    if item_ids:
+        sql.execute(conn, "menu.delete", {"ids": item_ids})
+        sql.execute(conn, "menu_tombstones.clear", {"ids": item_ids})
+        sql.execute(conn, "menu_tombstones.insert",
+                    [{"id": i, "v": version, "now": datetime.now(timezone.utc)} for i in item_ids])
+    return version
+
+
+# ---- Admin menu import / export ----
+MENU_IMPORT_MAX_ROWS = 5000
+
+
+@app.route("/admin/menu/import", methods=["POST"])
+@admin_required
+def admin_menu_import():
+    """
+    Bulk upsert of the menu from a CSV / JSON upload (columns: id, name,
+    description, price, category, image_url). Rows match on id, else name.
+    Only changed rows are written, all in one transaction at one menu version.
+    With prune=1, items missing from the upload are deleted (tombstoned).
+    """
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Choose a CSV or JSON file to import.", "danger")
+        return redirect(url_for("admin"))
+
+    fmt = (request.form.get("format") or upload.filename.rsplit(".", 1)[-1]).lower()
+    prune = request.form.get("prune") == "1"
+
+    incoming = []
+    try:
+        for line, raw in iter_upload(upload.stream, fmt):
+            incoming.append(normalise_row(line, raw))
+            if len(incoming) > MENU_IMPORT_MAX_ROWS:
+                raise MenuImportError(line, f"more than {MENU_IMPORT_MAX_ROWS} rows")
+    except (MenuImportError, UnicodeDecodeError, csv.Error) as e:
+        flash(f"Import failed, nothing was changed ({e}).", "danger")
+        return redirect(url_for("admin"))
+
+    if not incoming:
+        flash("The file has no menu items.", "warning")
+        return redirect(url_for("admin"))
+
+    try:
+        summary = _apply_menu_import(incoming, prune)
+    except MenuImportError as e:
+        flash(f"Import failed, nothing was changed ({e}).", "danger")
+        return redirect(url_for("admin"))
+    except DataError:
+        # the rows are validated against the column sizes, so this is a value MySQL still refused
+        app.logger.exception("menu import refused by the database")
+        flash("Import failed, nothing was changed (a value doesn't fit the menu table).", "danger")
+        return redirect(url_for("admin"))
+    except IntegrityError:
+        app.logger.exception("menu import conflict")
+        if prune:
+            reason = "an item to remove may still be used by orders"
+        else:
+            reason = "the menu changed while importing, please try again"
+        flash(f"Import failed, nothing was changed ({reason}).", "danger")
+        return redirect(url_for("admin"))
+
+    user = current_user()
+    log_event("menu_imported", user.get("username"), request.remote_addr, {**summary, "file": upload.filename})
+    flash(
+        "Menu imported: {inserted} added, {updated} updated, {unchanged} unchanged, {deleted} removed.".format(**summary),
+        "success",
+    )
+    return redirect(url_for("admin"))
+
+
+def _apply_menu_import(incoming, prune: bool) -> dict:
+    engine = get_engine()
+    with engine.begin() as conn:
+        current = conn.execute(text("""
+            SELECT id, name, description, price, category, image_url FROM menu_items
+        """)).mappings().all()
+
+        inserts, updates, unchanged, seen = diff_menu(current, incoming)
+        removed = sorted({int(r["id"]) for r in current} - seen) if prune else []
+
+        if inserts or updates or removed:
+            # one version for the whole import -> caches invalidate once
+            version = next_menu_version(conn)
+            now = datetime.now(timezone.utc)
+
+            if updates:
+                conn.execute(
+                    text("""
+                        UPDATE menu_items
+                        SET name = :name, description = :description, price = :price,
+                            category = :category, image_url = :image_url,
+                            row_version = :v, updated_at = :now
+                        WHERE id = :id
+                    """),
+                    [{**u, "price": float(u["price"]), "v": version, "now": now} for u in updates],
+                )
+
+            with_id = [r for r in inserts if r["id"] is not None]
+            without_id = [r for r in inserts if r["id"] is None]
+            if with_id:
+                conn.execute(
+                    text("""
+                        INSERT INTO menu_items (id, name, description, price, category, image_url, row_version, updated_at)
+                        VALUES (:id, :name, :description, :price, :category, :image_url, :v, :now)
+                    """),
+                    [{**r, "price": float(r["price"]), "v": version, "now": now} for r in with_id],
+                )
+                conn.execute(
+                    text("DELETE FROM menu_item_tombstones WHERE menu_item_id IN :ids")
+                    .bindparams(bindparam("ids", expanding=True)),
+                    {"ids": [r["id"] for r in with_id]},
+                )
+            if without_id:
+                conn.execute(
+                    text("""
+                        INSERT INTO menu_items (name, description, price, category, image_url, row_version, updated_at)
+                        VALUES (:name, :description, :price, :category, :image_url, :v, :now)
+                    """),
+                    [{**r, "price": float(r["price"]), "v": version, "now": now} for r in without_id],
+                )
+
+            if removed:
+                delete_menu_items(conn, removed, version)
+
+    if inserts or updates or removed:
+        bump_cache_version("menu")
+
+    return {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "unchanged": len(unchanged),
+        "deleted": len(removed),
+    }
+
+
+@app.route("/admin/menu/export")
+@admin_required
+def admin_menu_export():
+    fmt = (request.args.get("format") or "csv").lower()
+    engine = get_engine()
+    with engine.begin() as conn:
+        rows = conn.execute(text("""
+            SELECT id, name, description, price, category, image_url
+            FROM menu_items
+            ORDER BY category, id
+        """)).mappings().all()
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    if fmt == "json":
+        resp = jsonify(rows)
+        resp.headers["Content-Disposition"] = f'attachment; filename="menu_export_{stamp}.json"'
+        return resp
+
+    return Response(
+        write_csv(rows),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="menu_export_{stamp}.csv"'},
+    )
+
+
+# ---- Stock ----
+@app.route("/admin/menu/<int:item_id>/stock", methods=["POST"])
+@admin_required
+def admin_set_stock(item_id):
+    """Sets how many of an item are left; blank makes it unlimited again."""
+    body = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    try:
+        stock = parse_stock(body.get("stock"))
+    except ValueError:
+        if request.is_json:
+            return jsonify({"error": "stock must be a whole number >= 0, or empty"}), 400
+        flash("Stock must be a whole number (or empty for unlimited).", "danger")
+        return redirect(url_for("admin"))
+
+    with get_engine().begin() as conn:
+        found = set_stock(conn, item_id, stock)
+        if found:
+            touch_menu_items(conn, [item_id])
+    if not found:
+        if request.is_json:
+            return jsonify({"error": "not found"}), 404
+        flash(f"Menu item {item_id} not found.", "danger")
+        return redirect(url_for("admin"))
+    bump_cache_version("menu")
+
+    user = current_user()
+    log_event("stock_set", user.get("username"), request.remote_addr, {"item_id": item_id, "stock": stock})
+    if request.is_json:
+        return jsonify({"id": item_id, "stock": stock})
+    flash(f"Stock for item {item_id} set to {'unlimited' if stock is None else stock}.", "success")
+    return redirect(url_for("admin"))
+
+
 # ---- Simple REST API ----
 @app.route("/api/menu")
 def api_menu():
+    """
+    Returns the menu.
+    Optional query param:
+      - since (int): menu version the client already has. Returns only
+        {"version", "changed", "deleted", "full"} instead of the whole list.
+    Every item has "stock": null (unlimited) or how many are left. Deltas
+    carry items that sold out or were restocked; the count in between
+    isn't versioned, so treat it as a hint and 0 as the real signal.
+    """
+    since_raw = request.args.get("since")
+    since = None
+    if since_raw is not None:
+        try:
+            since = int(since_raw)
+        except ValueError:
+            return jsonify({"error": "since must be an integer"}), 400
+        if since < 0:
+            return jsonify({"error": "since must be >= 0"}), 400
+
+    engine = get_engine()
+    with engine.begin() as conn:
+        version = current_menu_version(conn)
+
+        # no token, a fresh client, or a token from the future (DB restored) -> full list
+        if since is None or since == 0 or since > version:
+            rows = sql.execute(conn, "menu.api_full").all()
+            deleted = []
+        else:
+            rows = sql.execute(conn, "menu.changed_since", {"since": since}).all()
+            deleted = sql.execute(conn, "menu.deleted_since", {"since": since}).scalars().all()
+
+    # rows go straight to the JSON provider (Decimal prices handled there)
+    if since is None:
+        resp = jsonify(rows)
+    else:
+        resp = jsonify({
+            "version": version,
+            "full": since == 0 or since > version,
+            "changed": rows,
+            "deleted": [int(i) for i in deleted],
+        })
+    resp.headers["X-Menu-Version"] = str(version)
+    return resp
+
+
+# ---- Menu search ----
+_menu_search = {"key": None, "index": None}
+_search_boosts = {"key": None, "boosts": {}}
+_menu_search_lock = threading.Lock()
+
+
+def _build_menu_search_index():
     engine = get_engine()
     with engine.begin() as conn:
         rows = conn.execute(text("""
             SELECT id, name, description, price, category, image_url
             FROM menu_items
-            ORDER BY category, name
-        """)).all()
+        """)).fetchall()
 
-    return jsonify([
+    items = [
         {
             "id": r.id,
             "name": r.name,
@@ -861,7 +2105,114 @@ def api_menu():
             "image_url": r.image_url,
         }
         for r in rows
-    ])
+    ]
+    return MenuSearchIndex(items)
+
+
+def menu_search_index() -> MenuSearchIndex:
+    """
+    Returns the in-memory search index, rebuilding it only when the
+    menu version has moved on since the last build.
+    """
+    key = cache_version("menu")
+    if _menu_search["key"] == key and _menu_search["index"] is not None:
+        return _menu_search["index"]
+
+    with _menu_search_lock:
+        if _menu_search["key"] != key or _menu_search["index"] is None:
+            _menu_search["index"] = _build_menu_search_index()
+            _menu_search["key"] = key
+    return _menu_search["index"]
+
+
+def search_boosts() -> dict:
+    """
+    Rating multipliers for search results, re-read when the stats version
+    moves (every review), without touching the text index. Boosts are
+    nice-to-have: if the stats can't be read we keep the last ones.
+    """
+    key = cache_version("stats")
+    if _search_boosts["key"] == key:
+        return _search_boosts["boosts"]
+    try:
+        stats = review_repo.item_stats()
+    except Exception as e:
+        app.logger.warning("menu search: review stats unavailable (%s)", e)
+        return _search_boosts["boosts"]
+    _search_boosts.update(key=key, boosts=rating_boosts(stats))
+    return _search_boosts["boosts"]
+
+
+# ---- "Customers also ordered" ----
+_recs = {"key": None, "loaded_at": 0.0, "index": None}
+_recs_lock = threading.Lock()
+
+
+def _build_recommendation_index(previous=None) -> CoOccurrenceIndex:
+    with get_engine().begin() as conn:
+        items = {
+            r.id: {"id": r.id, "name": r.name, "price": float(r.price)}
+            for r in conn.execute(text("SELECT id, name, price FROM menu_items"))
+        }
+        pairs = load_pairs(conn)
+    return CoOccurrenceIndex(pairs, items, top_k=app.config["RECS_TOP_K"],
+                             min_support=app.config["RECS_MIN_SUPPORT"], previous=previous)
+
+
+def recommendation_index() -> CoOccurrenceIndex:
+    """
+    The in-memory co-occurrence index. Reloaded when the menu changes or
+    RECS_REFRESH_SECONDS have passed (orders placed on other instances);
+    if the reload fails we keep serving the previous one.
+    """
+    key = (cache_version("menu"), cache_version("recs"))
+    fresh = time.monotonic() - _recs["loaded_at"] < app.config["RECS_REFRESH_SECONDS"]
+    if _recs["index"] is not None and _recs["key"] == key and fresh:
+        return _recs["index"]
+
+    with _recs_lock:
+        fresh = time.monotonic() - _recs["loaded_at"] < app.config["RECS_REFRESH_SECONDS"]
+        if _recs["index"] is None or _recs["key"] != key or not fresh:
+            try:
+                _recs["index"] = _build_recommendation_index(_recs["index"])
+            except Exception as e:
+                app.logger.warning("recommendations: reload failed (%s)", e)
+                if _recs["index"] is None:
+                    _recs["index"] = CoOccurrenceIndex([], {})
+            _recs["key"] = key
+            _recs["loaded_at"] = time.monotonic()
+    return _recs["index"]
+
+
+@app.cli.command("rebuild-recommendations")
+def rebuild_recommendations_command():
+    """Recompute item_pairs from order history: flask --app main rebuild-recommendations"""
+    init_db()
+    started = time.monotonic()
+    with get_engine().begin() as conn:
+        summary = rebuild_pairs(conn, sources=ORDER_SOURCES)
+    bump_cache_version("recs")
+    print(f"{summary['pairs']} item pairs from {summary['orders']} orders in {time.monotonic() - started:.1f}s")
+
+
+@app.route("/api/menu/search")
+def api_menu_search():
+    """
+    Prefix + fuzzy search over menu item name, description and category.
+    Query params:
+      - q (str): search text
+      - limit (int): default 20, max 50
+    """
+    q = (request.args.get("q") or "").strip()
+    try:
+        limit = max(1, min(50, int(request.args.get("limit", "20"))))
+    except ValueError:
+        limit = 20
+
+    if not q:
+        return jsonify([])
+
+    return jsonify(menu_search_index().search(q, limit=limit, boosts=search_boosts()))
 
 
 @app.route("/find-us")
@@ -874,47 +2225,346 @@ def find_us():
 
     return render_template("find_us.html", user=user)
 
+# ---- Checkout idempotency ----
+# checkout.html carries a one-off key; the first POST with it stores
+# key -> order_id under a unique index, any repeat (double click, browser
+# retry) just gets the original order back without re-pricing or inserting.
+_IDEMPOTENCY_KEY_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+_last_key_sweep = 0.0
+
+
+class DuplicateCheckout(Exception):
+    def __init__(self, order_id):
+        super().__init__(order_id)
+        self.order_id = order_id
+
+
+def find_checkout_key(conn, key: str, user_id: int):
+    row = sql.execute(conn, "checkout_keys.find", {"k": key}).fetchone()
+    if row is None or int(row.user_id) != int(user_id):
+        return None
+    return row.order_id
+
+
+def claim_checkout_key(conn, key: str, user_id: int):
+    """
+    Inserts the key inside the order transaction. A concurrent duplicate
+    blocks on the unique index and then fails, so only one order is created.
+    """
+    now = datetime.now(timezone.utc)
+    ttl = timedelta(hours=int(app.config.get("CHECKOUT_KEY_TTL_HOURS", 24)))
+    try:
+        with conn.begin_nested():
+            sql.execute(conn, "checkout_keys.claim",
+                        {"k": key, "uid": int(user_id), "now": now, "exp": now + ttl})
+    except IntegrityError:
+        raise DuplicateCheckout(find_checkout_key(conn, key, user_id))
+
+
+def sweep_checkout_keys(force: bool = False) -> int:
+    """Deletes expired keys, at most once per CHECKOUT_KEY_SWEEP_SECONDS."""
+    global _last_key_sweep
+    interval = float(app.config.get("CHECKOUT_KEY_SWEEP_SECONDS", 300))
+    now = time.monotonic()
+    if not force and now - _last_key_sweep < interval:
+        return 0
+    _last_key_sweep = now
+
+    engine = get_engine()
+    with engine.begin() as conn:
+        res = sql.execute(conn, "checkout_keys.sweep", {"now": datetime.now(timezone.utc)})
+    return res.rowcount or 0
+
+
+def _already_placed(order_id):
+    if order_id:
+        flash(f"Order #{order_id} was already placed.", "info")
+    else:
+        flash("That order is already being placed.", "info")
+    return redirect(url_for("my_orders"))
+
+
+def insert_order(conn, user_id: int, lines, total, created_at=None) -> int:
+    # explicit UTC timestamp: the sales rollups bucket on exactly this value
+    created_at = utc_naive(created_at)
+    res = sql.execute(conn, "orders.insert",
+                      {"uid": int(user_id), "total": float(total), "created_at": created_at})
+    order_id = res.lastrowid
+
+    sql.execute(
+        conn,
+        "order_items.insert",
+        [
+            {
+                "oid": int(order_id),
+                "mid": int(ln["menu_item_id"]),
+                "qty": int(ln["qty"]),
+                "unit": float(ln["unit_price"]),
+            }
+            for ln in lines
+        ]
+    )
+    # sales rollups and item_pairs are applied later in batches (flush_rollups),
+    # the order transaction only adds its own pending row
+    queue_rollups(conn, [order_id], 1, pairs=True)
+    return int(order_id)
+
+
+def mark_sold_out(conn, item_ids):
+    """
+    Stamps items that just hit zero stock with a new menu version, so
+    /api/menu delta clients see them go. Plain decrements don't touch the
+    version (that would serialise every checkout on the counter row).
+    """
+    if item_ids:
+        touch_menu_items(conn, item_ids)
+
+
+def flash_short_lines(items):
+    for item in items:
+        if item["left"]:
+            flash(f"Only {item['left']} {item['name']} left, please update your cart.", "warning")
+        else:
+            flash(f"Sorry, {item['name']} is sold out.", "warning")
+
+
+# ---- Write-behind order intake ----
+# Off by default and left off in app.yaml: the journal is a local file, and on
+# App Engine standard that file is in memory and private to one instance, so
+# an instance shutdown loses orders already acknowledged (see order_intake.py).
+_order_intake = {"queue": None, "worker": None}
+_order_intake_lock = threading.Lock()
+
+
+def get_order_intake() -> OrderIntakeQueue:
+    if _order_intake["queue"] is None:
+        with _order_intake_lock:
+            if _order_intake["queue"] is None:
+                if os.environ.get("GAE_ENV"):
+                    app.logger.warning("order intake journal %s is not durable on App Engine standard",
+                                       app.config["ORDER_INTAKE_PATH"])
+                queue = OrderIntakeQueue(
+                    app.config["ORDER_INTAKE_PATH"],
+                    max_pending=app.config["ORDER_INTAKE_MAX_PENDING"],
+                )
+                if app.config.get("ORDER_INTAKE_WORKER", True):
+                    worker = IntakeWorker(
+                        queue, persist_intake_batch,
+                        batch_size=app.config["ORDER_INTAKE_BATCH_SIZE"],
+                        logger=app.logger,
+                    )
+                    worker.start()
+                    _order_intake["worker"] = worker
+                _order_intake["queue"] = queue
+    return _order_intake["queue"]
+
+
+def persist_intake_batch(entries):
+    """
+    Writes a batch of journalled orders to MySQL in one transaction.
+    Per-order data problems fail just that order; anything else (DB down)
+    propagates so the worker releases and retries the batch.
+    """
+    persisted, failed, created = {}, {}, []
+    sold_out = set()
+
+    engine = get_engine()
+    with engine.begin() as conn:
+        for e in entries:
+            p = e["payload"]
+            # a batch can commit here and still be re-claimed (worker killed
+            # before mark_persisted, or slower than CLAIM_TIMEOUT), so every
+            # entry is written under a key: the customer's, else one from its ref
+            key = e["idem_key"] or f"intake-{e['ref']}"
+            try:
+                with conn.begin_nested():
+                    claim_checkout_key(conn, key, e["user_id"])
+                    gone = reserve_stock(conn, p["lines"])
+                    order_id = insert_order(conn, e["user_id"], p["lines"], Decimal(p["total"]))
+                    sql.execute(conn, "checkout_keys.set_order", {"oid": order_id, "k": key})
+            except SoldOut as so:
+                # orders.html shows the customer what follows this prefix
+                failed[e["ref"]] = f"sold out: {so}"
+                continue
+            except DuplicateCheckout as dup:
+                if dup.order_id:
+                    persisted[e["ref"]] = dup.order_id
+                else:
+                    failed[e["ref"]] = "duplicate checkout"
+                continue
+            except (IntegrityError, DataError) as err:
+                failed[e["ref"]] = err
+                continue
+
+            persisted[e["ref"]] = order_id
+            created.append((e, order_id))
+            sold_out.update(gone)
+        mark_sold_out(conn, sold_out)
+
+    if sold_out:
+        bump_cache_version("menu")
+    if created:
+        bump_cache_version("orders", defer=True)
+    for e, order_id in created:
+        p = e["payload"]
+        order_feed.publish("order_created", {
+            "id": order_id,
+            "username": p.get("username"),
+            "status": "pending",
+            "total_price": float(p["total"]),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "items": [
+                {"name": ln["name"], "qty": int(ln["qty"]), "unit_price": float(ln["unit_price"])}
+                for ln in p["lines"]
+            ],
+        })
+        log_event("order_created", p.get("username"), p.get("ip"),
+                  {"order_id": order_id, "total": float(p["total"]), "intake_ref": e["ref"]})
+
+    return persisted, failed
+
+
+def drain_order_intake() -> int:
+    """Drains the journal synchronously (tests / manual runs). Returns entries handled."""
+    queue = get_order_intake()
+    worker = _order_intake["worker"] or IntakeWorker(
+        queue, persist_intake_batch, batch_size=app.config["ORDER_INTAKE_BATCH_SIZE"]
+    )
+    total = 0
+    while True:
+        n = worker.drain_once()
+        total += n
+        if n == 0:
+            return total
+
+
+def _accept_into_intake(user, key, lines, total):
+    # the drain reserves the stock; don't say "received" for what is already gone
+    try:
+        with get_engine().connect() as conn:
+            short = short_lines(conn, lines)
+    except OperationalError:
+        short = []         # the database is why intake exists: let the drain decide
+    if short:
+        flash_short_lines(short)
+        return redirect(url_for("cart"))
+
+    payload = {
+        "username": user.get("username"),
+        "ip": request.remote_addr,
+        "total": str(total),
+        "lines": lines,
+    }
+    try:
+        ref = get_order_intake().enqueue(user["id"], payload, key)
+    except QueueFull:
+        # backpressure: the drainer is behind, make the customer retry shortly
+        flash("We're very busy right now, please try placing your order again in a moment.", "warning")
+        return redirect(url_for("checkout"))
+
+    if _order_intake["worker"]:
+        _order_intake["worker"].notify()
+
+    session["cart"] = {}
+    session.modified = True
+    flash(f"Order received! Reference {ref}", "success")
+    return redirect(url_for("my_orders"))
+
+
+@app.route("/orders/intake/<ref>")
+@login_required
+def order_intake_status(ref):
+    """Status of an order accepted by the intake queue: received / persisted / failed."""
+    entry = get_order_intake().lookup(ref) if app.config["ORDER_INTAKE_ENABLED"] else None
+    if not entry or int(entry["user_id"]) != int(current_user()["id"]):
+        return jsonify({"error": "not found"}), 404
+    return jsonify({k: entry[k] for k in ("ref", "status", "order_id", "error")})
+
+
 @app.route("/checkout", methods=["GET", "POST"])
 @login_required
 def checkout():
     user = current_user()
-    lines, total = cart_lines_from_session()
 
     if request.method == "GET":
+        lines, total = cart_lines_from_session()
         if not lines:
             flash("Your cart is empty.", "warning")
             return redirect(url_for("menu"))
-        return render_template("checkout.html", user=user, lines=lines, total=float(total))
+        return render_template(
+            "checkout.html", user=user, lines=lines, total=float(total),
+            idempotency_key=uuid.uuid4().hex,
+        )
 
-    # POST: place order
+    # POST: a repeat of an already placed order never gets as far as pricing
+    key = (request.form.get("idempotency_key") or "").strip()
+    if not _IDEMPOTENCY_KEY_RE.match(key):
+        key = None
+
+    engine = get_engine()
+    intake = app.config["ORDER_INTAKE_ENABLED"]
+    if key and intake:
+        # no database round trip here: intake has to take orders while Cloud
+        # SQL is down, and the drain's claim_checkout_key catches a key used
+        # before (it marks the entry persisted with that order)
+        journalled = get_order_intake().find_by_key(key)
+        if journalled:
+            if journalled["order_id"]:
+                return _already_placed(journalled["order_id"])
+            flash(f"Order {journalled['ref']} was already received.", "info")
+            return redirect(url_for("my_orders"))
+    elif key:
+        with engine.begin() as conn:
+            existing = find_checkout_key(conn, key, user["id"])
+        if existing:
+            return _already_placed(existing)
+
+    try:
+        lines, total = cart_lines_from_session(allow_stale=intake)
+    except OperationalError:
+        if not intake:
+            raise
+        flash("We can't take orders right now, please try again in a moment.", "danger")
+        return redirect(url_for("cart"))
     if not lines:
         flash("Your cart is empty.", "warning")
         return redirect(url_for("menu"))
 
-    engine = get_engine()
-    with engine.begin() as conn:
-        res = conn.execute(
-            text("""
-                INSERT INTO orders (user_id, status, total_price)
-                VALUES (:uid, 'pending', :total)
-            """),
-            {"uid": int(user["id"]), "total": float(total)}
-        )
-        order_id = res.lastrowid
-
-        for ln in lines:
-            conn.execute(
-                text("""
-                    INSERT INTO order_items (order_id, menu_item_id, qty, unit_price)
-                    VALUES (:oid, :mid, :qty, :unit)
-                """),
-                {
-                    "oid": int(order_id),
-                    "mid": int(ln["menu_item_id"]),
-                    "qty": int(ln["qty"]),
-                    "unit": float(ln["unit_price"]),
-                }
-            )
+    if intake:
+        return _accept_into_intake(user, key, lines, total)
+
+    try:
+        with engine.begin() as conn:
+            if key:
+                claim_checkout_key(conn, key, user["id"])
+            sold_out = reserve_stock(conn, lines)
+            order_id = insert_order(conn, user["id"], lines, total)
+            if key:
+                sql.execute(conn, "checkout_keys.set_order", {"oid": order_id, "k": key})
+            mark_sold_out(conn, sold_out)
+    except DuplicateCheckout as dup:
+        return _already_placed(dup.order_id)
+    except SoldOut as so:
+        # the whole transaction rolled back: no order, no stock taken, key free again
+        flash_short_lines(so.items)
+        return redirect(url_for("cart"))
+
+    sweep_checkout_keys()
+    if sold_out:
+        bump_cache_version("menu")
+    bump_cache_version("orders", defer=True)
+
+    order_feed.publish("order_created", {
+        "id": int(order_id),
+        "username": user.get("username"),
+        "status": "pending",
+        "total_price": float(total),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "items": [
+            {"name": ln["name"], "qty": int(ln["qty"]), "unit_price": float(ln["unit_price"])}
+            for ln in lines
+        ],
+    })
 
     # clear cart
     session["cart"] = {}
@@ -930,30 +2580,18 @@ def my_orders():
     user = current_user()
     engine = get_engine()
 
+    # recent orders by default; ?archived=1 shows history moved to the archive tables
+    archived = request.args.get("archived") == "1"
+    suffix = ".archive" if archived else ""
+
     with engine.begin() as conn:
-        orders = conn.execute(
-            text("""
-                SELECT id, status, total_price, created_at
-                FROM orders
-                WHERE user_id = :uid
-                ORDER BY created_at DESC
-            """),
-            {"uid": int(user["id"])}
-        ).fetchall()
+        orders = sql.execute(conn, "orders.by_user" + suffix, {"uid": int(user["id"])}).fetchall()
 
         order_ids = [o.id for o in orders]
 
         items = []
         if order_ids:
-            stmt = text("""
-                SELECT oi.order_id, oi.qty, oi.unit_price, mi.name
-                FROM order_items oi
-                JOIN menu_items mi ON mi.id = oi.menu_item_id
-                WHERE oi.order_id IN :oids
-                ORDER BY oi.order_id DESC, mi.name ASC
-            """).bindparams(bindparam("oids", expanding=True))
-
-            items = conn.execute(stmt, {"oids": order_ids}).fetchall()
+            items = sql.execute(conn, "order_lines" + suffix, {"oids": order_ids}).fetchall()
 
     items_by_order = {}
     for it in items:
@@ -963,7 +2601,15 @@ def my_orders():
             "unit_price": float(it.unit_price),
         })
 
-    return render_template("orders.html", user=user, orders=orders, items_by_order=items_by_order)
+    # accepted by the intake queue but not in MySQL yet
+    received = []
+    if app.config["ORDER_INTAKE_ENABLED"] and not archived:
+        received = get_order_intake().pending_for_user(user["id"])
+
+    return render_template(
+        "orders.html", user=user, orders=orders, items_by_order=items_by_order,
+        received_orders=received, archived=archived,
+    )
 
 
 
@@ -971,10 +2617,11 @@ def my_orders():
 @app.route("/api/reviews", methods=["GET"])
 def api_reviews():
     """
-    Returns latest reviews from Firestore.
+    Returns latest reviews from the review store.
     Optional query params:
       - item_id (int): filter reviews for a specific menu item
       - limit (int): default 20, max 100
+      - cursor (str): value of X-Next-Cursor from the previous page
     """
     limit_raw = request.args.get("limit", "20")
     try:
@@ -983,37 +2630,39 @@ def api_reviews():
         limit = 20
 
     item_id = request.args.get("item_id")
-    q = db_fs.collection("reviews").order_by("created_at", direction=firestore.Query.DESCENDING)
-
+    item_id_int = None
     if item_id is not None:
         try:
             item_id_int = int(item_id)
-            q = q.where("item_id", "==", item_id_int)
         except ValueError:
             return jsonify({"error": "item_id must be an integer"}), 400
 
-    docs = q.limit(limit).stream()
-
-    out = []
-    for d in docs:
-        data = d.to_dict() or {}
-        data["id"] = d.id
+    try:
+        out = latest_reviews(limit, item_id=item_id_int, cursor=request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"error": "invalid cursor"}), 400
+    except Unavailable:
+        return _refuse(503, 5, "Reviews are temporarily unavailable.")
 
-        ts = data.get("created_at")
-        if hasattr(ts, "isoformat"):
-            data["created_at"] = ts.isoformat()
+    # timestamps are serialised by the JSON provider
+    resp = jsonify(out)
+    if len(out) == limit and encode_cursor(out[-1]):
+        resp.headers["X-Next-Cursor"] = encode_cursor(out[-1])
+    return resp
 
-        out.append(data)
 
-    return jsonify(out)
+from sqlalchemy import text  
 
+def _load_menu_page(limit: int):
+    engine = get_engine()
+    with engine.begin() as conn:
+        return sql.execute(conn, "menu.page", {"lim": limit}).fetchall()
 
-from sqlalchemy import text  
 
 @app.route("/api/stats", methods=["GET"])
 def api_stats():
     """
-    Returns menu items (Cloud SQL) combined with aggregated stats (Firestore item_stats).
+    Returns menu items (Cloud SQL) combined with aggregated review stats.
     Optional query param:
       - limit (int): default 20, max 100
     """
@@ -1023,48 +2672,15 @@ def api_stats():
     except ValueError:
         limit = 20
 
-    # 1) Load menu items from Cloud SQL
-    engine = get_engine()
-    with engine.begin() as conn:
-        rows = conn.execute(text("""
-            SELECT id, name, description, price, category, image_url
-            FROM menu_items
-            ORDER BY id ASC
-            LIMIT :lim
-        """), {"lim": limit}).fetchall()
-
-    menu = [
-        {
-            "id": r.id,
-            "name": r.name,
-            "description": r.description,
-            "price": float(r.price),
-            "category": getattr(r, "category", None),
-            "image_url": getattr(r, "image_url", None),
-        }
-        for r in rows
-    ]
-
-    # 2) Load stats from Firestore (item_stats docs keyed by item_id string)
-    stats_docs = db_fs.collection("item_stats").stream()
-    stats_map = {}
-    for d in stats_docs:
-        s = d.to_dict() or {}
-        sid = s.get("item_id", d.id)
-        stats_map[str(sid)] = s
-
-    # 3) Join
-    combined = []
-    for item in menu:
-        s = stats_map.get(str(item["id"]), {})
-        combined.append({
-            **item,
-            "review_count": int(s.get("review_count", 0) or 0),
-            "avg_rating": float(s.get("avg_rating", 0.0) or 0.0),
-            "total_rating": float(s.get("total_rating", 0.0) or 0.0),
-        })
-
-    return jsonify(combined)
+    # menu page + per-item aggregates (a single join with the SQL store)
+    try:
+        return jsonify(review_repo.menu_with_stats(limit, _load_menu_page))
+    except Unavailable:
+        # degraded: the menu without ratings beats no menu
+        empty = {"review_count": 0, "total_rating": 0.0, "avg_rating": None}
+        resp = jsonify([{**r._mapping, **empty} for r in _load_menu_page(limit)])
+        resp.headers["X-Degraded"] = "review-stats"
+        return resp
 
 
 
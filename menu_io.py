@@ -0,0 +1,202 @@
+"""
+Menu import/export helpers (admin bulk upload).
+
+Uploads are parsed as a stream (CSV, NDJSON, or a JSON array read object by
+object) so a large file never has to be held as one string. Rows are
+normalised/validated here and diffed against the current menu so the import
+only writes what actually changed.
+"""
+import codecs
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+FIELDS = ["id", "name", "description", "price", "category", "image_url"]
+COMPARED = ["name", "description", "price", "category", "image_url"]
+
+MAX_NAME = 100
+MAX_DESCRIPTION = 255
+MAX_CATEGORY = 50
+MAX_IMAGE_URL = 500
+# menu_items.price is DECIMAL(10,2)
+MAX_PRICE = Decimal("99999999.99")
+
+
+class MenuImportError(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def _iter_csv(stream):
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text_stream)
+        for i, row in enumerate(reader, start=2):  # line 1 is the header
+            yield i, row
+    finally:
+        text_stream.detach()
+
+
+def _iter_json(stream, chunk_size: int = 64 * 1024):
+    """
+    Yields objects from either NDJSON or a top-level JSON array without
+    loading the whole upload: decodes one object at a time from a buffer.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8-sig")()
+    buf = ""
+    pos = 0
+    n = 0
+    eof = False
+
+    while True:
+        # skip separators between objects
+        while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                return
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk or b"", final=eof)
+            pos = 0
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise MenuImportError(n + 1, "invalid JSON")
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk or b"", final=eof)
+            pos = 0
+            continue
+        n += 1
+        pos = end
+        if not isinstance(obj, dict):
+            raise MenuImportError(n, "expected an object per menu item")
+        yield n, obj
+
+
+def iter_upload(stream, fmt: str):
+    fmt = (fmt or "").lower()
+    if fmt == "csv":
+        return _iter_csv(stream)
+    if fmt in ("json", "ndjson", "jsonl"):
+        return _iter_json(stream)
+    raise MenuImportError(0, f"unsupported format {fmt!r} (use csv or json)")
+
+
+def normalise_row(line: int, raw: dict) -> dict:
+    def s(key):
+        v = raw.get(key)
+        return "" if v is None else str(v).strip()
+
+    name = s("name")
+    if not name:
+        raise MenuImportError(line, "name is required")
+    if len(name) > MAX_NAME:
+        raise MenuImportError(line, f"name longer than {MAX_NAME} characters")
+
+    try:
+        price = Decimal(s("price"))
+        if not price.is_finite():         # NaN / Infinity parse, but compare and store badly
+            raise InvalidOperation
+        price = price.quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise MenuImportError(line, f"invalid price {raw.get('price')!r}")
+    if price < 0:
+        raise MenuImportError(line, "price must not be negative")
+    if price > MAX_PRICE:
+        raise MenuImportError(line, f"price above {MAX_PRICE}")
+
+    item_id = None
+    if s("id"):
+        if not s("id").isdigit():
+            raise MenuImportError(line, f"invalid id {raw.get('id')!r}")
+        item_id = int(s("id"))
+
+    description = s("description")
+    category = (s("category") or "other").lower()
+    image_url = s("image_url") or None
+    if len(description) > MAX_DESCRIPTION:
+        raise MenuImportError(line, f"description longer than {MAX_DESCRIPTION} characters")
+    if len(category) > MAX_CATEGORY:
+        raise MenuImportError(line, f"category longer than {MAX_CATEGORY} characters")
+    if image_url and (len(image_url) > MAX_IMAGE_URL or not image_url.startswith(("http://", "https://"))):
+        raise MenuImportError(line, "image_url must be an http(s) URL")
+
+    return {
+        "line": line,
+        "id": item_id,
+        "name": name,
+        "description": description,
+        "price": price,
+        "category": category,
+        "image_url": image_url,
+    }
+
+
+def _comparable(row: dict) -> tuple:
+    return (
+        row["name"],
+        row["description"] or "",
+        Decimal(str(row["price"])).quantize(Decimal("0.01")),
+        (row["category"] or "other").lower(),
+        row["image_url"] or None,
+    )
+
+
+def diff_menu(current_rows, incoming):
+    """
+    current_rows: existing menu rows (mappings with FIELDS)
+    incoming: normalised upload rows
+    Rows match on id when given, else on name (case-insensitive).
+    Returns (inserts, updates, unchanged_ids, seen_ids).
+    Two lines for the same item (same id, or same name for rows without
+    one) raise MenuImportError: the database would refuse the second
+    insert, and for an update it isn't clear which line was meant.
+    """
+    by_id = {int(r["id"]): r for r in current_rows}
+    by_name = {r["name"].strip().lower(): int(r["id"]) for r in current_rows}
+
+    inserts, updates, unchanged, seen = [], [], [], set()
+    lines = {}   # ("id", n) / ("name", s) -> first line
+    for row in incoming:
+        key = ("id", row["id"]) if row["id"] is not None else ("name", row["name"].lower())
+        iid = row["id"]
+        if iid is None:
+            iid = by_name.get(row["name"].lower())
+            if iid is not None:
+                key = ("id", iid)
+        if key in lines:
+            what = f"id {key[1]}" if key[0] == "id" else f"name {row['name']!r}"
+            raise MenuImportError(row["line"], f"{what} already on line {lines[key]}")
+        lines[key] = row["line"]
+
+        if iid is None or iid not in by_id:
+            inserts.append(row)
+            continue
+        seen.add(iid)
+        if _comparable(by_id[iid]) == _comparable(row):
+            unchanged.append(iid)
+        else:
+            updates.append({**row, "id": iid})
+    return inserts, updates, unchanged, seen
+
+
+def write_csv(rows):
+    """Yields CSV text chunks for an iterable of menu rows."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(FIELDS)
+    for r in rows:
+        writer.writerow([r["id"], r["name"], r["description"], f"{Decimal(str(r['price'])):.2f}",
+                         r["category"], r["image_url"] or ""])
+        if out.tell() > 16 * 1024:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
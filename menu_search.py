@@ -0,0 +1,161 @@
+"""
+In-memory inverted index for menu search.
+
+Built from menu_items rows (name / description / category) and rebuilt by
+main.py whenever the menu version changes. Supports exact, prefix and
+fuzzy (1 edit) matching. Rating boosts are not part of the index (reviews
+come in far more often than the menu changes): search() takes them per
+query, see rating_boosts().
+"""
+import bisect
+import math
+import re
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# how much a hit in each field counts towards the score
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+
+# how much each kind of match counts (exact > prefix > fuzzy)
+EXACT, PREFIX, FUZZY = 1.0, 0.7, 0.5
+
+# fuzzy matching on very short words just produces noise
+MIN_FUZZY_LEN = 4
+
+
+def tokenize(text: str | None) -> list[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def _deletes(token: str) -> set[str]:
+    # all strings one deletion away (symmetric delete trick for edit distance 1)
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        # adjacent transposition ("piza" vs "pzia")
+        return (
+            len(diffs) == 2
+            and diffs[1] == diffs[0] + 1
+            and a[diffs[0]] == b[diffs[1]]
+            and a[diffs[1]] == b[diffs[0]]
+        )
+    if la > lb:
+        a, b = b, a
+    # b is one longer than a: b minus one char must equal a
+    return a in _deletes(b)
+
+
+def rating_boosts(stats: dict | None) -> dict:
+    """
+    {item_id: {"avg_rating", "review_count"}} -> {item_id: score multiplier}
+    for MenuSearchIndex.search().
+    """
+    boosts = {}
+    for iid, s in (stats or {}).items():
+        try:
+            avg = float(s.get("avg_rating") or 0.0)
+            cnt = int(s.get("review_count") or 0)
+        except (TypeError, ValueError):
+            continue
+        # good ratings with more reviews float up, but never dominate text relevance
+        boosts[int(iid)] = 1.0 + (avg / 5.0) * math.log1p(cnt) * 0.1
+    return boosts
+
+
+class MenuSearchIndex:
+    def __init__(self, items):
+        """
+        items: iterable of dicts/rows with id, name, description, category (+ any display fields)
+        """
+        self.items = {}
+        self.postings = {}      # token -> {item_id: weight}
+        self.delete_map = {}    # deleted variant -> {token, ...}
+
+        for it in items:
+            item = dict(it) if not isinstance(it, dict) else it
+            iid = int(item["id"])
+            self.items[iid] = item
+            for field, weight in FIELD_WEIGHTS.items():
+                for tok in tokenize(item.get(field)):
+                    per_item = self.postings.setdefault(tok, {})
+                    per_item[iid] = max(per_item.get(iid, 0.0), weight)
+
+        self.vocab = sorted(self.postings)
+        for tok in self.vocab:
+            if len(tok) >= MIN_FUZZY_LEN - 1:
+                for d in _deletes(tok):
+                    self.delete_map.setdefault(d, set()).add(tok)
+
+    def __len__(self):
+        return len(self.items)
+
+    def _prefix_tokens(self, prefix: str):
+        i = bisect.bisect_left(self.vocab, prefix)
+        while i < len(self.vocab) and self.vocab[i].startswith(prefix):
+            yield self.vocab[i]
+            i += 1
+
+    def _fuzzy_tokens(self, tok: str):
+        if len(tok) < MIN_FUZZY_LEN:
+            return set()
+        candidates = set(self.delete_map.get(tok, ()))
+        if tok in self.postings:
+            candidates.add(tok)
+        for d in _deletes(tok):
+            if d in self.postings:
+                candidates.add(d)
+            candidates.update(self.delete_map.get(d, ()))
+        return {c for c in candidates if _within_one_edit(tok, c)}
+
+    def _match_token(self, tok: str) -> dict:
+        """Returns {item_id: score} for one query token (best match kind per item)."""
+        scores = {}
+
+        def add(token, factor):
+            for iid, weight in self.postings.get(token, {}).items():
+                s = weight * factor
+                if s > scores.get(iid, 0.0):
+                    scores[iid] = s
+
+        add(tok, EXACT)
+        for t in self._prefix_tokens(tok):
+            if t != tok:
+                add(t, PREFIX)
+        if not scores:
+            for t in self._fuzzy_tokens(tok):
+                add(t, FUZZY)
+        return scores
+
+    def search(self, query: str, limit: int = 20, boosts: dict | None = None) -> list[dict]:
+        """boosts: {item_id: multiplier} from rating_boosts()."""
+        boosts = boosts or {}
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        total = None
+        for tok in tokens:
+            scores = self._match_token(tok)
+            if total is None:
+                total = scores
+            else:
+                # every query word has to match something (AND)
+                total = {iid: total[iid] + s for iid, s in scores.items() if iid in total}
+            if not total:
+                return []
+
+        ranked = sorted(
+            ((score * boosts.get(iid, 1.0), iid) for iid, score in total.items()),
+            key=lambda x: (-x[0], x[1]),
+        )
+        return [{**self.items[iid], "score": round(score, 4)} for score, iid in ranked[:limit]]
@@ -0,0 +1,115 @@
+"""
+Archival of finished orders: orders/order_items -> orders_archive/order_items_archive.
+
+Orders that are completed or cancelled and older than the cutoff are moved
+in batches. Each batch is one transaction (copy items, copy orders, delete
+items, delete orders), so a crash or deadline between batches loses
+nothing and the next run just carries on with whatever is still hot:
+archive_orders() is resumable by construction and safe to run from cron,
+the admin page and the CLI at the same time (the batch select locks its
+rows on MySQL).
+
+Archive tables have no foreign keys and no auto-increment: ids are kept,
+so order numbers customers have seen stay valid.
+"""
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, text
+
+from sales import utc_naive
+
+ARCHIVABLE_STATUSES = ("completed", "cancelled")
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS orders_archive (
+        id INT PRIMARY KEY,
+        user_id INT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        total_price DECIMAL(10,2) NOT NULL,
+        created_at DATETIME NULL,
+        archived_at DATETIME NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_items_archive (
+        id INT PRIMARY KEY,
+        order_id INT NOT NULL,
+        menu_item_id INT NOT NULL,
+        qty INT NOT NULL,
+        unit_price DECIMAL(10,2) NOT NULL
+    )
+    """,
+]
+
+# (table, index name, columns), created by init_db
+INDEXES = [
+    ("orders", "idx_orders_created", "created_at"),
+    ("orders", "idx_orders_user_created", "user_id, created_at"),
+    ("orders_archive", "idx_orders_archive_user_created", "user_id, created_at"),
+    ("order_items_archive", "idx_order_items_archive_order", "order_id"),
+]
+
+# hot / cold (orders table, order_items table), for jobs that read all history
+ORDER_SOURCES = (("orders", "order_items"), ("orders_archive", "order_items_archive"))
+
+
+def archive_cutoff(days: int, now=None) -> datetime:
+    return utc_naive(now) - timedelta(days=days)
+
+
+def archive_batch(conn, cutoff: datetime, batch_size: int) -> int:
+    """Moves up to batch_size finished orders older than cutoff. Returns how many."""
+    lock = " FOR UPDATE" if conn.dialect.name == "mysql" else ""
+    ids = conn.execute(
+        text(f"""
+            SELECT id FROM orders
+            WHERE created_at < :cutoff AND status IN :statuses
+            ORDER BY created_at, id
+            LIMIT :n{lock}
+        """).bindparams(bindparam("statuses", expanding=True)),
+        {"cutoff": cutoff, "statuses": list(ARCHIVABLE_STATUSES), "n": int(batch_size)},
+    ).scalars().all()
+    if not ids:
+        return 0
+
+    params = {"ids": list(ids)}
+
+    def run(sql):
+        conn.execute(text(sql).bindparams(bindparam("ids", expanding=True)), params)
+
+    run("""
+        INSERT INTO order_items_archive (id, order_id, menu_item_id, qty, unit_price)
+        SELECT id, order_id, menu_item_id, qty, unit_price FROM order_items WHERE order_id IN :ids
+    """)
+    conn.execute(
+        text("""
+            INSERT INTO orders_archive (id, user_id, status, total_price, created_at, archived_at)
+            SELECT id, user_id, status, total_price, created_at, :now FROM orders WHERE id IN :ids
+        """).bindparams(bindparam("ids", expanding=True)),
+        {**params, "now": utc_naive()},
+    )
+    run("DELETE FROM order_items WHERE order_id IN :ids")
+    run("DELETE FROM orders WHERE id IN :ids")
+    return len(ids)
+
+
+def archive_orders(engine, cutoff: datetime, batch_size: int = 500,
+                   max_batches: int | None = None, deadline: float | None = None) -> dict:
+    """
+    Runs batches until nothing is left, max_batches have run or the
+    time.monotonic() deadline has passed. done=False means call again.
+    """
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        with engine.begin() as conn:
+            moved = archive_batch(conn, cutoff, batch_size)
+        if moved:
+            batches += 1
+            archived += moved
+        if moved < batch_size:
+            return {"archived": archived, "batches": batches, "done": True}
+    return {"archived": archived, "batches": batches, "done": False}
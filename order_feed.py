@@ -0,0 +1,89 @@
+"""
+In-process change feed for orders (backs the /admin/orders/stream SSE endpoint).
+
+checkout() and the admin status routes publish compact events here; every
+connected kitchen/admin screen reads from the same ring buffer instead of
+polling the database. Buffer ids only mean something inside this process,
+so they are never sent to browsers: the Last-Event-ID a stream hands out is
+a cursor on orders.updated_at (see order_cursor), which any worker on any
+instance can resume from with one indexed query.
+"""
+import json
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+CURSOR_FORMAT = "%Y%m%d%H%M%S"
+
+
+class OrderFeed:
+    def __init__(self, maxlen: int = 500):
+        self._events = deque(maxlen=maxlen)   # (id, type, data)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, event_type: str, data: dict) -> int:
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, event_type, data))
+            self._cond.notify_all()
+            return self._last_id
+
+    def since(self, last_id: int):
+        """
+        Returns (events, reset). reset=True means the client's position is no
+        longer in the buffer (too old, or from before a restart) and it should
+        reload the full page instead of applying deltas.
+        """
+        with self._cond:
+            return self._since_locked(last_id)
+
+    def _since_locked(self, last_id: int):
+        if last_id > self._last_id:
+            return [], True
+        if not self._events or last_id >= self._last_id:
+            return [], False
+        oldest = self._events[0][0]
+        if last_id < oldest - 1:
+            return list(self._events), True
+        return [e for e in self._events if e[0] > last_id], False
+
+    def wait(self, last_id: int, timeout: float):
+        """Blocks up to `timeout` seconds for events newer than last_id."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id != last_id, timeout=timeout)
+            return self._since_locked(last_id)
+
+
+def order_cursor(updated_at) -> str:
+    """orders.updated_at (datetime from MySQL, text from SQLite) -> event id."""
+    if isinstance(updated_at, str):
+        updated_at = datetime.fromisoformat(updated_at[:19])
+    return updated_at.strftime(CURSOR_FORMAT)
+
+
+def parse_order_cursor(raw: str, grace_seconds: float = 0) -> str | None:
+    """
+    Event id -> the updated_at bound to resume from, moved back by
+    grace_seconds: a transaction that stamped its row earlier may commit after
+    one we already streamed. None for ids that aren't cursors (e.g. the
+    per-process numbers streams used to send).
+    """
+    try:
+        at = datetime.strptime(raw.strip(), CURSOR_FORMAT)
+    except (AttributeError, ValueError):
+        return None
+    return (at - timedelta(seconds=grace_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def format_sse(event_id: int | None, event_type: str, data) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":"), default=str))
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,270 @@
+"""
+Write-behind order intake.
+
+When enabled, checkout() validates + prices the cart, appends the order to a
+local SQLite journal and acknowledges straight away with a provisional
+reference. IntakeWorker drains the journal into MySQL in batches, so an
+opening-time burst is absorbed here instead of holding Cloud SQL pool
+connections per request.
+
+Entry lifecycle: received -> claimed -> persisted | failed
+(claimed entries whose worker died are put back after CLAIM_TIMEOUT; the
+drain writes every entry under a checkout key, so a re-claimed entry that
+had already been written maps back to its order instead of a second one).
+
+The journal is only as durable as the disk under `path`. On App Engine
+standard the only writable place is /tmp, which is memory-backed and per
+instance: a shutdown loses whatever hasn't been drained, and no other
+instance can drain it. Keep ORDER_INTAKE_ENABLED off there; it is meant for
+hosts with a persistent local disk.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """The journal has max_pending entries waiting; caller should back off."""
+
+
+CLAIM_TIMEOUT = 120  # seconds before a claimed-but-unfinished entry is retried
+
+
+class OrderIntakeQueue:
+    def __init__(self, path: str, max_pending: int = 500):
+        self.path = path
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # an acknowledged order must survive a crash
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS intake (
+                ref TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                idem_key TEXT UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'received',
+                claimed_by TEXT,
+                claimed_at REAL,
+                order_id INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_intake_status ON intake (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_intake_user ON intake (user_id, status);
+        """)
+
+    def _tx(self, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so claims are atomic
+        # across gunicorn workers sharing the same file
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._conn)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return out
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM intake WHERE status IN ('received', 'claimed')"
+            ).fetchone()[0]
+
+    def enqueue(self, user_id: int, payload: dict, idem_key: str | None = None) -> str:
+        """Returns the provisional reference (the existing one for a repeated idem_key)."""
+        def run(conn):
+            if idem_key:
+                row = conn.execute("SELECT ref FROM intake WHERE idem_key = ?", (idem_key,)).fetchone()
+                if row:
+                    return row["ref"]
+            depth = conn.execute(
+                "SELECT COUNT(*) FROM intake WHERE status IN ('received', 'claimed')"
+            ).fetchone()[0]
+            if depth >= self.max_pending:
+                raise QueueFull(depth)
+            ref = "R-" + uuid.uuid4().hex[:12].upper()
+            now = time.time()
+            conn.execute(
+                """INSERT INTO intake (ref, user_id, idem_key, payload, status, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, 'received', ?, ?)""",
+                (ref, int(user_id), idem_key, json.dumps(payload), now, now),
+            )
+            return ref
+        return self._tx(run)
+
+    def claim_batch(self, limit: int, worker_id: str) -> list[dict]:
+        def run(conn):
+            now = time.time()
+            conn.execute(
+                """UPDATE intake SET status = 'received', claimed_by = NULL
+                   WHERE status = 'claimed' AND claimed_at < ?""",
+                (now - CLAIM_TIMEOUT,),
+            )
+            conn.execute(
+                """UPDATE intake SET status = 'claimed', claimed_by = ?, claimed_at = ?, updated_at = ?
+                   WHERE ref IN (
+                       SELECT ref FROM intake WHERE status = 'received'
+                       ORDER BY created_at LIMIT ?
+                   )""",
+                (worker_id, now, now, int(limit)),
+            )
+            rows = conn.execute(
+                """SELECT ref, user_id, idem_key, payload FROM intake
+                   WHERE status = 'claimed' AND claimed_by = ? ORDER BY created_at""",
+                (worker_id,),
+            ).fetchall()
+            return [
+                {"ref": r["ref"], "user_id": r["user_id"], "idem_key": r["idem_key"],
+                 "payload": json.loads(r["payload"])}
+                for r in rows
+            ]
+        return self._tx(run)
+
+    def release(self, refs):
+        """Puts claimed entries back (e.g. the DB was unreachable)."""
+        def run(conn):
+            conn.executemany(
+                "UPDATE intake SET status = 'received', claimed_by = NULL WHERE ref = ? AND status = 'claimed'",
+                [(r,) for r in refs],
+            )
+        self._tx(run)
+
+    def mark_persisted(self, order_ids: dict):
+        def run(conn):
+            now = time.time()
+            conn.executemany(
+                "UPDATE intake SET status = 'persisted', order_id = ?, updated_at = ? WHERE ref = ?",
+                [(int(oid), now, ref) for ref, oid in order_ids.items()],
+            )
+        self._tx(run)
+
+    def mark_failed(self, errors: dict):
+        def run(conn):
+            now = time.time()
+            conn.executemany(
+                "UPDATE intake SET status = 'failed', error = ?, updated_at = ? WHERE ref = ?",
+                [(str(err)[:500], now, ref) for ref, err in errors.items()],
+            )
+        self._tx(run)
+
+    def lookup(self, ref: str) -> dict | None:
+        with self._lock:
+            r = self._conn.execute(
+                "SELECT ref, user_id, status, order_id, error, payload, created_at FROM intake WHERE ref = ?",
+                (ref,),
+            ).fetchone()
+        return self._public(r) if r else None
+
+    def find_by_key(self, idem_key: str) -> dict | None:
+        with self._lock:
+            r = self._conn.execute(
+                "SELECT ref, user_id, status, order_id, error, payload, created_at FROM intake WHERE idem_key = ?",
+                (idem_key,),
+            ).fetchone()
+        return self._public(r) if r else None
+
+    def pending_for_user(self, user_id: int) -> list[dict]:
+        """Orders acknowledged to this user but not yet written to MySQL (or failed)."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT ref, user_id, status, order_id, error, payload, created_at FROM intake
+                   WHERE user_id = ? AND status IN ('received', 'claimed', 'failed')
+                   ORDER BY created_at DESC""",
+                (int(user_id),),
+            ).fetchall()
+        return [self._public(r) for r in rows]
+
+    def purge(self, older_than_seconds: float) -> int:
+        """Drops persisted entries once nobody needs the reference any more."""
+        def run(conn):
+            cur = conn.execute(
+                "DELETE FROM intake WHERE status = 'persisted' AND updated_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cur.rowcount
+        return self._tx(run)
+
+    @staticmethod
+    def _public(r) -> dict:
+        payload = json.loads(r["payload"])
+        return {
+            "ref": r["ref"],
+            "user_id": r["user_id"],
+            # claimed is an internal detail, to the customer it's still "received"
+            "status": "received" if r["status"] == "claimed" else r["status"],
+            "order_id": r["order_id"],
+            "error": r["error"],
+            "total": payload.get("total"),
+            "lines": payload.get("lines", []),
+            "created_at": r["created_at"],
+        }
+
+
+class IntakeWorker(threading.Thread):
+    """
+    Background drainer. persist_batch(entries) writes a batch to MySQL and
+    returns (persisted {ref: order_id}, failed {ref: error}); if it raises,
+    the whole batch is released and retried after a backoff.
+    """
+
+    def __init__(self, queue: OrderIntakeQueue, persist_batch, batch_size: int = 50,
+                 idle_sleep: float = 0.5, logger=None):
+        super().__init__(name="order-intake", daemon=True)
+        self.queue = queue
+        self.persist_batch = persist_batch
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.logger = logger
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def drain_once(self) -> int:
+        batch = self.queue.claim_batch(self.batch_size, self.worker_id)
+        if not batch:
+            return 0
+        try:
+            persisted, failed = self.persist_batch(batch)
+        except Exception:
+            self.queue.release([e["ref"] for e in batch])
+            raise
+        if persisted:
+            self.queue.mark_persisted(persisted)
+        if failed:
+            self.queue.mark_failed(failed)
+        return len(batch)
+
+    def run(self):
+        backoff = self.idle_sleep
+        while not self._stopping.is_set():
+            try:
+                n = self.drain_once()
+                backoff = self.idle_sleep
+            except Exception as e:
+                n = 0
+                backoff = min(backoff * 2, 30)
+                if self.logger:
+                    self.logger.exception("order intake drain failed: %s", e)
+            if n < self.batch_size:
+                self._wake.wait(backoff)
+                self._wake.clear()
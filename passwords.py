@@ -0,0 +1,98 @@
+"""
+Password hashing off the request thread.
+
+scrypt/pbkdf2 take hundreds of milliseconds of CPU and hold the GIL, so a
+burst of logins would stall every other request on the worker. PasswordHasher
+runs them in a small process pool instead; the request thread just waits on
+the future (GIL released). Submissions are bounded: once `workers + max_queue`
+hashes are in flight, callers get HasherBusy straight away rather than
+queueing behind a login storm.
+
+workers=0 hashes inline (tests, tiny instances).
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+
+class HasherBusy(Exception):
+    """Too many hashes queued; the caller should answer 503 / retry later."""
+
+
+def _hash_prefix(stored: str) -> str:
+    return (stored or "").split("$", 1)[0]
+
+
+class PasswordHasher:
+    def __init__(self, method: str = DEFAULT_METHOD, workers: int = 2, max_queue: int = 16,
+                 timeout: float = 10.0):
+        self.method = method
+        self.workers = max(0, int(workers))
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, int(max_queue))) if self.workers else None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._canonical = None
+
+    # -- pool --
+    def _executor(self) -> ProcessPoolExecutor:
+        # created lazily so each gunicorn worker gets its own (after fork);
+        # spawn, because forking a threaded process is unsafe
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            fut = self._executor().submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset_pool()
+            raise HasherBusy()
+        fut.add_done_callback(lambda _: self._slots.release())
+        try:
+            return fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy()
+        except BrokenProcessPool:
+            self._reset_pool()
+            raise HasherBusy()
+
+    def _reset_pool(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._reset_pool()
+
+    # -- API --
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored: str, password: str) -> bool:
+        return bool(self._run(check_password_hash, stored, password))
+
+    def needs_rehash(self, stored: str) -> bool:
+        """True when `stored` was made with other parameters than self.method."""
+        if self._canonical is None:
+            # werkzeug fills in defaults ("scrypt" -> "scrypt:32768:8:1"); learn the
+            # exact prefix it writes from one throwaway hash (once per process)
+            self._canonical = _hash_prefix(generate_password_hash("", self.method))
+        return _hash_prefix(stored) != self._canonical
@@ -0,0 +1,268 @@
+"""
+Named SQL statements, built once at import.
+
+Routes used to build the same text(...).bindparams(...) on every request
+(menu lookups by id in three places, the order lines join in two). Each
+statement is now registered here under a name and executed through the
+registry:
+
+    rows = sql.execute(conn, "menu.by_ids", {"ids": ids}).fetchall()
+
+A prebuilt clause keeps its memoised cache key, so SQLAlchemy's compiled
+cache (per engine, query_cache_size) serves it without re-walking the
+statement. The registry also counts calls, errors and time per name, logs
+anything slower than slow_ms by name, and /admin/metrics reports the
+counters.
+
+Statements registered with for_update=True get " FOR UPDATE" on MySQL
+(SQLite locks the whole database anyway). Where the dialects disagree
+(upserts), mysql= gives the MySQL text and sql the SQLite one.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import bindparam, text
+
+log = logging.getLogger(__name__)
+
+
+class Statement:
+    __slots__ = ("name", "clause", "mysql", "locked", "calls", "errors", "total_ms", "max_ms")
+
+    def __init__(self, name: str, sql: str, expanding=(), for_update: bool = False, mysql: str | None = None):
+        self.name = name
+        self.clause = self._build(sql, expanding)
+        self.mysql = self._build(mysql, expanding) if mysql else None
+        self.locked = self._build((mysql or sql) + " FOR UPDATE", expanding) if for_update else None
+        self.calls = self.errors = 0
+        self.total_ms = self.max_ms = 0.0
+
+    @staticmethod
+    def _build(sql, expanding):
+        clause = text(sql)
+        if expanding:
+            clause = clause.bindparams(*(bindparam(p, expanding=True) for p in expanding))
+        return clause
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else None,
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class QueryRegistry:
+    def __init__(self, slow_ms: float = 200.0):
+        self.slow_ms = slow_ms
+        self._stmts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, sql: str, expanding=(), for_update: bool = False, mysql: str | None = None):
+        if name in self._stmts:
+            raise ValueError(f"statement {name!r} registered twice")
+        self._stmts[name] = Statement(name, sql.strip(), expanding, for_update, mysql and mysql.strip())
+
+    def __getitem__(self, name: str) -> Statement:
+        return self._stmts[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stmts
+
+    def execute(self, conn, name: str, params=None):
+        stmt = self._stmts[name]
+        clause = stmt.clause
+        if conn.dialect.name == "mysql":
+            clause = stmt.locked if stmt.locked is not None else stmt.mysql if stmt.mysql is not None else clause
+        started = time.perf_counter()
+        try:
+            return conn.execute(clause, params) if params is not None else conn.execute(clause)
+        except Exception:
+            with self._lock:
+                stmt.errors += 1
+            raise
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                stmt.calls += 1
+                stmt.total_ms += ms
+                if ms > stmt.max_ms:
+                    stmt.max_ms = ms
+            if ms >= self.slow_ms:
+                log.warning("slow query %s: %.1f ms", name, ms)
+
+    def stats(self) -> list[dict]:
+        """Counters per statement, most total time first."""
+        with self._lock:
+            out = [s.as_dict() for s in self._stmts.values()]
+        return sorted(out, key=lambda s: (-s["total_ms"], s["name"]))
+
+    def reset(self):
+        with self._lock:
+            for s in self._stmts.values():
+                s.calls = s.errors = 0
+                s.total_ms = s.max_ms = 0.0
+
+
+def counter_upsert_sql(dialect: str, table: str, keys: tuple, counters: tuple) -> str:
+    """INSERT that adds to the counter columns when the key already exists."""
+    cols = keys + counters
+    values = ", ".join(f":{c}" for c in cols)
+    if dialect == "mysql":
+        updates = ", ".join(f"{c} = {c} + VALUES({c})" for c in counters)
+        return f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({values}) ON DUPLICATE KEY UPDATE {updates}"
+    # SQLite / Postgres
+    updates = ", ".join(f"{c} = {table}.{c} + excluded.{c}" for c in counters)
+    return (f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({values}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}")
+
+
+def upsert_counters(conn, table: str, keys: tuple, counters: tuple) -> str:
+    """counter_upsert_sql() for the connection's dialect (rollups, item_pairs)."""
+    return counter_upsert_sql(conn.dialect.name, table, keys, counters)
+
+
+sql = QueryRegistry()
+
+# -- users --
+sql.add("users.by_username", "SELECT id, username, password_hash, role FROM users WHERE username = :u")
+sql.add("users.insert", "INSERT INTO users (username, password_hash, role) VALUES (:u, :ph, :role)")
+sql.add("users.rehash", "UPDATE users SET password_hash = :ph WHERE id = :id AND password_hash = :old")
+
+# -- menu --
+sql.add("menu.names", "SELECT id, name FROM menu_items ORDER BY id ASC")
+sql.add("menu.by_ids", "SELECT id, name, price, stock FROM menu_items WHERE id IN :ids", expanding=("ids",))
+sql.add("menu.all", """
+    SELECT id, name, description, price, category, image_url, stock
+    FROM menu_items
+    ORDER BY category ASC, id ASC
+""")
+sql.add("menu.page", """
+    SELECT id, name, description, price, category, image_url, stock
+    FROM menu_items
+    ORDER BY id ASC
+    LIMIT :lim
+""")
+# /api/menu: full list, or the delta since a menu version
+sql.add("menu.api_full", """
+    SELECT id, name, description, price, category, image_url, stock
+    FROM menu_items
+    ORDER BY category, name
+""")
+sql.add("menu.changed_since", """
+    SELECT id, name, description, price, category, image_url, stock
+    FROM menu_items
+    WHERE row_version > :since
+    ORDER BY category, name
+""")
+sql.add("menu.deleted_since", "SELECT menu_item_id FROM menu_item_tombstones WHERE row_version > :since")
+# menu writes: a new menu version, the changed rows stamped with it
+sql.add("menu_version.next", "UPDATE menu_version SET version = version + 1 WHERE id = 1")
+sql.add("menu_version.current", "SELECT version FROM menu_version WHERE id = 1")
+sql.add("menu.touch", "UPDATE menu_items SET row_version = :v, updated_at = :now WHERE id IN :ids",
+        expanding=("ids",))
+sql.add("menu.delete", "DELETE FROM menu_items WHERE id IN :ids", expanding=("ids",))
+sql.add("menu_tombstones.clear", "DELETE FROM menu_item_tombstones WHERE menu_item_id IN :ids",
+        expanding=("ids",))
+sql.add("menu_tombstones.insert", """
+    INSERT INTO menu_item_tombstones (menu_item_id, row_version, deleted_at)
+    VALUES (:id, :v, :now)
+""")
+
+# -- stock (see inventory.py) --
+sql.add("stock.reserve", """
+    UPDATE menu_items SET stock = stock - :q
+    WHERE id = :id AND (stock IS NULL OR stock >= :q)
+""")
+sql.add("stock.levels", "SELECT id, name, stock FROM menu_items WHERE id IN :ids", expanding=("ids",))
+sql.add("stock.ordered", """
+    SELECT menu_item_id, SUM(qty) AS qty FROM order_items
+    WHERE order_id IN :oids
+    GROUP BY menu_item_id
+""", expanding=("oids",))
+sql.add("stock.release", "UPDATE menu_items SET stock = stock + :q WHERE id = :id AND stock IS NOT NULL")
+
+# -- orders --
+sql.add("orders.insert", """
+    INSERT INTO orders (user_id, status, total_price, created_at)
+    VALUES (:uid, 'pending', :total, :created_at)
+""")
+sql.add("order_items.insert", """
+    INSERT INTO order_items (order_id, menu_item_id, qty, unit_price)
+    VALUES (:oid, :mid, :qty, :unit)
+""")
+sql.add("orders.recent", """
+    SELECT o.id, o.status, o.total_price, o.created_at, u.username
+    FROM orders o
+    JOIN users u ON u.id = o.user_id
+    ORDER BY o.created_at DESC
+    LIMIT :limit
+""")
+# the order stream's resume cursor (see order_feed.py)
+sql.add("orders.cursor", "SELECT MAX(updated_at) FROM orders")
+sql.add("orders.changed_since", """
+    SELECT o.id, o.status, o.total_price, o.created_at, o.updated_at, u.username
+    FROM orders o
+    JOIN users u ON u.id = o.user_id
+    WHERE o.updated_at >= :since
+    ORDER BY o.updated_at, o.id
+    LIMIT :limit
+""")
+sql.add("orders.statuses", "SELECT id, status FROM orders WHERE id IN :ids", expanding=("ids",), for_update=True)
+sql.add("orders.move_status", """
+    UPDATE orders SET status = :s, updated_at = CURRENT_TIMESTAMP
+    WHERE id IN :ids AND status IN :from_statuses
+""", expanding=("ids", "from_statuses"))
+
+# a customer's orders and the order lines join, hot and archived
+for _suffix, _orders in (("", "orders"), (".archive", "orders_archive")):
+    sql.add("orders.by_user" + _suffix, f"""
+        SELECT id, status, total_price, created_at
+        FROM {_orders}
+        WHERE user_id = :uid
+        ORDER BY created_at DESC
+    """)
+
+# hot order_items has a foreign key to menu_items; the archive doesn't, so an
+# item pruned by a menu import keeps its archived lines (as "Item <id>")
+sql.add("order_lines", """
+    SELECT oi.order_id, oi.qty, oi.unit_price, mi.name
+    FROM order_items oi
+    JOIN menu_items mi ON mi.id = oi.menu_item_id
+    WHERE oi.order_id IN :oids
+    ORDER BY oi.order_id DESC, mi.name ASC
+""", expanding=("oids",))
+_ARCHIVE_LINES = """
+    SELECT oi.order_id, oi.qty, oi.unit_price, COALESCE(mi.name, {fallback}) AS name
+    FROM order_items_archive oi
+    LEFT JOIN menu_items mi ON mi.id = oi.menu_item_id
+    WHERE oi.order_id IN :oids
+    ORDER BY oi.order_id DESC, name ASC
+"""
+sql.add("order_lines.archive", _ARCHIVE_LINES.format(fallback="'Item ' || oi.menu_item_id"),
+        mysql=_ARCHIVE_LINES.format(fallback="CONCAT('Item ', oi.menu_item_id)"),
+        expanding=("oids",))
+
+# -- checkout idempotency keys --
+sql.add("checkout_keys.find", "SELECT user_id, order_id FROM checkout_keys WHERE idem_key = :k")
+sql.add("checkout_keys.set_order", "UPDATE checkout_keys SET order_id = :oid WHERE idem_key = :k")
+sql.add("checkout_keys.claim", """
+    INSERT INTO checkout_keys (idem_key, user_id, order_id, created_at, expires_at)
+    VALUES (:k, :uid, NULL, :now, :exp)
+""")
+sql.add("checkout_keys.sweep", "DELETE FROM checkout_keys WHERE expires_at < :now")
+
+# -- rollups queued with each order (see sales.py) --
+sql.add("rollup_pending.queue", "INSERT INTO rollup_pending (order_id, sales_sign, pairs) VALUES (:oid, :s, :p)")
+sql.add("rollup_pending.backlog", "SELECT COUNT(*) AS changes, MIN(id) AS oldest_id FROM rollup_pending")
+
+# -- cache bus (see cache_bus.py) --
+sql.add("cache_versions.bump",
+        counter_upsert_sql("sqlite", "cache_versions", ("namespace",), ("version",)),
+        mysql=counter_upsert_sql("mysql", "cache_versions", ("namespace",), ("version",)))
+sql.add("cache_versions.get", "SELECT version FROM cache_versions WHERE namespace = :ns")
+sql.add("cache_versions.all", "SELECT namespace, version FROM cache_versions")
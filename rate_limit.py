@@ -0,0 +1,126 @@
+"""
+In-process rate limiting and load shedding.
+
+TokenBucketLimiter keeps one (tokens, last_seen, full_at) tuple per key in a
+plain dict. A bucket that has refilled completely carries no information, so
+a periodic sweep drops it; max_keys caps memory if someone sprays addresses
+(least recently used keys go first). Limits are per process, which is fine
+for shielding a worker from one noisy client; they are not a global quota.
+
+Limits are written as "scope:count/seconds", comma separated, e.g.
+"ip:20/60,user:5/60" = 20 per minute per client IP and 5 per minute per user.
+"""
+import threading
+import time
+from collections import namedtuple
+
+Limit = namedtuple("Limit", "scope count period")
+
+SCOPES = ("ip", "user")
+
+
+def parse_limits(spec: str) -> tuple:
+    """'ip:20/60,user:5/60' -> (Limit('ip', 20, 60.0), Limit('user', 5, 60.0)). '' -> ()."""
+    limits = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        scope, _, rule = part.partition(":")
+        count, _, period = rule.partition("/")
+        scope = scope.strip().lower()
+        if scope not in SCOPES:
+            raise ValueError(f"unknown rate limit scope {scope!r} in {spec!r}")
+        limit = Limit(scope, int(count), float(period or 60))
+        if limit.count < 1 or limit.period <= 0:
+            raise ValueError(f"invalid rate limit {part!r}")
+        limits.append(limit)
+    return tuple(limits)
+
+
+class TokenBucketLimiter:
+    def __init__(self, max_keys: int = 100_000, sweep_interval: float = 60.0, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._clock = clock
+        self._buckets = {}          # key -> (tokens, last_seen, full_at)
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def hit(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """
+        Takes `cost` tokens from the bucket. Returns 0.0 when allowed,
+        otherwise the seconds until enough tokens will be available.
+        """
+        rate = limit.count / limit.period
+        burst = float(limit.count)
+        with self._lock:
+            now = self._clock()
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep_locked(now)
+
+            entry = self._buckets.pop(key, None)   # re-inserted below = moved to the LRU tail
+            if entry is None:
+                tokens = burst
+                if len(self._buckets) >= self.max_keys:
+                    self._sweep_locked(now)
+                    while len(self._buckets) >= self.max_keys:
+                        del self._buckets[next(iter(self._buckets))]
+            else:
+                tokens = min(burst, entry[0] + (now - entry[1]) * rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate
+
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return wait
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._sweep_locked(self._clock())
+
+    def _sweep_locked(self, now: float) -> int:
+        full = [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]
+        for k in full:
+            del self._buckets[k]
+        self._last_sweep = now
+        return len(full)
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._last_sweep = self._clock()
+
+
+class InFlight:
+    """Counts requests currently being handled by this process."""
+
+    def __init__(self):
+        self._n = 0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return self._n
+
+    def enter(self):
+        with self._lock:
+            self._n += 1
+
+    def try_enter(self, limit: int) -> bool:
+        """enter() unless `limit` are already in; False (and no count) if so."""
+        with self._lock:
+            if self._n >= limit:
+                return False
+            self._n += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self._n = max(0, self._n - 1)
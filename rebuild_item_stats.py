@@ -0,0 +1,272 @@
+"""
+Rebuild Firestore item_stats from the reviews collection.
+
+reviews() fires the review_stats Cloud Function and ignores failures, so
+item_stats can drift from the real reviews. This job recomputes it:
+
+  1. streams every review, paged on document id with start_after cursors
+  2. routes each (item_id, rating) to one of N workers by item_id, so each
+     item is aggregated by exactly one worker ([count, total] per item)
+  3. diffs against the current item_stats docs
+  4. unless --dry-run, each worker writes its partition in batched writes
+
+    python rebuild_item_stats.py --dry-run
+    python rebuild_item_stats.py --workers 8 --page-size 1000
+
+Runs against the emulator with FIRESTORE_EMULATOR_HOST=localhost:8080, and
+rebuild() takes any client with the Firestore API (tests pass a fake).
+Refuses to run with REVIEW_STORE=sql (or --store sql): that store keeps no
+item_stats and Firestore no longer has the reviews.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1.field_path import FieldPath
+
+MAX_BATCH = 500  # Firestore limit per batched write
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.scanned = 0
+        self.skipped = 0
+        self.pages = 0
+        self.items = 0
+        self.written = 0
+        self.batches = 0
+        self.scan_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        return {
+            "reviews_scanned": self.scanned,
+            "reviews_skipped": self.skipped,
+            "pages": self.pages,
+            "items": self.items,
+            "docs_written": self.written,
+            "batches": self.batches,
+            "scan_seconds": round(self.scan_seconds, 3),
+            "write_seconds": round(self.write_seconds, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "reviews_per_second": round(self.scanned / self.scan_seconds, 1) if self.scan_seconds else None,
+        }
+
+
+def scan_reviews(db, page_size: int, metrics: Metrics):
+    """Yields every review dict, one page (query) at a time."""
+    last = None
+    while True:
+        q = db.collection("reviews").order_by(FieldPath.document_id()).limit(page_size)
+        if last is not None:
+            q = q.start_after(last)
+        page = list(q.stream())
+        metrics.pages += 1
+        for snap in page:
+            yield snap.to_dict() or {}
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+
+class _Aggregator(threading.Thread):
+    """Owns one partition of item ids: item_id -> [count, total]."""
+
+    def __init__(self, n: int, maxsize: int):
+        super().__init__(name=f"item-stats-{n}", daemon=True)
+        self.inbox = queue.Queue(maxsize=maxsize)
+        self.totals = {}
+
+    def run(self):
+        while True:
+            batch = self.inbox.get()
+            if batch is None:
+                return
+            for item_id, rating in batch:
+                agg = self.totals.get(item_id)
+                if agg is None:
+                    self.totals[item_id] = [1, rating]
+                else:
+                    agg[0] += 1
+                    agg[1] += rating
+
+
+def _valid(review: dict):
+    try:
+        item_id = int(review.get("item_id"))
+        rating = float(review.get("rating"))
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= rating <= 5:
+        return None
+    return item_id, rating
+
+
+def compute_stats(db, workers: int, page_size: int, metrics: Metrics) -> list[dict]:
+    """Returns one {item_id: [count, total]} dict per worker partition."""
+    aggs = [_Aggregator(n, maxsize=4) for n in range(workers)]
+    for a in aggs:
+        a.start()
+
+    pending = [[] for _ in range(workers)]
+    t0 = time.monotonic()
+    try:
+        for review in scan_reviews(db, page_size, metrics):
+            metrics.scanned += 1
+            parsed = _valid(review)
+            if parsed is None:
+                metrics.skipped += 1
+                continue
+            part = parsed[0] % workers
+            pending[part].append(parsed)
+            if len(pending[part]) >= page_size:
+                aggs[part].inbox.put(pending[part])
+                pending[part] = []
+    finally:
+        for a, rest in zip(aggs, pending):
+            if rest:
+                a.inbox.put(rest)
+            a.inbox.put(None)
+        for a in aggs:
+            a.join()
+    metrics.scan_seconds = time.monotonic() - t0
+    return [a.totals for a in aggs]
+
+
+def load_current(db) -> dict:
+    current = {}
+    for snap in db.collection("item_stats").stream():
+        s = snap.to_dict() or {}
+        try:
+            current[int(s.get("item_id", snap.id))] = s
+        except (TypeError, ValueError):
+            continue
+    return current
+
+
+def _doc(item_id: int, count: int, total: float) -> dict:
+    return {
+        "item_id": str(item_id),   # same shape as the review_stats function writes
+        "review_count": count,
+        "total_rating": total,
+        "avg_rating": round(total / count, 3) if count else 0.0,
+    }
+
+
+def diff_stats(current: dict, partitions: list[dict]) -> dict:
+    """What a rebuild would change: added / changed / zeroed docs (+ unchanged count)."""
+    computed = {}
+    for part in partitions:
+        for iid, (count, total) in part.items():
+            computed[iid] = _doc(iid, count, total)
+
+    added, changed, zeroed, unchanged = [], [], [], 0
+    for iid, new in sorted(computed.items()):
+        old = current.get(iid)
+        if old is None:
+            added.append(new)
+        elif (int(old.get("review_count") or 0) != new["review_count"]
+              or abs(float(old.get("total_rating") or 0) - new["total_rating"]) > 1e-9):
+            changed.append({
+                "item_id": iid,
+                "old": {"review_count": old.get("review_count"), "total_rating": old.get("total_rating"),
+                        "avg_rating": old.get("avg_rating")},
+                "new": {k: new[k] for k in ("review_count", "total_rating", "avg_rating")},
+            })
+        else:
+            unchanged += 1
+    for iid, old in sorted(current.items()):
+        if iid not in computed and int(old.get("review_count") or 0):
+            zeroed.append(iid)   # stats exist but no reviews do any more
+    return {"added": added, "changed": changed, "zeroed": zeroed, "unchanged": unchanged}
+
+
+def write_stats(db, diff: dict, workers: int, batch_size: int, metrics: Metrics):
+    docs = list(diff["added"])
+    docs += [_doc(c["item_id"], c["new"]["review_count"], c["new"]["total_rating"]) for c in diff["changed"]]
+    docs += [_doc(iid, 0, 0.0) for iid in diff["zeroed"]]
+    if not docs:
+        return
+
+    batch_size = max(1, min(batch_size, MAX_BATCH))
+    parts = [[] for _ in range(workers)]
+    for d in docs:
+        parts[int(d["item_id"]) % workers].append(d)
+
+    lock = threading.Lock()
+    now = datetime.now(timezone.utc)
+
+    def write_partition(part):
+        col = db.collection("item_stats")
+        for i in range(0, len(part), batch_size):
+            batch = db.batch()
+            chunk = part[i:i + batch_size]
+            for d in chunk:
+                batch.set(col.document(d["item_id"]), {**d, "updated_at": now}, merge=True)
+            batch.commit()
+            with lock:
+                metrics.written += len(chunk)
+                metrics.batches += 1
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(workers) as ex:
+        list(ex.map(write_partition, [p for p in parts if p]))
+    metrics.write_seconds = time.monotonic() - t0
+
+
+def rebuild(db, workers: int = 4, page_size: int = 500, batch_size: int = 400,
+            dry_run: bool = False) -> dict:
+    workers = max(1, workers)
+    metrics = Metrics()
+    partitions = compute_stats(db, workers, page_size, metrics)
+    metrics.items = sum(len(p) for p in partitions)
+
+    diff = diff_stats(load_current(db), partitions)
+    if not dry_run:
+        write_stats(db, diff, workers, batch_size, metrics)
+
+    return {"dry_run": dry_run, "diff": diff, "metrics": metrics.as_dict()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute Firestore item_stats from reviews.")
+    parser.add_argument("--dry-run", action="store_true", help="report the diff, write nothing")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=400)
+    parser.add_argument("--database", default=os.environ.get("FIRESTORE_DB", "resturantdb2"))
+    parser.add_argument("--store", default=os.environ.get("REVIEW_STORE", "firestore"),
+                        help="the app's REVIEW_STORE (default from the environment)")
+    args = parser.parse_args(argv)
+    if args.store.strip().lower() == "sql":
+        # Firestore has stopped getting reviews, rebuilding from it would
+        # only bring back old numbers, and nothing reads item_stats any more
+        parser.exit(1, "REVIEW_STORE=sql: ratings are aggregated from the SQL reviews table "
+                       "on every read, there is no item_stats to rebuild.\n")
+
+    from google.cloud import firestore
+    db = firestore.Client(database=args.database)
+
+    report = rebuild(db, args.workers, args.page_size, args.batch_size, args.dry_run)
+    json.dump(report, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+
+    m, d = report["metrics"], report["diff"]
+    print(
+        f"{m['reviews_scanned']} reviews ({m['reviews_per_second']}/s), {m['items']} items: "
+        f"{len(d['added'])} added, {len(d['changed'])} changed, {len(d['zeroed'])} zeroed, "
+        f"{d['unchanged']} unchanged" + (" [dry run]" if args.dry_run else f", {m['docs_written']} written"),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+"Customers also ordered": item co-occurrence counts over orders.
+
+item_pairs is a sparse, upper-triangular co-occurrence matrix over
+menu items: one row per (item_a, item_b) with item_a <= item_b that have
+appeared in the same order, holding how many orders contained both. The
+diagonal (item_a = item_b) is the number of orders containing the item,
+which is what confidence is normalised by. Pairs that never co-occur have
+no row, so the table grows with what customers actually combine rather
+than with menu size squared.
+
+The diagonal rows are as hot as it gets, so orders don't write item_pairs
+themselves: checkout queues the order in rollup_pending (sales.py) and
+the batched flush passes the new baskets to record_order_pairs(), one
+executemany per batch. rebuild_pairs() recomputes the counts from
+order_items (flask --app main rebuild-recommendations).
+
+The web process does not query item_pairs per request: it loads the table
+into a CoOccurrenceIndex, which keeps only the top_k neighbours per item
+as tuples, so suggesting for a whole cart is a few dict lookups.
+"""
+from collections import Counter, defaultdict
+from itertools import combinations
+from operator import itemgetter
+
+from sqlalchemy import bindparam, text
+
+from queries import upsert_counters
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS item_pairs (
+        item_a INT NOT NULL,
+        item_b INT NOT NULL,
+        orders INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (item_a, item_b)
+    )
+"""
+
+
+def count_pairs(baskets) -> Counter:
+    """
+    Co-occurrence counts for an iterable of baskets (menu item ids per order).
+    Quantities don't matter, an item counts once per order.
+    """
+    counts = Counter()
+    for basket in baskets:
+        ids = sorted({int(i) for i in basket})
+        counts.update((i, i) for i in ids)
+        counts.update(combinations(ids, 2))
+    return counts
+
+
+def record_order_pairs(conn, baskets):
+    """Adds the baskets' pairs to item_pairs, one executemany."""
+    counts = count_pairs(baskets)
+    if not counts:
+        return
+    conn.execute(
+        text(upsert_counters(conn, "item_pairs", ("item_a", "item_b"), ("orders",))),
+        [{"item_a": a, "item_b": b, "orders": n} for (a, b), n in counts.items()],
+    )
+
+
+def rebuild_pairs(conn, chunk: int = 1000, sources=(("orders", "order_items"),)) -> dict:
+    """
+    Recomputes item_pairs from order items, keyset-paged over orders by id.
+    Cancelled orders count too: the live path records an order when it is
+    placed and never takes it back out. sources: (orders, items) table pairs.
+    """
+    conn.execute(text("DELETE FROM item_pairs"))
+    # queued baskets are part of the history we're about to read
+    conn.execute(text("UPDATE rollup_pending SET pairs = 0"))
+
+    counts, orders = Counter(), 0
+    for orders_table, items_table in sources:
+        last_id = 0
+        while True:
+            ids = conn.execute(
+                text(f"SELECT id FROM {orders_table} WHERE id > :last ORDER BY id LIMIT :n"),
+                {"last": last_id, "n": chunk},
+            ).scalars().all()
+            if not ids:
+                break
+            baskets = defaultdict(list)
+            for r in conn.execute(
+                text(f"SELECT order_id, menu_item_id FROM {items_table} WHERE order_id IN :ids")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": list(ids)},
+            ):
+                baskets[r.order_id].append(r.menu_item_id)
+            counts.update(count_pairs(baskets.values()))
+            orders += len(baskets)
+            last_id = ids[-1]
+
+    rows = [{"item_a": a, "item_b": b, "orders": n} for (a, b), n in counts.items()]
+    for i in range(0, len(rows), chunk):
+        conn.execute(
+            text("INSERT INTO item_pairs (item_a, item_b, orders) VALUES (:item_a, :item_b, :orders)"),
+            rows[i:i + chunk],
+        )
+    return {"orders": orders, "pairs": len(rows)}
+
+
+def load_pairs(conn) -> list[tuple]:
+    return [tuple(r) for r in conn.execute(text("SELECT item_a, item_b, orders FROM item_pairs"))]
+
+
+class CoOccurrenceIndex:
+    """
+    Top-k "also ordered" neighbours per item, ranked by confidence
+    P(other in order | item in order). Pairs seen in fewer than
+    min_support orders are ignored as noise.
+
+    items: {id: {"id", "name", "price", ...}} for the current menu; ids not
+    in it (deleted items) are never suggested.
+
+    version is a counter for the menu fragment cache key: it stays at
+    previous.version when the rankings are the same as the index this one
+    replaces and moves on by one otherwise.
+    """
+
+    def __init__(self, pairs, items: dict, top_k: int = 5, min_support: int = 2, previous=None):
+        self.items = items
+        self.top_k = top_k
+        self.min_support = min_support
+
+        pairs = list(pairs)
+        support = {a: n for a, b, n in pairs if a == b}
+        neighbours = defaultdict(list)
+        for a, b, n in pairs:
+            if a == b or n < min_support or a not in items or b not in items:
+                continue
+            if support.get(a):
+                neighbours[a].append((b, n / support[a]))
+            if support.get(b):
+                neighbours[b].append((a, n / support[b]))
+
+        self._top = {}
+        for item_id, cands in neighbours.items():
+            cands.sort(key=itemgetter(1), reverse=True)
+            self._top[item_id] = tuple((other, round(score, 4)) for other, score in cands[:top_k])
+        if previous is None:
+            self.version = 1
+        elif previous._top == self._top:
+            self.version = previous.version
+        else:
+            self.version = previous.version + 1
+
+    def __len__(self):
+        return len(self._top)
+
+    def for_item(self, item_id: int, limit: int = 3) -> list[dict]:
+        return [self.items[other] for other, _ in self._top.get(item_id, ())[:limit]]
+
+    def suggest(self, item_ids, limit: int = 4) -> list[dict]:
+        """Neighbours of everything in the cart, scores summed, cart items left out."""
+        in_cart = {int(i) for i in item_ids}
+        scores = defaultdict(float)
+        for item_id in in_cart:
+            for other, score in self._top.get(item_id, ()):
+                if other not in in_cart:
+                    scores[other] += score
+        best = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+        return [{**self.items[other], "score": round(score, 4)} for other, score in best]
@@ -0,0 +1,237 @@
+"""
+Deadlines, circuit breakers and hedged reads for calls to other services
+(Firestore, the Cloud Functions).
+
+    guard = Resilience()
+    guard.policy("firestore.read", breaker="firestore", timeout=2.0, hedge_after=0.3)
+    stats = guard.call("firestore.read", repo_read, ids, stale_key="item_stats")
+
+call() runs fn on a small shared thread pool and waits at most `timeout`
+seconds (DeadlineExceeded). The calling thread stops waiting; the worker
+thread finishes the call in the background, so the pool is sized for a
+few stuck calls.
+
+Every policy belongs to a CircuitBreaker (policies for the same backend
+share one). After `failures` consecutive failures or timeouts the breaker
+opens and calls fail straight away with CircuitOpen, instead of each
+request waiting out its deadline. After `reset_seconds` one trial call is
+let through (half-open); success closes the breaker again.
+
+hedge_after (reads only, they must be idempotent): if the first attempt
+hasn't answered by then a second identical one is started and whichever
+succeeds first wins, which cuts the tail latency of a slow replica/RPC.
+
+caller_errors: exceptions that mean the request was bad, not the backend
+(a ValueError from parsing a cursor, say). They propagate unchanged and
+don't count towards the breaker, so bad input from clients can't open it.
+
+stale_key: the last good result for that key is remembered and returned
+when the call fails, so pages degrade to slightly old data instead of
+erroring. Without it failures raise Unavailable (or a subclass). Keys can
+come from request parameters, so only the `max_stale` most recently used
+are kept.
+
+Writes go through call() too, but a write that misses its deadline is not
+cancelled, it finishes in the background. Only guard writes that are safe
+to repeat (e.g. Firestore set() on a client-chosen document id).
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Unavailable(Exception):
+    """The dependency failed, timed out or its breaker is open."""
+
+
+class DeadlineExceeded(Unavailable):
+    pass
+
+
+class CircuitOpen(Unavailable):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failures: int = 5, reset_seconds: float = 30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failures)
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_running = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_running = False
+
+    def record_neutral(self):
+        """The call says nothing about the backend; just free the half-open trial."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = self._clock()
+            self._trial_running = False
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class Policy:
+    def __init__(self, name: str, breaker: CircuitBreaker, timeout: float, hedge_after: float | None,
+                 caller_errors: tuple = (ValueError, TypeError)):
+        self.name = name
+        self.breaker = breaker
+        self.timeout = timeout
+        self.hedge_after = hedge_after or None
+        self.caller_errors = tuple(caller_errors)
+        self.counts = dict.fromkeys(
+            ("calls", "ok", "errors", "caller_errors", "timeouts", "short_circuits", "stale_served",
+             "hedges", "hedge_wins"), 0)
+
+
+class Resilience:
+    def __init__(self, max_workers: int = 16, clock=time.monotonic, max_stale: int = 256):
+        self._clock = clock
+        self.max_stale = max_stale
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resilience")
+        self._lock = threading.Lock()
+        self.breakers = {}
+        self.policies = {}
+        self._stale = OrderedDict()
+
+    def policy(self, name: str, breaker: str, timeout: float, hedge_after: float | None = None,
+               failures: int = 5, reset_seconds: float = 30.0,
+               caller_errors: tuple = (ValueError, TypeError)) -> Policy:
+        if breaker not in self.breakers:
+            self.breakers[breaker] = CircuitBreaker(breaker, failures, reset_seconds, self._clock)
+        self.policies[name] = Policy(name, self.breakers[breaker], timeout, hedge_after, caller_errors)
+        return self.policies[name]
+
+    def reset(self):
+        with self._lock:
+            for b in self.breakers.values():
+                b.reset()
+            for p in self.policies.values():
+                p.counts = dict.fromkeys(p.counts, 0)
+            self._stale.clear()
+
+    def _count(self, policy, key):
+        with self._lock:
+            policy.counts[key] += 1
+
+    # -- calling --
+    def call(self, name: str, fn, *args, stale_key=None, **kwargs):
+        policy = self.policies[name]
+        self._count(policy, "calls")
+
+        if not policy.breaker.allow():
+            self._count(policy, "short_circuits")
+            return self._degrade(policy, stale_key, CircuitOpen(f"{policy.breaker.name} circuit open"))
+
+        try:
+            result = self._run(policy, fn, args, kwargs)
+        except policy.caller_errors:
+            policy.breaker.record_neutral()
+            self._count(policy, "caller_errors")
+            raise
+        except Exception as e:
+            policy.breaker.record_failure()
+            if isinstance(e, DeadlineExceeded):
+                self._count(policy, "timeouts")
+            else:
+                self._count(policy, "errors")
+            return self._degrade(policy, stale_key, e)
+
+        policy.breaker.record_success()
+        self._count(policy, "ok")
+        if stale_key is not None:
+            with self._lock:
+                self._stale[(name, stale_key)] = result
+                self._stale.move_to_end((name, stale_key))
+                while len(self._stale) > self.max_stale:
+                    self._stale.popitem(last=False)
+        return result
+
+    def _degrade(self, policy, stale_key, error):
+        if stale_key is not None:
+            with self._lock:
+                found = (policy.name, stale_key) in self._stale
+                result = self._stale.get((policy.name, stale_key))
+            if found:
+                self._count(policy, "stale_served")
+                return result
+        if isinstance(error, Unavailable):
+            raise error
+        raise Unavailable(f"{policy.name}: {error}") from error
+
+    def _run(self, policy, fn, args, kwargs):
+        deadline = self._clock() + policy.timeout
+        first = self._pool.submit(fn, *args, **kwargs)
+        pending = {first}
+
+        if policy.hedge_after and policy.hedge_after < policy.timeout:
+            done, _ = wait(pending, timeout=policy.hedge_after)
+            if not done:
+                self._count(policy, "hedges")
+                pending.add(self._pool.submit(fn, *args, **kwargs))
+
+        error = None
+        while pending:
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    if fut is not first:
+                        self._count(policy, "hedge_wins")
+                    return fut.result()
+                error = fut.exception()
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"{policy.name} exceeded {policy.timeout:.2f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "breakers": {n: b.as_dict() for n, b in self.breakers.items()},
+                "policies": {
+                    n: {**p.counts, "timeout": p.timeout, "hedge_after": p.hedge_after, "breaker": p.breaker.name}
+                    for n, p in self.policies.items()
+                },
+            }
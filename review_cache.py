@@ -0,0 +1,176 @@
+"""
+In-process cache of the latest reviews (overall and per item).
+
+reviews(), the stats page and /api/reviews all show "the newest N reviews",
+so instead of a Firestore query per request we keep ring buffers:
+
+  overall   - newest `depth` reviews, seeded from the review store
+  per item  - newest `item_depth` reviews of one item, filled on first use
+
+Reviews posted through this process are written through straight away.
+Every `reconcile_seconds` the overall window is re-read from the store to
+pick up reviews written by other instances; items that gained reviews we
+did not see locally get their buffer dropped (and refilled on next use).
+The re-read is merged with what was written through since the previous
+one, so a local review the read didn't include yet (or an empty read
+against a new store) doesn't drop it from the window.
+
+latest() returns None when the request is beyond what the buffers can
+answer exactly; the caller then goes to the store.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class LatestReviewsCache:
+    def __init__(self, repo_getter, depth: int = 100, item_depth: int = 20, max_items: int = 500,
+                 reconcile_seconds: float = 30.0, clock=time.monotonic):
+        self._repo = repo_getter
+        self.depth = depth
+        self.item_depth = item_depth
+        self.max_items = max_items
+        self.reconcile_seconds = reconcile_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._overall = None                 # deque, newest first; None = not seeded
+        self._overall_complete = False       # store holds fewer than `depth` reviews
+        self._items = OrderedDict()          # item_id -> [deque newest first, complete]
+        self._synced_at = 0.0
+        self._stale = False                  # another instance wrote reviews
+        self._unconfirmed = {}               # id -> review written through, not yet seen in a re-read
+        self.hits = self.misses = self.errors = 0
+
+    # -- reads --
+    def latest(self, limit: int, item_id: int | None = None):
+        self._maybe_reconcile()
+        with self._lock:
+            if self._overall is None:
+                self.misses += 1
+                return None
+
+            if item_id is None:
+                if limit <= len(self._overall) or self._overall_complete:
+                    self.hits += 1
+                    return [dict(r) for r in list(self._overall)[:limit]]
+                self.misses += 1
+                return None
+
+            entry = self._items.get(item_id)
+            if entry is None and self._overall_complete:
+                # every review is in the overall window, derive the item's list
+                entry = [deque((r for r in self._overall if r.get("item_id") == item_id),
+                               maxlen=self.item_depth), True]
+                self._remember_item(item_id, entry)
+
+        if entry is None:
+            if limit > self.item_depth:
+                self.misses += 1
+                return None
+            entry = self._fill_item(item_id)
+
+        buf, complete = entry
+        if limit <= len(buf) or complete:
+            self.hits += 1
+            return [dict(r) for r in list(buf)[:limit]]
+        self.misses += 1
+        return None
+
+    # -- writes --
+    def record(self, review: dict):
+        """Write-through for a review this process just stored."""
+        review = dict(review)
+        with self._lock:
+            self._unconfirmed[review.get("id")] = review
+            if self._overall is not None:
+                if len(self._overall) == self.depth:
+                    self._overall_complete = False   # the oldest one falls out
+                self._overall.appendleft(review)
+            entry = self._items.get(review.get("item_id"))
+            if entry is not None:
+                if len(entry[0]) == self.item_depth:
+                    entry[1] = False
+                entry[0].appendleft(review)
+
+    # -- sync --
+    def seed(self):
+        """Loads the overall window now (call at startup), instead of on first read."""
+        self._synced_at = 0.0
+        self._maybe_reconcile()
+
+    def invalidate(self):
+        """Reviews were written elsewhere: re-read the window on the next request."""
+        self._stale = True
+
+    def _maybe_reconcile(self):
+        if (self._overall is not None and not self._stale
+                and self._clock() - self._synced_at < self.reconcile_seconds):
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return  # another thread is syncing, serve what we have
+        self._stale = False
+        try:
+            rows = self._repo().latest(self.depth)
+        except Exception:
+            # keep serving the old window; retry after the next interval
+            self.errors += 1
+            self._synced_at = self._clock()
+            return
+        finally:
+            self._sync_lock.release()
+
+        with self._lock:
+            if self._overall is not None:
+                known = {r.get("id") for r in self._overall}
+                for r in rows:
+                    if r.get("id") not in known:
+                        # written elsewhere (or our write-through copy had no id)
+                        self._items.pop(r.get("item_id"), None)
+            # local writes the re-read doesn't show (yet) are merged back in
+            # by created_at; once a re-read has them, or they fall out of
+            # the window, they are no longer tracked
+            fresh = {r.get("id") for r in rows}
+            missing = [r for rid, r in self._unconfirmed.items() if rid not in fresh]
+            window = _merge_newest_first(missing, rows)[: self.depth]
+            kept = {id(r) for r in window}
+            self._unconfirmed = {r.get("id"): r for r in missing if id(r) in kept}
+            self._install_overall(window)
+
+    def _install_overall(self, rows):
+        self._overall = deque(rows, maxlen=self.depth)
+        self._overall_complete = len(self._overall) < self.depth
+        self._synced_at = self._clock()
+
+    def _fill_item(self, item_id: int):
+        rows = self._repo().latest(self.item_depth, item_id=item_id)
+        entry = [deque(rows, maxlen=self.item_depth), len(rows) < self.item_depth]
+        with self._lock:
+            self._remember_item(item_id, entry)
+        return entry
+
+    def _remember_item(self, item_id, entry):
+        self._items[item_id] = entry
+        self._items.move_to_end(item_id)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+
+def _merge_newest_first(local, rows) -> list:
+    out = list(rows)
+    for r in local:
+        i = 0
+        while i < len(out) and not _newer(r.get("created_at"), out[i].get("created_at")):
+            i += 1
+        out.insert(i, r)
+    return out
+
+
+def _newer(a, b) -> bool:
+    try:
+        return a > b
+    except TypeError:
+        return False
@@ -0,0 +1,448 @@
+"""
+Pluggable review storage.
+
+  FirestoreReviewRepository  - the original layout: `reviews` documents plus
+                               `item_stats` aggregates kept by the Cloud Function
+  SqlReviewRepository        - a Cloud SQL `reviews` table indexed on
+                               (item_id, created_at); names, aggregates and
+                               pagination come from single joined queries
+  DualWriteReviewRepository  - writes to both, reads from the primary (migration)
+
+Selected with REVIEW_STORE=firestore|dual|sql (see make_review_repository).
+Reviews are returned as plain dicts:
+  {id, username, item_id, rating, comment, created_at, item_name?}
+Pagination cursors are opaque, URL-safe tokens (created_at + id of the last row).
+"""
+import abc
+import base64
+import logging
+from datetime import datetime, timezone
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError
+
+log = logging.getLogger(__name__)
+
+
+def encode_cursor(review: dict) -> str | None:
+    ts = review.get("created_at")
+    if not hasattr(ts, "isoformat"):
+        return None
+    raw = f"{ts.isoformat()}|{review.get('id')}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None):
+    """-> (created_at datetime, id str) or None. Raises ValueError on garbage."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+    ts, _, rid = raw.partition("|")
+    if "/" in rid:
+        raise ValueError("invalid cursor")   # not a document id
+    dt = datetime.fromisoformat(ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt, rid
+
+
+class ReviewRepository(abc.ABC):
+    name = "base"
+    # True when item_stats is maintained by the review_stats Cloud Function
+    uses_stats_function = False
+
+    @abc.abstractmethod
+    def add(self, review: dict, review_id: str | None = None) -> str | None:
+        """review_id: client-generated id, so a retried write replaces instead of duplicating."""
+
+    @abc.abstractmethod
+    def latest(self, limit: int, item_id: int | None = None, cursor: str | None = None) -> list[dict]:
+        """Newest first; cursor is encode_cursor() of the last review of the previous page."""
+
+    @abc.abstractmethod
+    def item_stats(self, item_ids=None) -> dict:
+        """{item_id: {"review_count", "total_rating", "avg_rating"}}"""
+
+    @abc.abstractmethod
+    def top_rated(self, limit: int) -> list[dict]:
+        """[{item_id, avg_rating, review_count, name?, price?}] best first."""
+
+    def menu_with_stats(self, limit: int, load_menu) -> list[dict]:
+        """
+        First `limit` menu items (by id) with their review aggregates.
+        load_menu(limit) returns the menu rows; stores that can join do it in SQL.
+        """
+        rows = load_menu(limit)
+        stats = self.item_stats([r.id for r in rows])
+        empty = {"review_count": 0, "total_rating": 0.0, "avg_rating": 0.0}
+        return [{**r._mapping, **stats.get(int(r.id), empty)} for r in rows]
+
+
+def _unguarded(policy, fn, *args, stale_key=None):
+    return fn(*args)
+
+
+class FirestoreReviewRepository(ReviewRepository):
+    name = "firestore"
+    uses_stats_function = True
+
+    def __init__(self, client_getter, guard=_unguarded):
+        # getter, not a client: the app (and tests) may swap the client later
+        self._client = client_getter
+        # guard(policy, fn, *args, stale_key=...) runs the Firestore call,
+        # e.g. Resilience.call (deadline + circuit breaker, see resilience.py)
+        self._guard = guard
+
+    def add(self, review: dict, review_id: str | None = None) -> str:
+        # a write that misses its deadline keeps running in the pool and
+        # usually lands; with a fixed document id the user's retry overwrites
+        # it instead of adding a second review
+        return self._guard("firestore.write", self._add, review, review_id)
+
+    def latest(self, limit, item_id=None, cursor=None):
+        # a bad cursor is the caller's mistake: raise ValueError here, before
+        # the guarded call, not as a Firestore failure
+        after = decode_cursor(cursor)
+        key = ("latest", limit, item_id) if after is None else None
+        return self._guard("firestore.read", self._latest, limit, item_id, after, stale_key=key)
+
+    def item_stats(self, item_ids=None):
+        key = ("item_stats", tuple(item_ids) if item_ids is not None else None)
+        return self._guard("firestore.read", self._item_stats, item_ids, stale_key=key)
+
+    def top_rated(self, limit):
+        return self._guard("firestore.read", self._top_rated, limit, stale_key=("top_rated", limit))
+
+    def _add(self, review: dict, review_id: str | None = None) -> str:
+        col = self._client().collection("reviews")
+        if review_id:
+            col.document(review_id).set(review)
+            return review_id
+        # add() returns (update_time, DocumentReference)
+        res = col.add(review)
+        ref = res[1] if isinstance(res, tuple) else res
+        return getattr(ref, "id", None)
+
+    def _latest(self, limit, item_id=None, after=None):
+        # document id breaks created_at ties, so a page boundary between two
+        # reviews of the same instant neither skips nor repeats one
+        col = self._client().collection("reviews")
+        q = col.order_by("created_at", direction=firestore.Query.DESCENDING).order_by(
+            FieldPath.document_id(), direction=firestore.Query.DESCENDING
+        )
+        if item_id is not None:
+            q = q.where("item_id", "==", int(item_id))
+        if after:
+            q = q.start_after(_snapshot_cursor(col, after))
+
+        out = []
+        for d in q.limit(limit).stream():
+            data = d.to_dict() or {}
+            data["id"] = d.id
+            out.append(data)
+        return out
+
+    def _item_stats(self, item_ids=None):
+        col = self._client().collection("item_stats")
+        out = {}
+        if item_ids is None:
+            for d in col.stream():
+                s = d.to_dict() or {}
+                out[str(s.get("item_id", d.id))] = s
+        else:
+            for iid in item_ids:
+                doc = col.document(str(iid)).get()
+                if doc.exists:
+                    out[str(iid)] = doc.to_dict() or {}
+        return {int(k): _stats_dict(v) for k, v in out.items() if str(k).isdigit()}
+
+    def _top_rated(self, limit):
+        docs = (
+            self._client().collection("item_stats")
+            .order_by("avg_rating", direction=firestore.Query.DESCENDING)
+            .limit(limit)
+            .stream()
+        )
+        out = []
+        for d in docs:
+            s = d.to_dict() or {}
+            try:
+                iid = int(s.get("item_id", d.id))
+            except (TypeError, ValueError):
+                continue
+            out.append({"item_id": iid, **_stats_dict(s)})
+        return out
+
+    def stream_all(self, page_size: int = 500):
+        """Every review oldest first, page by page (used by the SQL backfill)."""
+        last = None
+        while True:
+            q = (self._client().collection("reviews")
+                 .order_by("created_at").order_by(FieldPath.document_id())
+                 .limit(page_size))
+            if last is not None:
+                q = q.start_after(last)      # the snapshot: created_at and id
+            page = list(q.stream())
+            for d in page:
+                data = d.to_dict() or {}
+                data["id"] = d.id
+                yield data
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+
+class SqlReviewRepository(ReviewRepository):
+    name = "sql"
+
+    def __init__(self, engine_getter):
+        self._engine = engine_getter
+
+    def add(self, review: dict, review_id: str | None = None) -> str:
+        # runs inline without a deadline, so nothing is left half-done to retry
+        with self._engine().begin() as conn:
+            res = conn.execute(
+                text("""
+                    INSERT INTO reviews (fs_id, username, item_id, rating, comment, created_at)
+                    VALUES (:fs_id, :username, :item_id, :rating, :comment, :created_at)
+                """),
+                {
+                    "fs_id": review.get("fs_id"),
+                    "username": review.get("username"),
+                    "item_id": int(review["item_id"]),
+                    "rating": int(review["rating"]),
+                    "comment": review.get("comment") or "",
+                    "created_at": _utc_naive(review.get("created_at")),
+                },
+            )
+        return str(res.lastrowid)
+
+    def latest(self, limit, item_id=None, cursor=None):
+        where, params = [], {"lim": int(limit)}
+        if item_id is not None:
+            where.append("r.item_id = :iid")
+            params["iid"] = int(item_id)
+        after = decode_cursor(cursor)
+        if after:
+            where.append("(r.created_at < :cts OR (r.created_at = :cts AND r.id < :cid))")
+            params["cts"] = _utc_naive(after[0])
+            params["cid"] = int(after[1] or 0)
+
+        sql = """
+            SELECT r.id, r.username, r.item_id, r.rating, r.comment, r.created_at,
+                   mi.name AS item_name
+            FROM reviews r
+            LEFT JOIN menu_items mi ON mi.id = r.item_id
+        """
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.created_at DESC, r.id DESC LIMIT :lim"
+
+        with self._engine().begin() as conn:
+            rows = conn.execute(text(sql), params).mappings().all()
+        return [_sql_review(r) for r in rows]
+
+    def item_stats(self, item_ids=None):
+        sql = """
+            SELECT item_id, COUNT(*) AS review_count, SUM(rating) AS total_rating, AVG(rating) AS avg_rating
+            FROM reviews
+        """
+        params = {}
+        if item_ids is not None:
+            item_ids = [int(i) for i in item_ids]
+            if not item_ids:
+                return {}
+            sql += " WHERE item_id IN :ids"
+            params["ids"] = item_ids
+        sql += " GROUP BY item_id"
+
+        stmt = text(sql)
+        if item_ids is not None:
+            stmt = stmt.bindparams(bindparam("ids", expanding=True))
+        with self._engine().begin() as conn:
+            rows = conn.execute(stmt, params).mappings().all()
+        return {int(r["item_id"]): _stats_dict(r) for r in rows}
+
+    def top_rated(self, limit):
+        with self._engine().begin() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT r.item_id, mi.name, mi.price,
+                           COUNT(*) AS review_count, SUM(r.rating) AS total_rating,
+                           AVG(r.rating) AS avg_rating
+                    FROM reviews r
+                    JOIN menu_items mi ON mi.id = r.item_id
+                    GROUP BY r.item_id, mi.name, mi.price
+                    ORDER BY avg_rating DESC, review_count DESC
+                    LIMIT :lim
+                """),
+                {"lim": int(limit)},
+            ).mappings().all()
+        return [
+            {"item_id": int(r["item_id"]), "name": r["name"], "price": float(r["price"]), **_stats_dict(r)}
+            for r in rows
+        ]
+
+    def menu_with_stats(self, limit, load_menu=None):
+        # only the page of menu items is joined; (item_id, created_at) serves the lookup
+        with self._engine().begin() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT mi.id, mi.name, mi.description, mi.price, mi.category, mi.image_url,
+                           COUNT(r.id) AS review_count,
+                           COALESCE(SUM(r.rating), 0) AS total_rating,
+                           COALESCE(AVG(r.rating), 0) AS avg_rating
+                    FROM (SELECT id, name, description, price, category, image_url
+                          FROM menu_items ORDER BY id ASC LIMIT :lim) mi
+                    LEFT JOIN reviews r ON r.item_id = mi.id
+                    GROUP BY mi.id, mi.name, mi.description, mi.price, mi.category, mi.image_url
+                    ORDER BY mi.id ASC
+                """),
+                {"lim": int(limit)},
+            ).mappings().all()
+        return [{**r, **_stats_dict(r)} for r in rows]
+
+    def import_batch(self, reviews) -> int:
+        """Inserts Firestore reviews not already copied (dedup on fs_id). Returns rows inserted."""
+        reviews = [r for r in reviews if r.get("id")]
+        if not reviews:
+            return 0
+        with self._engine().begin() as conn:
+            existing = set(conn.execute(
+                text("SELECT fs_id FROM reviews WHERE fs_id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                {"ids": [r["id"] for r in reviews]},
+            ).scalars())
+            fresh = [r for r in reviews if r["id"] not in existing]
+            if fresh:
+                conn.execute(
+                    text("""
+                        INSERT INTO reviews (fs_id, username, item_id, rating, comment, created_at)
+                        VALUES (:fs_id, :username, :item_id, :rating, :comment, :created_at)
+                    """),
+                    [
+                        {
+                            "fs_id": r["id"],
+                            "username": r.get("username"),
+                            "item_id": int(r.get("item_id") or 0),
+                            "rating": int(r.get("rating") or 0),
+                            "comment": r.get("comment") or "",
+                            "created_at": _utc_naive(r.get("created_at")),
+                        }
+                        for r in fresh
+                    ],
+                )
+        return len(fresh)
+
+
+class DualWriteReviewRepository(ReviewRepository):
+    """
+    Migration mode: every write goes to both stores, reads come from the
+    primary. A failing secondary write is logged, never shown to the user.
+    """
+    name = "dual"
+
+    def __init__(self, primary: ReviewRepository, secondary: ReviewRepository):
+        self.primary = primary
+        self.secondary = secondary
+        self.uses_stats_function = primary.uses_stats_function or secondary.uses_stats_function
+
+    def add(self, review, review_id=None):
+        rid = self.primary.add(review, review_id)
+        try:
+            # the Firestore doc id doubles as the dedup key for the backfill
+            fs_id = rid if isinstance(self.primary, FirestoreReviewRepository) else review.get("fs_id")
+            self.secondary.add({**review, "fs_id": fs_id})
+        except IntegrityError:
+            pass  # already copied
+        except Exception as e:
+            log.warning("review dual-write to %s failed: %s", self.secondary.name, e)
+        return rid
+
+    def latest(self, limit, item_id=None, cursor=None):
+        return self.primary.latest(limit, item_id=item_id, cursor=cursor)
+
+    def item_stats(self, item_ids=None):
+        return self.primary.item_stats(item_ids)
+
+    def top_rated(self, limit):
+        return self.primary.top_rated(limit)
+
+    def menu_with_stats(self, limit, load_menu):
+        return self.primary.menu_with_stats(limit, load_menu)
+
+
+def backfill_reviews_to_sql(source: FirestoreReviewRepository, target: SqlReviewRepository,
+                            page_size: int = 500) -> dict:
+    """Copies every Firestore review into the SQL table; safe to re-run."""
+    scanned = inserted = 0
+    batch = []
+    for review in source.stream_all(page_size=page_size):
+        scanned += 1
+        batch.append(review)
+        if len(batch) >= page_size:
+            inserted += target.import_batch(batch)
+            batch = []
+    if batch:
+        inserted += target.import_batch(batch)
+    return {"scanned": scanned, "inserted": inserted}
+
+
+def make_review_repository(mode: str, client_getter, engine_getter, guard=_unguarded) -> ReviewRepository:
+    mode = (mode or "firestore").lower()
+    fs = FirestoreReviewRepository(client_getter, guard)
+    if mode == "firestore":
+        return fs
+    sql = SqlReviewRepository(engine_getter)
+    if mode == "sql":
+        return sql
+    if mode == "dual":
+        return DualWriteReviewRepository(fs, sql)
+    raise ValueError(f"unknown REVIEW_STORE {mode!r} (firestore, dual or sql)")
+
+
+def _snapshot_cursor(col, after):
+    """
+    start_after value for a decoded page cursor: the last review's snapshot,
+    or (if it was deleted meanwhile) its created_at and id as field values.
+    """
+    ts, rid = after
+    if rid:
+        snap = col.document(rid).get()
+        if snap.exists:
+            return snap
+        return {"created_at": ts, "__name__": rid}
+    return {"created_at": ts}
+
+
+def _stats_dict(s) -> dict:
+    count = int(s.get("review_count") or 0)
+    total = float(s.get("total_rating") or 0.0)
+    avg = s.get("avg_rating")
+    avg = round(float(avg), 3) if avg is not None else (round(total / count, 3) if count else 0.0)
+    return {"review_count": count, "total_rating": total, "avg_rating": avg}
+
+
+def _utc_naive(ts) -> datetime:
+    # DATETIME columns hold naive UTC
+    if ts is None:
+        ts = datetime.now(timezone.utc)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _sql_review(r) -> dict:
+    out = dict(r)
+    out["id"] = str(out["id"])
+    ts = out.get("created_at")
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if isinstance(ts, datetime) and ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    out["created_at"] = ts
+    return out
@@ -0,0 +1,306 @@
+"""
+Sales rollups: revenue per hour, per day and per menu item per day.
+
+The rollup rows are few and hot (every order of the hour hits the same
+sales_hourly row), so the order transaction doesn't touch them: checkout
+and cancel only queue_rollups(), i.e. INSERT one rollup_pending row per
+order, which locks nothing anyone else needs. apply_pending() later folds
+a whole batch into the rollups (and hands back the new orders' baskets
+for item_pairs) in one transaction, and deletes the rows it applied, so
+every order is counted exactly once even if a flush dies halfway.
+main.flush_rollups() runs it every ROLLUP_FLUSH_SECONDS on a background
+thread; /api/sales only reads, and reports how many changes are still
+pending. rebuild_rollups() recomputes
+everything from the order history (flask --app main rebuild-sales).
+
+Buckets are UTC: sales_hourly.bucket is the start of the hour,
+sales_daily.day / sales_item_daily.day the calendar day.
+"""
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import bindparam, text
+
+from queries import sql, upsert_counters
+
+ROLLUP_TABLES = ("sales_hourly", "sales_daily", "sales_item_daily")
+
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS sales_hourly (
+        bucket DATETIME PRIMARY KEY,
+        orders INT NOT NULL DEFAULT 0,
+        items INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(12,2) NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sales_daily (
+        day DATE PRIMARY KEY,
+        orders INT NOT NULL DEFAULT 0,
+        items INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(12,2) NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sales_item_daily (
+        day DATE NOT NULL,
+        menu_item_id INT NOT NULL,
+        qty INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, menu_item_id)
+    )
+    """,
+]
+
+
+
+def create_pending_table(conn):
+    """rollup_pending: order changes not yet folded into the rollups / item_pairs."""
+    if conn.dialect.name == "mysql":
+        pk = "id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY"
+    else:
+        pk = "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS rollup_pending (
+            {pk},
+            order_id INT NOT NULL,
+            sales_sign SMALLINT NOT NULL DEFAULT 0,
+            pairs SMALLINT NOT NULL DEFAULT 0
+        )
+    """))
+
+
+def utc_naive(ts=None) -> datetime:
+    """Orders store naive UTC; normalise whatever we were given to that."""
+    if ts is None:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def record_sales(conn, orders, sign: int = 1):
+    """
+    Adds (sign=1) or removes (sign=-1) orders from the rollups.
+    orders: iterable of (created_at, total, lines); lines carry
+    menu_item_id, qty and unit_price. Buckets are merged in Python first,
+    so a batch costs one executemany per table.
+    """
+    hourly = defaultdict(lambda: [0, 0, Decimal("0")])
+    daily = defaultdict(lambda: [0, 0, Decimal("0")])
+    per_item = defaultdict(lambda: [0, Decimal("0")])
+
+    for created_at, total, lines in orders:
+        ts = utc_naive(created_at)
+        hour = ts.replace(minute=0, second=0, microsecond=0)
+        day = ts.date()
+        qty = sum(int(ln["qty"]) for ln in lines)
+        for bucket in (hourly[hour], daily[day]):
+            bucket[0] += 1
+            bucket[1] += qty
+            bucket[2] += Decimal(str(total))
+        for ln in lines:
+            agg = per_item[(day, int(ln["menu_item_id"]))]
+            agg[0] += int(ln["qty"])
+            agg[1] += Decimal(str(ln["unit_price"])) * int(ln["qty"])
+
+    if not hourly:
+        return
+
+    conn.execute(
+        text(upsert_counters(conn, "sales_hourly", ("bucket",), ("orders", "items", "revenue"))),
+        [{"bucket": k, "orders": sign * o, "items": sign * i, "revenue": float(sign * r)}
+         for k, (o, i, r) in hourly.items()],
+    )
+    conn.execute(
+        text(upsert_counters(conn, "sales_daily", ("day",), ("orders", "items", "revenue"))),
+        [{"day": k, "orders": sign * o, "items": sign * i, "revenue": float(sign * r)}
+         for k, (o, i, r) in daily.items()],
+    )
+    conn.execute(
+        text(upsert_counters(conn, "sales_item_daily", ("day", "menu_item_id"), ("qty", "revenue"))),
+        [{"day": d, "menu_item_id": mid, "qty": sign * q, "revenue": float(sign * r)}
+         for (d, mid), (q, r) in per_item.items()],
+    )
+
+
+def load_orders(conn, order_ids, orders_table: str = "orders", items_table: str = "order_items") -> list:
+    """(created_at, total, lines) for the given orders, in the shape record_sales takes."""
+    return list(load_order_map(conn, order_ids, orders_table, items_table).values())
+
+
+def load_order_map(conn, order_ids, orders_table: str = "orders", items_table: str = "order_items") -> dict:
+    """{order id: (created_at, total, lines)}"""
+    order_ids = [int(i) for i in order_ids]
+    if not order_ids:
+        return {}
+    heads = conn.execute(
+        text(f"SELECT id, created_at, total_price FROM {orders_table} WHERE id IN :ids")
+        .bindparams(bindparam("ids", expanding=True)),
+        {"ids": order_ids},
+    ).fetchall()
+    lines = defaultdict(list)
+    for r in conn.execute(
+        text(f"SELECT order_id, menu_item_id, qty, unit_price FROM {items_table} WHERE order_id IN :ids")
+        .bindparams(bindparam("ids", expanding=True)),
+        {"ids": order_ids},
+    ):
+        lines[r.order_id].append({"menu_item_id": r.menu_item_id, "qty": r.qty, "unit_price": r.unit_price})
+    return {h.id: (h.created_at, h.total_price, lines[h.id]) for h in heads if h.created_at is not None}
+
+
+# ---- Pending rollup changes ----
+def queue_rollups(conn, order_ids, sales_sign: int = 0, pairs: bool = False):
+    """
+    Call inside the transaction that writes / cancels the orders.
+    sales_sign: +1 add to the sales rollups, -1 take out, 0 leave alone;
+    pairs: count the order's basket in item_pairs (new orders only).
+    """
+    rows = [{"oid": int(i), "s": int(sales_sign), "p": int(bool(pairs))} for i in order_ids]
+    if rows:
+        sql.execute(conn, "rollup_pending.queue", rows)
+
+
+def apply_pending(conn, limit: int = 500, sources=(("orders", "order_items"),)) -> dict:
+    """
+    Folds up to `limit` pending rows into the sales rollups and deletes
+    them. Returns {"rows", "orders", "baskets"}; the caller adds the
+    baskets to item_pairs in the same transaction. On MySQL the claimed
+    rows are locked with SKIP LOCKED, so every instance can flush at once.
+    """
+    lock = " FOR UPDATE SKIP LOCKED" if conn.dialect.name == "mysql" else ""
+    pending = conn.execute(
+        text(f"SELECT id, order_id, sales_sign, pairs FROM rollup_pending ORDER BY id LIMIT :n{lock}"),
+        {"n": int(limit)},
+    ).fetchall()
+    if not pending:
+        return {"rows": 0, "orders": 0, "baskets": []}
+
+    found = {}
+    for orders_table, items_table in sources:
+        missing = {p.order_id for p in pending} - set(found)
+        if missing:
+            found.update(load_order_map(conn, missing, orders_table, items_table))
+
+    added, removed, baskets = [], [], []
+    for p in pending:
+        order = found.get(p.order_id)
+        if order is None:
+            continue   # order deleted before we got to it
+        if p.sales_sign > 0:
+            added.append(order)
+        elif p.sales_sign < 0:
+            removed.append(order)
+        if p.pairs:
+            baskets.append([ln["menu_item_id"] for ln in order[2]])
+    record_sales(conn, added)
+    record_sales(conn, removed, -1)
+
+    conn.execute(
+        text("DELETE FROM rollup_pending WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": [p.id for p in pending]},
+    )
+    return {"rows": len(pending), "orders": len(added) + len(removed), "baskets": baskets}
+
+
+class RollupFlusher(threading.Thread):
+    """Calls flush() every `interval` seconds (flush returns rows applied; full batches go again)."""
+
+    def __init__(self, flush, interval: float = 2.0, batch_size: int = 500, logger=None):
+        super().__init__(name="rollup-flush", daemon=True)
+        self.flush = flush
+        self.interval = interval
+        self.batch_size = batch_size
+        self.logger = logger
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                while self.flush(self.batch_size) >= self.batch_size:
+                    pass
+            except Exception as e:
+                if self.logger:
+                    self.logger.exception("rollup flush failed: %s", e)
+
+
+def rebuild_rollups(conn, chunk: int = 1000, sources=(("orders", "order_items"),)) -> dict:
+    """
+    Recomputes all rollups from non-cancelled orders, keyset-paged by id.
+    sources: (orders table, items table) pairs, e.g. hot + archive.
+    """
+    for table in ROLLUP_TABLES:
+        conn.execute(text(f"DELETE FROM {table}"))
+    # queued sales changes are part of the history we're about to read
+    conn.execute(text("UPDATE rollup_pending SET sales_sign = 0"))
+
+    orders = 0
+    for orders_table, items_table in sources:
+        last_id = 0
+        while True:
+            ids = conn.execute(
+                text(f"""
+                    SELECT id FROM {orders_table}
+                    WHERE id > :last AND status <> 'cancelled'
+                    ORDER BY id LIMIT :n
+                """),
+                {"last": last_id, "n": chunk},
+            ).scalars().all()
+            if not ids:
+                break
+            batch = load_orders(conn, ids, orders_table, items_table)
+            record_sales(conn, batch)
+            orders += len(batch)
+            last_id = ids[-1]
+    return {"orders": orders}
+
+
+def query_sales(conn, start: date, end: date, group: str) -> list[dict]:
+    """Rollup rows for [start, end] (inclusive days). group: hour | day | item."""
+    if group == "hour":
+        rows = conn.execute(
+            text("""
+                SELECT bucket, orders, items, revenue FROM sales_hourly
+                WHERE bucket >= :start AND bucket < :end AND orders <> 0
+                ORDER BY bucket
+            """),
+            {"start": datetime.combine(start, datetime.min.time()),
+             "end": datetime.combine(end + timedelta(days=1), datetime.min.time())},
+        ).mappings().all()
+        return [{"hour": utc_naive(r["bucket"]).isoformat(timespec="minutes"), "orders": int(r["orders"]),
+                 "items": int(r["items"]), "revenue": float(r["revenue"])} for r in rows]
+
+    if group == "item":
+        rows = conn.execute(
+            text("""
+                SELECT s.menu_item_id, mi.name, SUM(s.qty) AS qty, SUM(s.revenue) AS revenue
+                FROM sales_item_daily s
+                LEFT JOIN menu_items mi ON mi.id = s.menu_item_id
+                WHERE s.day >= :start AND s.day <= :end
+                GROUP BY s.menu_item_id, mi.name
+                HAVING SUM(s.qty) <> 0
+                ORDER BY revenue DESC
+            """),
+            {"start": start, "end": end},
+        ).mappings().all()
+        return [{"menu_item_id": int(r["menu_item_id"]), "name": r["name"], "qty": int(r["qty"]),
+                 "revenue": round(float(r["revenue"]), 2)} for r in rows]
+
+    rows = conn.execute(
+        text("""
+            SELECT day, orders, items, revenue FROM sales_daily
+            WHERE day >= :start AND day <= :end AND orders <> 0
+            ORDER BY day
+        """),
+        {"start": start, "end": end},
+    ).mappings().all()
+    return [{"day": str(r["day"])[:10], "orders": int(r["orders"]), "items": int(r["items"]),
+             "revenue": float(r["revenue"])} for r in rows]
@@ -1,5 +1,7 @@
 import os
 import sys
+import threading
+import time
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT_DIR not in sys.path:
@@ -11,6 +13,14 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.pool import StaticPool
 from werkzeug.security import generate_password_hash
 
+from cache_bus import CREATE_TABLE as CACHE_VERSIONS_TABLE
+from order_archive import CREATE_TABLES as ARCHIVE_TABLES
+from order_archive import INDEXES as ARCHIVE_INDEXES
+from passwords import PasswordHasher
+from recommendations import CREATE_TABLE as ITEM_PAIRS_TABLE
+from sales import CREATE_TABLES as SALES_TABLES
+from sales import create_pending_table
+
 
 # ---------------- Fake Firestore ----------------
 class _FakeSnap:
@@ -23,11 +33,80 @@ class _FakeSnap:
 
 
 class _FakeDocRef:
-    def __init__(self, data=None):
+    def __init__(self, data=None, doc_id=None, collection=None):
         self._data = data
+        self.id = doc_id
+        self._collection = collection
 
     def get(self, **kwargs):
-        return _FakeSnap(self._data)
+        snap = _FakeSnap(self._data)
+        snap.id = self.id
+        return snap
+
+    def set(self, data, merge=False):
+        if self._data is not None:
+            if not merge:
+                self._data.clear()
+            self._data.update(data)
+            return
+        new = dict(data)
+        if self._collection.name == "item_stats":
+            new.setdefault("item_id", self.id)   # item_stats docs are found by item_id
+        else:
+            _named(self._collection.store, self._collection.name)[self.id] = new
+        self._collection.store.setdefault(self._collection.name, []).append(new)
+        self._data = new
+
+    def delete(self):
+        docs = self._collection.store.get(self._collection.name, [])
+        docs[:] = [d for d in docs if d is not self._data]
+        named = _named(self._collection.store, self._collection.name)
+        named.pop(self.id, None)
+        self._data = None
+
+
+class _FakeBatch:
+    def __init__(self):
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append((ref, data, merge))
+
+    def delete(self, ref):
+        self.ops.append((ref, None, False))
+
+    def commit(self):
+        for ref, data, merge in self.ops:
+            if data is None:
+                ref.delete()
+            else:
+                ref.set(data, merge=merge)
+        self.ops = []
+
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+}
+
+
+def _named(store, name) -> dict:
+    # documents created with .document(id).set(): id -> data
+    return store.setdefault("__doc_ids__", {}).setdefault(name, {})
+
+
+class _FakeDoc:
+    def __init__(self, i, d, doc_id=None, collection=None):
+        self.id = doc_id or f"doc{i}"
+        self._d = d
+        self.exists = True
+        self.reference = _FakeDocRef(d, self.id, collection)
+
+    def to_dict(self):
+        return self._d
 
 
 class _FakeCollection:
@@ -35,17 +114,25 @@ class _FakeCollection:
         self.store = store
         self.name = name
         self._limit = None
-        self._where = None
+        self._wheres = []
+        self._order = []
+        self._start_after = None
 
     def where(self, field, op, value):
-        self._where = (field, op, value)
+        self._wheres.append((field, op, value))
         return self
 
     def add(self, data):
         self.store.setdefault(self.name, []).append(data)
         return ("fake_id", None)
 
-    def order_by(self, *args, **kwargs):
+    def order_by(self, field, direction="ASCENDING"):
+        self._order.append((field, direction == "DESCENDING"))
+        return self
+
+    def start_after(self, cursor):
+        # a snapshot (resume after that doc) or {field: value} for the order fields
+        self._start_after = cursor
         return self
 
     def limit(self, n):
@@ -53,32 +140,54 @@ class _FakeCollection:
         return self
 
     def stream(self):
-        items = self.store.get(self.name, [])
-
-        if self._where:
-            field, op, value = self._where
-            if op == "==":
-                items = [d for d in items if d.get(field) == value]
+        names = {id(d): k for k, d in _named(self.store, self.name).items()}
+        docs = [_FakeDoc(i, d, names.get(id(d)), self) for i, d in enumerate(self.store.get(self.name, []))]
+
+        for field, op, value in self._wheres:
+            docs = [d for d in docs if _OPS[op](d.to_dict().get(field), value)]
+
+        def value(d, field):
+            # FieldPath.document_id() orders on the document id
+            return d.id if field == "__name__" else d.to_dict().get(field)
+
+        # stable sorts applied last key first == multi-key order_by
+        for field, desc in reversed(self._order):
+            present = [d for d in docs if value(d, field) is not None]
+            missing = [d for d in docs if value(d, field) is None]
+            docs = sorted(present, key=lambda d: value(d, field), reverse=desc) + missing
+
+        cur = self._start_after
+        if isinstance(cur, dict):
+            def after(d):
+                for field, desc in self._order:
+                    if field not in cur:
+                        continue
+                    a, b = value(d, field), cur[field]
+                    if a != b:
+                        return a < b if desc else a > b
+                return False
+            docs = [d for d in docs if after(d)]
+        elif cur is not None:
+            ids = [d.id for d in docs]
+            docs = docs[ids.index(cur.id) + 1:] if cur.id in ids else docs
 
         if self._limit:
-            items = items[: self._limit]
-
-        class _FakeDoc:
-            def __init__(self, i, d):
-                self.id = f"doc{i}"
-                self._d = d
-
-            def to_dict(self):
-                return self._d
-
-        return [_FakeDoc(i, d) for i, d in enumerate(items)]
+            docs = docs[: self._limit]
+        return docs
 
     def document(self, doc_id):
         if self.name == "item_stats":
             for d in self.store.get("item_stats", []):
                 if str(d.get("item_id")) == str(doc_id):
-                    return _FakeDocRef(d)
-        return _FakeDocRef(None)
+                    return _FakeDocRef(d, str(doc_id), self)
+            return _FakeDocRef(None, str(doc_id), self)
+        named = _named(self.store, self.name)
+        if doc_id in named:
+            return _FakeDocRef(named[doc_id], doc_id, self)
+        for i, d in enumerate(self.store.get(self.name, [])):
+            if f"doc{i}" == doc_id:
+                return _FakeDocRef(d, doc_id, self)
+        return _FakeDocRef(None, doc_id, self)
 
 
 class FakeFirestoreClient:
@@ -88,6 +197,65 @@ class FakeFirestoreClient:
     def collection(self, name):
         return _FakeCollection(self.store, name)
 
+    def batch(self):
+        return _FakeBatch()
+
+
+class FaultyFirestoreClient(FakeFirestoreClient):
+    """
+    FakeFirestoreClient with injectable faults on every read/write RPC
+    (stream, document get/set, add): `delay` seconds of latency for the next
+    `slow` calls and an exception for the next `fail` calls.
+    """
+
+    def __init__(self, fail: int = 0, slow: int = 0, delay: float = 0.0):
+        super().__init__()
+        self.fail, self.slow, self.delay = fail, slow, delay
+        self.rpcs = 0
+        self._lock = threading.Lock()
+
+    def _fault(self):
+        with self._lock:
+            self.rpcs += 1
+            fail, slow = self.fail > 0, self.slow > 0
+            self.fail -= fail
+            self.slow -= slow
+        if slow:
+            time.sleep(self.delay)
+        if fail:
+            raise RuntimeError("injected Firestore failure")
+
+    def collection(self, name):
+        client = self
+
+        class _Col(_FakeCollection):
+            def stream(self):
+                client._fault()
+                return super().stream()
+
+            def add(self, data):
+                client._fault()
+                return super().add(data)
+
+            def document(self, doc_id):
+                ref = super().document(doc_id)
+                get = ref.get
+
+                set_ = ref.set
+
+                def faulty_get(**kwargs):
+                    client._fault()
+                    return get(**kwargs)
+
+                def faulty_set(data, merge=False):
+                    client._fault()
+                    return set_(data, merge=merge)
+                ref.get = faulty_get
+                ref.set = faulty_set
+                return ref
+
+        return _Col(self.store, name)
+
 
 # ---------------- Pytest fixtures ----------------
 @pytest.fixture(autouse=True)
@@ -119,7 +287,10 @@ def _stub_infra(monkeypatch):
                 description TEXT NOT NULL DEFAULT '',
                 price REAL NOT NULL,
                 category TEXT NOT NULL DEFAULT 'other',
-                image_url TEXT
+                image_url TEXT,
+                updated_at TEXT,
+                row_version INTEGER NOT NULL DEFAULT 0,
+                stock INTEGER
             )
         """))
         conn.execute(text("DELETE FROM menu_items"))
@@ -131,6 +302,22 @@ def _stub_infra(monkeypatch):
             (4, 'Coke', 'Test item', 1.99, 'drink', 'https://example.com/coke.jpg')
         """))
 
+        # menu delta sync
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS menu_version (
+                id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """))
+        conn.execute(text("INSERT INTO menu_version (id, version) VALUES (1, 0)"))
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS menu_item_tombstones (
+                menu_item_id INTEGER PRIMARY KEY,
+                row_version INTEGER NOT NULL,
+                deleted_at TEXT
+            )
+        """))
+
         # users
         conn.execute(text("""
             CREATE TABLE IF NOT EXISTS users (
@@ -176,7 +363,8 @@ def _stub_infra(monkeypatch):
                 user_id INTEGER NOT NULL,
                 status TEXT NOT NULL DEFAULT 'pending',
                 total_price REAL NOT NULL DEFAULT 0,
-                created_at TEXT
+                created_at TEXT,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
             )
         """))
         conn.execute(text("""
@@ -189,10 +377,66 @@ def _stub_infra(monkeypatch):
             )
         """))
 
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS checkout_keys (
+                idem_key TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                order_id INTEGER,
+                created_at TEXT,
+                expires_at TEXT NOT NULL
+            )
+        """))
+
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS reviews (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fs_id TEXT UNIQUE,
+                username TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                rating INTEGER NOT NULL,
+                comment TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_reviews_item_created ON reviews (item_id, created_at)"))
+
+        for ddl in SALES_TABLES:
+            conn.execute(text(ddl))
+        create_pending_table(conn)
+        conn.execute(text(ITEM_PAIRS_TABLE))
+        conn.execute(text(CACHE_VERSIONS_TABLE))
+        for ddl in ARCHIVE_TABLES:
+            conn.execute(text(ddl))
+        for table, name, columns in ARCHIVE_INDEXES:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
     # patch app DB + infra
     monkeypatch.setattr(main, "get_engine", lambda: engine)
     monkeypatch.setattr(main, "init_db", lambda: None)
     monkeypatch.setattr(main, "db_fs", FakeFirestoreClient())
+    # rollups are flushed by hand (or by /api/sales), not on a thread
+    monkeypatch.setitem(main.app.config, "ROLLUP_WORKER", False)
+    # hash inline: no worker processes in tests
+    monkeypatch.setattr(main, "password_hasher", PasswordHasher(workers=0))
+
+    # rendered fragments from a previous test's data must not leak in
+    main.app.jinja_env.fragment_cache.clear()
+    # every test starts with full token buckets
+    main.rate_limiter.reset()
+    # nor reviews cached from another test's fake Firestore
+    main.review_feed.reset()
+    # closed breakers, no stale results from a previous test
+    main.guard.reset()
+    # versions start from this test's (empty) cache_versions table
+    main.cache_bus.reset()
+    # and a co-occurrence index loaded from another test's orders
+    main._recs["index"] = None
+    # or search boosts from another test's ratings
+    main._search_boosts.update(key=None, boosts={})
+
+    yield
+    # no deferred bump timer firing into the next test's database
+    main.cache_bus.reset()
 
 
 @pytest.fixture()
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+
+def _seed_logs(n=60):
+    import main
+    base = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    for i in range(n):
+        main.db_fs.collection("audit_logs").add({
+            "event": "login_success" if i % 2 else "logout",
+            "username": "testuser" if i % 3 else "admin",
+            "ip": "127.0.0.1",
+            "meta": {"i": i},
+            "created_at": base + timedelta(hours=i),
+        })
+
+
+def _login_admin(client):
+    client.post("/login", data={"username": "admin", "password": "AdminPass123!"})
+
+
+def test_log_event_sets_ttl_field():
+    import main
+    main.log_event("probe", "admin")
+    doc = main.db_fs.store["audit_logs"][-1]
+    # TTL only fires after the purge function has had its chance to archive
+    ttl = doc["expires_at"] - doc["created_at"]
+    assert ttl == timedelta(days=main.AUDIT_LOG_RETENTION_DAYS + main.AUDIT_LOG_TTL_MARGIN_DAYS)
+    assert ttl > timedelta(days=main.AUDIT_LOG_RETENTION_DAYS)
+
+
+def test_admin_logs_cursor_pages_cover_everything(client):
+    _seed_logs(60)
+    _login_admin(client)
+
+    r = client.get("/admin/logs")
+    assert r.status_code == 200
+    assert r.data.count(b"<tr>") == 1 + 50  # header + page
+    # login above also wrote a log, so 61 in total -> a second page of 11
+    assert b"cursor=doc" in r.data
+
+    import re
+    cursor = re.search(rb"cursor=(doc\d+)", r.data).group(1).decode()
+    r = client.get(f"/admin/logs?cursor={cursor}")
+    assert r.data.count(b"<tr>") == 1 + 11
+    assert b"cursor=doc" not in r.data
+
+
+def test_admin_logs_filters(client):
+    _seed_logs(60)
+    _login_admin(client)
+
+    r = client.get("/admin/logs?event=logout&username=admin&from=2026-03-01&to=2026-03-01")
+    assert r.status_code == 200
+    # hours 0..23 on 1 March, even i (logout) and i % 3 == 0 (admin) -> 0, 6, 12, 18
+    assert r.data.count(b"<tr>") == 1 + 4
+    assert b"{&#39;i&#39;: 18}" in r.data
+
+    r = client.get("/admin/logs?from=not-a-date", follow_redirects=True)
+    assert r.status_code == 200
+    assert b"Ignoring invalid" in r.data
+
+
+def test_admin_logs_ignores_cursors_that_are_not_document_ids(client, monkeypatch):
+    from conftest import _FakeCollection
+    real = _FakeCollection.document
+
+    def document(self, doc_id):
+        # like the real client: "a/b" would be a collection path
+        if "/" in doc_id:
+            raise ValueError("A document must have an even number of path elements")
+        return real(self, doc_id)
+    monkeypatch.setattr(_FakeCollection, "document", document)
+
+    _seed_logs(5)
+    _login_admin(client)
+    for bad in ("a/b", "__id__", ".."):
+        r = client.get("/admin/logs", query_string={"cursor": bad})
+        assert r.status_code == 200
+        assert b"Ignoring invalid cursor." in r.data
+        assert r.data.count(b"<tr>") == 1 + 6      # the first page
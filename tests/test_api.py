@@ -45,3 +45,41 @@ def test_api_menu_includes_category_and_image(client):
     assert "category" in first
     assert "image_url" in first
 
+
+
+def test_api_menu_since_returns_only_changes(client):
+    import main
+
+    with main.get_engine().begin() as conn:
+        main.touch_menu_items(conn, [1, 2, 3, 4])
+
+    r = client.get("/api/menu?since=0")
+    assert r.status_code == 200
+    snap = r.get_json()
+    assert snap["full"] is True
+    assert len(snap["changed"]) == 4
+    v0 = snap["version"]
+
+    with main.get_engine().begin() as conn:
+        conn.execute(main.text("UPDATE menu_items SET price = 11.49 WHERE id = 1"))
+        main.touch_menu_items(conn, [1])
+        main.delete_menu_items(conn, [4])
+
+    r = client.get(f"/api/menu?since={v0}")
+    delta = r.get_json()
+    assert delta["full"] is False
+    assert delta["version"] > v0
+    assert [i["id"] for i in delta["changed"]] == [1]
+    assert delta["changed"][0]["price"] == 11.49
+    assert delta["deleted"] == [4]
+    assert r.headers["X-Menu-Version"] == str(delta["version"])
+
+    # nothing new since the latest token
+    r = client.get(f"/api/menu?since={delta['version']}")
+    assert r.get_json()["changed"] == []
+    assert r.get_json()["deleted"] == []
+
+
+def test_api_menu_since_invalid_400(client):
+    r = client.get("/api/menu?since=abc")
+    assert r.status_code == 400
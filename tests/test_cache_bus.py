@@ -0,0 +1,145 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from cache_bus import CREATE_TABLE, CacheBus, MemoryVersionStore, SqlVersionStore
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _sqlite_store():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_TABLE))
+    return SqlVersionStore(lambda: engine)
+
+
+def test_two_processes_see_each_others_bumps_only_after_poll():
+    for store in (MemoryVersionStore(), _sqlite_store()):
+        clock = _Clock()
+        a = CacheBus(store, poll_seconds=2, clock=clock)
+        b = CacheBus(store, poll_seconds=2, clock=clock)
+        dropped = []
+        b.subscribe("menu", dropped.append)
+
+        assert b.version("menu") == 0          # first poll: adopt, no callbacks
+        assert a.bump("menu") > 0
+        assert a.version("menu") > 0           # the writer sees its own bump at once
+
+        assert b.version("menu") == 0          # within the poll interval
+        clock.now += 2
+        assert b.version("menu") == 1
+        assert dropped == ["menu"]             # only the namespace that moved
+        assert b.version("stats") == 0
+        assert b.stats()["remote_changes"] == 1
+
+
+def test_store_failure_still_moves_the_local_version():
+    class Broken:
+        def bump(self, ns, by=1):
+            raise RuntimeError("db down")
+
+        def read(self):
+            raise RuntimeError("db down")
+
+    bus = CacheBus(Broken(), defer_seconds=3600)
+    assert bus.version("menu") == 0
+    assert bus.bump("menu") == 1
+    assert bus.stats()["errors"] == 2
+    assert bus.stats()["deferred"] == {"menu": 1}      # retried with the next flush
+    bus.reset()
+
+
+def test_failed_push_is_retried_and_does_not_mask_remote_bumps():
+    class Flaky(MemoryVersionStore):
+        down = False
+
+        def bump(self, ns, by=1):
+            if self.down:
+                raise RuntimeError("db down")
+            return super().bump(ns, by)
+
+    store = Flaky()
+    clock = _Clock()
+    a = CacheBus(store, poll_seconds=2, clock=clock, defer_seconds=3600)
+    b = CacheBus(store, poll_seconds=2, clock=clock)
+    seen = []
+    a.subscribe("menu", seen.append)
+    assert a.version("menu") == 0 and b.version("menu") == 0
+
+    store.down = True
+    a.bump("menu")                          # only a's own counter moves
+    store.down = False
+    before = a.version("menu")
+
+    b.bump("menu")                          # shared row: 1, level with a's own count
+    clock.now += 2
+    assert a.version("menu") != before and seen == ["menu"]
+
+    a.flush_deferred()                      # the failed increment goes out now
+    clock.now += 2
+    assert b.version("menu") == 2 + 1       # shared 2 + b's own bump
+    a.reset()
+
+
+def test_bump_past_a_remote_bump_runs_the_subscribers():
+    store = MemoryVersionStore()
+    clock = _Clock()
+    a = CacheBus(store, poll_seconds=2, clock=clock)
+    b = CacheBus(store, poll_seconds=2, clock=clock)
+    dropped = []
+    b.subscribe("menu", dropped.append)
+    assert b.version("menu") == 0
+
+    a.bump("menu")
+    v = b.bump("menu")                     # b skipped a's bump, so its cache is stale too
+    assert dropped == ["menu"]
+    clock.now += 2
+    assert b.version("menu") == v and dropped == ["menu"]
+
+
+def test_deferred_bumps_share_one_write():
+    store = MemoryVersionStore()
+    clock = _Clock()
+    a = CacheBus(store, poll_seconds=2, clock=clock, defer_seconds=3600)
+    b = CacheBus(store, poll_seconds=2, clock=clock)
+    seen = []
+    b.subscribe("orders", seen.append)
+    assert b.version("orders") == 0
+
+    for n in range(1, 6):
+        assert a.bump("orders", defer=True) == n
+    assert store.read() == {} and a.stats()["deferred"] == {"orders": 5}
+
+    a.flush_deferred()
+    assert store.read() == {"orders": 5}
+    assert a.version("orders") == 10 and seen == []        # shared 5 + own 5, no remote change
+    clock.now += 2
+    assert b.version("orders") == 5 and seen == ["orders"]
+
+
+def test_review_from_another_instance_invalidates_the_feed(client, monkeypatch):
+    import main
+    main.db_fs.store["reviews"] = [{"username": "a", "item_id": 1, "rating": 5, "comment": "old",
+                                    "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc)}]
+    monkeypatch.setattr(main.cache_bus, "poll_seconds", 0)
+    monkeypatch.setattr(main.review_feed, "reconcile_seconds", 3600)
+
+    assert "old" in client.get("/reviews").get_data(as_text=True)
+
+    # another instance stores a review and bumps the shared version
+    main.db_fs.store["reviews"].append({"username": "b", "item_id": 2, "rating": 4, "comment": "from elsewhere",
+                                        "created_at": datetime(2026, 1, 2, tzinfo=timezone.utc)})
+    assert "from elsewhere" not in client.get("/reviews").get_data(as_text=True)
+    main.cache_bus.store.bump("reviews")
+
+    assert "from elsewhere" in client.get("/reviews").get_data(as_text=True)
+    with main.get_engine().begin() as conn:
+        assert conn.execute(text("SELECT version FROM cache_versions WHERE namespace='reviews'")).scalar() == 1
@@ -0,0 +1,63 @@
+import gzip
+import json
+
+
+def test_api_menu_gzip_when_accepted(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "COMPRESS_MIN_SIZE", 16)
+
+    r = client.get("/api/menu", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in r.headers["Vary"]
+
+    data = json.loads(gzip.decompress(r.data))
+    assert isinstance(data, list) and len(data) >= 1
+
+
+def test_no_compression_without_accept_encoding(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "COMPRESS_MIN_SIZE", 16)
+
+    r = client.get("/api/menu")
+    assert "Content-Encoding" not in r.headers
+    assert r.is_json
+
+
+def test_small_responses_not_compressed(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "COMPRESS_MIN_SIZE", 10_000_000)
+
+    r = client.get("/api/menu", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in r.headers
+
+
+def test_compressed_variant_cached_by_etag(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "COMPRESS_MIN_SIZE", 16)
+    cache = main.app.extensions["compression_cache"]
+    cache.clear()
+
+    r1 = client.get("/api/menu", headers={"Accept-Encoding": "gzip"})
+    r2 = client.get("/api/menu", headers={"Accept-Encoding": "gzip"})
+    assert r1.data == r2.data
+    assert cache.hits == 1
+
+    # unchanged body -> 304 for a client that already has it
+    r3 = client.get("/api/menu", headers={"Accept-Encoding": "gzip", "If-None-Match": r1.headers["ETag"]})
+    assert r3.status_code == 304
+
+
+def test_choose_encoding_respects_q_values():
+    from compression import choose_encoding
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("deflate, gzip;q=0.5") == "gzip"
+    assert choose_encoding("*") in ("gzip", "br")
+
+
+def test_q_value_found_among_other_params():
+    from compression import choose_encoding, parse_accept_encoding
+    assert parse_accept_encoding("gzip;level=1;q=0, br ; Q = 0.5") == {"gzip": 0.0, "br": 0.5}
+    assert choose_encoding("gzip;foo=bar;q=0") is None
+    assert parse_accept_encoding("gzip;q=nan, br;q=2") == {"gzip": 0.0, "br": 1.0}
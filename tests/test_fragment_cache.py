@@ -0,0 +1,67 @@
+def test_menu_cards_served_from_fragment_cache(client, monkeypatch):
+    import main
+
+    calls = []
+    real = main.load_menu_items
+
+    def counting():
+        calls.append(1)
+        return real()
+
+    monkeypatch.setattr(main, "load_menu_items", counting)
+
+    r1 = client.get("/menu")
+    r2 = client.get("/menu")
+    assert r1.status_code == 200 and r2.status_code == 200
+    assert b"Chicken Burger" in r2.data
+    assert len(calls) == 1
+
+    # a menu change invalidates the cached cards
+    main.bump_cache_version("menu")
+    client.get("/menu")
+    assert len(calls) == 2
+
+
+def test_cached_menu_fills_in_csrf_token(client):
+    import re
+
+    for _ in range(2):                       # rendered, then from the cache
+        page = client.get("/menu").get_data(as_text=True)
+        assert "fragment-slot" not in page
+        tokens = re.findall(r'name="csrf_token" value="([^"]*)"', page)
+        assert tokens and all(tokens)
+
+
+def test_only_marked_slots_are_filled(client):
+    from datetime import datetime, timezone
+
+    import main
+    comment = "<!--fragment-slot:csrf_token--> __CSRF_TOKEN__"
+    main.db_fs.collection("reviews").add({
+        "username": "testuser", "item_id": 1, "rating": 4, "comment": comment,
+        "created_at": datetime.now(timezone.utc),
+    })
+    for _ in range(2):
+        page = client.get("/stats").get_data(as_text=True)
+        assert "&lt;!--fragment-slot:csrf_token--&gt; __CSRF_TOKEN__" in page
+
+
+def test_stats_tables_cached_until_stats_bump(client, monkeypatch):
+    import main
+
+    calls = []
+    real = main.load_stats_tables
+
+    def counting():
+        calls.append(1)
+        return real()
+
+    monkeypatch.setattr(main, "load_stats_tables", counting)
+
+    client.get("/stats")
+    client.get("/stats")
+    assert len(calls) == 1
+
+    main.bump_cache_version("stats")
+    client.get("/stats")
+    assert len(calls) == 2
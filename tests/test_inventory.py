@@ -0,0 +1,193 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from inventory import SoldOut, reserve_stock
+
+
+def _login(client, username, password):
+    return client.post("/login", data={"username": username, "password": password}, follow_redirects=True)
+
+
+def _set_stock(item_id, stock):
+    import main
+    with main.get_engine().begin() as conn:
+        conn.execute(text("UPDATE menu_items SET stock = :s WHERE id = :id"), {"s": stock, "id": item_id})
+
+
+def _stock(item_id):
+    import main
+    with main.get_engine().begin() as conn:
+        return conn.execute(text("SELECT stock FROM menu_items WHERE id = :id"), {"id": item_id}).scalar()
+
+
+def _order_count():
+    import main
+    with main.get_engine().begin() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM orders")).scalar()
+
+
+def _line(item_id, qty, limited=True):
+    return {"menu_item_id": item_id, "qty": qty, "limited": limited}
+
+
+def test_parallel_reservations_never_oversell(tmp_path):
+    # a real file database, so the threads really contend for the write lock
+    engine = create_engine(f"sqlite:///{tmp_path / 'stock.sqlite3'}", connect_args={"timeout": 30})
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE menu_items (id INTEGER PRIMARY KEY, name TEXT, stock INTEGER)"))
+        conn.execute(text("INSERT INTO menu_items VALUES (1, 'Burger', 7), (2, 'Fries', NULL), (3, 'Pie', 100)"))
+
+    taken, refused, errors = [], [], []
+    lock = threading.Lock()
+    start = threading.Barrier(16)
+
+    def buyer():
+        start.wait()
+        try:
+            with engine.begin() as conn:
+                reserve_stock(conn, [_line(1, 2), _line(2, 1, limited=False), _line(3, 1)])
+            with lock:
+                taken.append(1)
+        except SoldOut as e:
+            with lock:
+                refused.append(e.items)
+        except Exception as e:   # e.g. "database is locked"
+            errors.append(e)
+
+    threads = [threading.Thread(target=buyer) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(taken) == 3 and len(refused) == 13     # 7 burgers cover three orders of two
+    assert all(items[0]["id"] == 1 for items in refused)
+    with engine.connect() as conn:
+        stock = dict(conn.execute(text("SELECT id, stock FROM menu_items")).all())
+    # refused orders gave back what they had taken from item 3
+    assert stock == {1: 1, 2: None, 3: 97}
+
+
+def test_short_line_rolls_back_the_whole_reservation(client):
+    import main
+    _set_stock(1, 5)
+    _set_stock(3, 1)
+    with pytest.raises(SoldOut) as e, main.get_engine().begin() as conn:
+        reserve_stock(conn, [_line(1, 2), _line(3, 2)])
+    assert e.value.items == [{"id": 3, "name": "Fries", "left": 1}]
+    assert _stock(1) == 5 and _stock(3) == 1
+
+
+def test_checkout_takes_stock_and_marks_sold_out(client):
+    import main
+    _set_stock(1, 1)
+    before = main.cache_version("menu")
+    _login(client, "testuser", "Password123!")
+    client.post("/cart/add/1")
+    client.post("/cart/add/4")                       # unlimited
+
+    with main.get_engine().begin() as conn:
+        since = main.touch_menu_items(conn, [2])       # a delta client is up to date
+    client.post("/checkout", follow_redirects=True)
+    assert _stock(1) == 0 and _stock(4) is None
+    assert main.cache_version("menu") > before
+
+    delta = client.get(f"/api/menu?since={since}").get_json()
+    assert [(i["id"], i["stock"]) for i in delta["changed"]] == [(1, 0)]
+    assert b"Sold out" in client.get("/menu").data
+
+    # the next customer is turned away without an order being written
+    orders = _order_count()
+    client.post("/cart/add/1")
+    r = client.post("/checkout", follow_redirects=True)
+    assert b"Chicken Burger is sold out" in r.data
+    assert _order_count() == orders
+
+
+def test_intake_drain_fails_orders_that_ran_out(client, monkeypatch, tmp_path):
+    import main
+    monkeypatch.setitem(main.app.config, "ORDER_INTAKE_ENABLED", True)
+    monkeypatch.setitem(main.app.config, "ORDER_INTAKE_WORKER", False)
+    monkeypatch.setitem(main.app.config, "ORDER_INTAKE_PATH", str(tmp_path / "intake.sqlite3"))
+    monkeypatch.setitem(main._order_intake, "queue", None)
+    monkeypatch.setitem(main._order_intake, "worker", None)
+
+    _set_stock(2, 1)
+    _login(client, "testuser", "Password123!")
+    for key in ("a" * 32, "b" * 32):
+        client.post("/cart/add/2")
+        client.post("/checkout", data={"idempotency_key": key})
+    refs = [e["ref"] for e in main.get_order_intake().pending_for_user(1)]
+
+    orders = _order_count()
+    assert main.drain_order_intake() == 2
+    assert _order_count() == orders + 1
+    statuses = sorted(client.get(f"/orders/intake/{ref}").get_json()["status"] for ref in refs)
+    assert statuses == ["failed", "persisted"]
+    assert _stock(2) == 0
+    page = client.get("/orders").get_data(as_text=True)
+    assert "sold out before we could take your order (Margherita Pizza (0 left))" in page
+
+    # once it shows as gone, intake turns the cart away up front
+    client.post("/cart/add/2")
+    r = client.post("/checkout", data={"idempotency_key": "c" * 32}, follow_redirects=True)
+    assert b"sold out" in r.data and b"Order received" not in r.data
+    assert len(main.get_order_intake().pending_for_user(1)) == 1     # just the failed one
+
+
+def test_cancelling_gives_the_stock_back(client):
+    import main
+    _set_stock(1, 2)
+    _set_stock(3, 5)
+    _login(client, "testuser", "Password123!")
+    for item in (1, 1, 3, 4):
+        client.post(f"/cart/add/{item}")
+    client.post("/checkout")
+    client.post("/cart/add/1")
+    client.post("/checkout")           # sold out, nothing placed
+    assert _stock(1) == 0 and _stock(3) == 4
+    with main.get_engine().begin() as conn:
+        oid = conn.execute(text("SELECT MAX(id) FROM orders")).scalar()
+    client.post("/logout")
+
+    _login(client, "admin", "AdminPass123!")
+    before = main.cache_version("menu")
+    client.post(f"/admin/orders/{oid}/status", data={"status": "cancelled"})
+    assert _stock(1) == 2 and _stock(3) == 5 and _stock(4) is None
+    assert main.cache_version("menu") > before       # item 1 is back on the menu
+    client.post(f"/admin/orders/{oid}/status", data={"status": "cancelled"})
+    assert _stock(1) == 2                              # only once
+
+
+def test_bulk_cancel_gives_the_stock_back(client):
+    import main
+    _set_stock(3, 3)
+    _login(client, "testuser", "Password123!")
+    for _ in range(2):
+        client.post("/cart/add/3")
+        client.post("/checkout")
+    assert _stock(3) == 1
+    with main.get_engine().begin() as conn:
+        ids = [r.id for r in conn.execute(text("SELECT id FROM orders ORDER BY id"))]
+    client.post("/logout")
+
+    _login(client, "admin", "AdminPass123!")
+    res = client.post("/admin/orders/status", json={"order_ids": ids, "status": "cancelled"}).get_json()
+    assert res["updated"] == ids
+    assert _stock(3) == 3
+
+
+def test_admin_sets_and_clears_stock(client):
+    _login(client, "admin", "AdminPass123!")
+    assert client.post("/admin/menu/3/stock", json={"stock": 12}).get_json() == {"id": 3, "stock": 12}
+    assert _stock(3) == 12
+    assert client.post("/admin/menu/3/stock", json={"stock": -1}).status_code == 400
+    assert client.post("/admin/menu/99/stock", json={"stock": 1}).status_code == 404
+
+    client.post("/admin/menu/3/stock", data={"stock": ""})
+    assert _stock(3) is None
+    fries = [i for i in client.get("/api/menu").get_json() if i["id"] == 3][0]
+    assert fries["stock"] is None
@@ -0,0 +1,47 @@
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import create_engine, text
+
+
+def test_provider_handles_decimal_datetime_and_rows():
+    import main
+
+    engine = create_engine("sqlite+pysqlite:///:memory:")
+    with engine.begin() as conn:
+        rows = conn.execute(text("SELECT 1 AS id, 'Fries' AS name")).fetchall()
+
+    out = json.loads(main.app.json.dumps({
+        "price": Decimal("3.49"),
+        "at": datetime(2026, 1, 1, tzinfo=timezone.utc),
+        "rows": rows,
+    }))
+    assert out["price"] == 3.49
+    assert out["at"].startswith("2026-01-01T00:00:00")
+    assert out["rows"] == [{"id": 1, "name": "Fries"}]
+
+
+def test_api_reviews_timestamps_are_iso(client):
+    import main
+    main.db_fs.collection("reviews").add({
+        "username": "testuser",
+        "item_id": 1,
+        "rating": 5,
+        "comment": "Nice",
+        "created_at": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    })
+
+    r = client.get("/api/reviews?limit=5")
+    data = r.get_json()
+    assert data[0]["created_at"].startswith("2026-01-02T03:04:05")
+
+
+def test_responses_are_pretty_printed_in_debug_mode(monkeypatch):
+    import main
+    from flask import jsonify
+
+    with main.app.app_context():
+        assert jsonify({"a": [1]}).get_data() == b'{"a":[1]}\n'
+        monkeypatch.setattr(main.app, "debug", True)
+        assert jsonify({"a": [1]}).get_data() == b'{\n  "a": [\n    1\n  ]\n}\n'
@@ -0,0 +1,119 @@
+import io
+import json
+
+
+def _login_admin(client):
+    client.post("/login", data={"username": "admin", "password": "AdminPass123!"})
+
+
+def _menu():
+    import main
+    with main.get_engine().begin() as conn:
+        return {r.id: r for r in conn.execute(main.text("SELECT * FROM menu_items"))}
+
+
+def test_csv_import_upserts_only_changes(client):
+    import main
+    _login_admin(client)
+    bumps = main.cache_bus.stats()["local"].get("menu", 0)
+
+    csv_body = (
+        "id,name,description,price,category,image_url\n"
+        "1,Chicken Burger,Test item,10.49,burger,https://example.com/burger.jpg\n"  # unchanged
+        "2,Margherita Pizza,Test item,12.50,pizza,https://example.com/pizza.jpg\n"  # price change
+        ",Onion Rings,Crispy rings,3.99,sides,\n"                                   # new
+    )
+    r = client.post(
+        "/admin/menu/import",
+        data={"file": (io.BytesIO(csv_body.encode()), "menu.csv")},
+        content_type="multipart/form-data",
+        follow_redirects=True,
+    )
+    assert r.status_code == 200
+    assert b"1 added, 1 updated, 1 unchanged" in r.data
+
+    menu = _menu()
+    assert float(menu[2].price) == 12.50
+    assert any(m.name == "Onion Rings" for m in menu.values())
+    # the unchanged row wasn't rewritten
+    assert menu[1].row_version == 0
+    assert menu[2].row_version > 0
+    # caches invalidated exactly once for the whole import
+    assert main.cache_bus.stats()["local"]["menu"] == bumps + 1
+
+
+def test_json_import_with_prune_tombstones_missing_items(client):
+    import main
+    with main.get_engine().begin() as conn:
+        synced = main.touch_menu_items(conn, [1, 2, 3, 4])
+
+    _login_admin(client)
+    items = [
+        {"id": 1, "name": "Chicken Burger", "description": "Test item", "price": 10.49, "category": "burger",
+         "image_url": "https://example.com/burger.jpg"},
+    ]
+    r = client.post(
+        "/admin/menu/import",
+        data={"file": (io.BytesIO(json.dumps(items).encode()), "menu.json"), "prune": "1"},
+        content_type="multipart/form-data",
+        follow_redirects=True,
+    )
+    assert b"3 removed" in r.data
+    assert set(_menu()) == {1}
+
+    delta = client.get(f"/api/menu?since={synced}").get_json()
+    assert sorted(delta["deleted"]) == [2, 3, 4]
+
+
+def test_invalid_import_changes_nothing(client):
+    _login_admin(client)
+    csv_body = "id,name,description,price,category,image_url\n2,Margherita Pizza,x,not-a-price,pizza,\n"
+    r = client.post(
+        "/admin/menu/import",
+        data={"file": (io.BytesIO(csv_body.encode()), "menu.csv")},
+        content_type="multipart/form-data",
+        follow_redirects=True,
+    )
+    assert b"Import failed" in r.data
+    assert float(_menu()[2].price) == 9.99
+
+
+def _import_csv(client, rows):
+    body = "id,name,description,price,category,image_url\n" + "".join(r + "\n" for r in rows)
+    return client.post(
+        "/admin/menu/import",
+        data={"file": (io.BytesIO(body.encode()), "menu.csv")},
+        content_type="multipart/form-data",
+        follow_redirects=True,
+    )
+
+
+def test_import_rejects_prices_that_dont_fit(client):
+    _login_admin(client)
+    for price in ("NaN", "Infinity", "-inf", "100000000.00", "1e30"):
+        r = _import_csv(client, [f"2,Margherita Pizza,x,{price},pizza,"])
+        assert r.status_code == 200
+        assert b"Import failed" in r.data and b"line 2" in r.data, price
+    assert float(_menu()[2].price) == 9.99
+
+
+def test_import_rejects_the_same_item_twice(client):
+    _login_admin(client)
+    for rows, dup in (
+        (["50,Soup,x,3.00,sides,", "50,Stew,x,4.00,sides,"], b"id 50 already on line 2"),
+        ([",Soup,x,3.00,sides,", ",soup,x,4.00,sides,"], b"already on line 2"),
+        (["2,Margherita Pizza,x,11.00,pizza,", ",Margherita Pizza,x,12.00,pizza,"], b"id 2 already on line 2"),
+    ):
+        r = _import_csv(client, rows)
+        assert b"Import failed" in r.data and b"line 3" in r.data and dup in r.data
+        assert b"used by orders" not in r.data
+    assert 50 not in _menu() and float(_menu()[2].price) == 9.99
+
+
+def test_menu_export_csv(client):
+    _login_admin(client)
+    r = client.get("/admin/menu/export?format=csv")
+    assert r.status_code == 200
+    body = r.get_data(as_text=True)
+    assert body.splitlines()[0] == "id,name,description,price,category,image_url"
+    assert "Chicken Burger" in body
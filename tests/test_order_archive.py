@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+
+def _login(client, username, password):
+    client.post("/login", data={"username": username, "password": password})
+
+
+def _seed_orders(conn, main):
+    """Five old orders (3 finished, 1 pending, 1 preparing) + one recent completed one."""
+    uid = conn.execute(main.text("SELECT id FROM users WHERE username='testuser'")).scalar()
+    old = (datetime.now(timezone.utc) - timedelta(days=400)).strftime("%Y-%m-%d %H:%M:%S")
+    new = (datetime.now(timezone.utc) - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    for status, ts in (("completed", old), ("cancelled", old), ("completed", old),
+                       ("pending", old), ("preparing", old), ("completed", new)):
+        conn.execute(main.text(
+            "INSERT INTO orders (user_id, status, total_price, created_at) VALUES (:u, :s, 3.49, :t)"
+        ), {"u": uid, "s": status, "t": ts})
+        oid = conn.execute(main.text("SELECT MAX(id) FROM orders")).scalar()
+        conn.execute(main.text(
+            "INSERT INTO order_items (order_id, menu_item_id, qty, unit_price) VALUES (:o, 3, 1, 3.49)"
+        ), {"o": oid})
+
+
+def _ids(conn, main, table):
+    return sorted(conn.execute(main.text(f"SELECT id FROM {table}")).scalars().all())
+
+
+def test_archive_moves_old_finished_orders_in_resumable_batches(client):
+    import main
+    engine = main.get_engine()
+    with engine.begin() as conn:
+        _seed_orders(conn, main)
+
+    cutoff = main.archive_cutoff(180)
+    first = main.archive_orders(engine, cutoff, batch_size=2, max_batches=1)
+    assert first == {"archived": 2, "batches": 1, "done": False}
+
+    rest = main.archive_orders(engine, cutoff, batch_size=2)
+    assert rest["archived"] == 1 and rest["done"] is True
+
+    with engine.begin() as conn:
+        assert _ids(conn, main, "orders") == [4, 5, 6]          # unfinished + recent stay hot
+        assert _ids(conn, main, "orders_archive") == [1, 2, 3]
+        assert conn.execute(main.text("SELECT COUNT(*) FROM order_items WHERE order_id <= 3")).scalar() == 0
+        assert conn.execute(main.text("SELECT COUNT(*) FROM order_items_archive")).scalar() == 3
+
+    # nothing left to do
+    assert main.archive_orders(engine, cutoff, batch_size=2) == {"archived": 0, "batches": 0, "done": True}
+
+
+def test_my_orders_hot_by_default_archive_on_demand(client):
+    import main
+    with main.get_engine().begin() as conn:
+        _seed_orders(conn, main)
+
+    _login(client, "admin", "AdminPass123!")
+    r = client.post("/admin/orders/archive", json={})
+    assert r.get_json()["archived"] == 3
+    client.post("/logout")
+
+    _login(client, "testuser", "Password123!")
+    hot = client.get("/orders").get_data(as_text=True)
+    assert "Order #6" in hot and "Order #1<" not in hot
+
+    cold = client.get("/orders?archived=1").get_data(as_text=True)
+    assert "Order #1<" in cold and "Order #6" not in cold
+    assert "1 × Fries" in cold
+
+    # rebuilding the rollups still sees archived sales
+    result = main.app.test_cli_runner().invoke(args=["rebuild-sales"])
+    assert "from 5 orders" in result.output
+
+
+def test_archived_lines_survive_a_pruned_menu_item(client):
+    import main
+    with main.get_engine().begin() as conn:
+        _seed_orders(conn, main)
+    main.archive_orders(main.get_engine(), main.archive_cutoff(180))
+    with main.get_engine().begin() as conn:
+        # what a menu import with prune=1 does to an item only archived orders use
+        conn.execute(main.text("DELETE FROM order_items WHERE menu_item_id = 3"))
+        main.delete_menu_items(conn, [3])
+
+    _login(client, "testuser", "Password123!")
+    cold = client.get("/orders?archived=1").get_data(as_text=True)
+    assert "Order #1<" in cold
+    assert cold.count("1 × Item 3") == 3
+
+
+def test_archive_requires_admin(client):
+    _login(client, "testuser", "Password123!")
+    assert client.post("/admin/orders/archive").status_code in (302, 401, 403)
@@ -0,0 +1,55 @@
+import csv
+import gzip
+import io
+
+
+def _login(client, username, password):
+    client.post("/login", data={"username": username, "password": password})
+
+
+def _seed(main):
+    with main.get_engine().begin() as conn:
+        uid = conn.execute(main.text("SELECT id FROM users WHERE username='testuser'")).scalar()
+        for ts, lines in (("2026-03-01 10:00:00", [(1, 2, 10.49), (3, 1, 3.49)]),
+                          ("2026-03-02 23:59:00", [(2, 1, 9.99)]),
+                          ("2026-03-03 00:00:00", [(4, 1, 1.99)])):
+            conn.execute(main.text(
+                "INSERT INTO orders (user_id, status, total_price, created_at) VALUES (:u, 'completed', 0, :t)"
+            ), {"u": uid, "t": ts})
+            oid = conn.execute(main.text("SELECT MAX(id) FROM orders")).scalar()
+            for mid, qty, price in lines:
+                conn.execute(main.text(
+                    "INSERT INTO order_items (order_id, menu_item_id, qty, unit_price) VALUES (:o, :m, :q, :p)"
+                ), {"o": oid, "m": mid, "q": qty, "p": price})
+
+
+def test_export_streams_lines_in_range(client):
+    import main
+    _seed(main)
+    # the first order has been archived, it is still exported
+    main.archive_orders(main.get_engine(), main.archive_cutoff(0, "2026-03-02T00:00:00"))
+
+    _login(client, "admin", "AdminPass123!")
+    r = client.get("/admin/export-orders?from=2026-03-01&to=2026-03-02")
+    assert r.status_code == 200 and r.is_streamed
+    assert r.headers["Content-Disposition"].endswith('orders_2026-03-01_2026-03-02.csv"')
+
+    rows = list(csv.DictReader(io.StringIO(r.get_data(as_text=True))))
+    assert [(row["order_id"], row["item_name"], row["qty"], row["line_total"]) for row in rows] == [
+        ("2", "Margherita Pizza", "1", "9.99"),       # hot first, then archive
+        ("1", "Chicken Burger", "2", "20.98"),
+        ("1", "Fries", "1", "3.49"),
+    ]
+    assert rows[0]["username"] == "testuser"
+
+    r = client.get("/admin/export-orders?from=2026-03-01&to=2026-03-03&archived=0&gzip=1")
+    assert r.mimetype == "application/gzip"
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(r.get_data()).decode())))
+    assert [row["order_id"] for row in rows] == ["2", "3"]
+
+
+def test_export_validation_and_access(client):
+    assert client.get("/admin/export-orders").status_code in (302, 401, 403)
+    _login(client, "admin", "AdminPass123!")
+    assert client.get("/admin/export-orders?from=2026-02-30").status_code == 400
+    assert client.get("/admin/export-orders?from=2026-03-02&to=2026-03-01").status_code == 400
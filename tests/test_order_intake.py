@@ -0,0 +1,114 @@
+import pytest
+
+
+def _login(client, username, password):
+    return client.post("/login", data={"username": username, "password": password}, follow_redirects=True)
+
+
+def _order_count():
+    import main
+    with main.get_engine().begin() as conn:
+        return conn.execute(main.text("SELECT COUNT(*) FROM orders")).scalar()
+
+
+@pytest.fixture()
+def intake(monkeypatch, tmp_path):
+    import main
+    monkeypatch.setitem(main.app.config, "ORDER_INTAKE_ENABLED", True)
+    monkeypatch.setitem(main.app.config, "ORDER_INTAKE_WORKER", False)
+    monkeypatch.setitem(main.app.config, "ORDER_INTAKE_PATH", str(tmp_path / "intake.sqlite3"))
+    monkeypatch.setitem(main._order_intake, "queue", None)
+    monkeypatch.setitem(main._order_intake, "worker", None)
+    return main
+
+
+def test_checkout_is_acknowledged_then_drained(client, intake):
+    main = intake
+    _login(client, "testuser", "Password123!")
+    client.post("/cart/add/1")
+    before = _order_count()
+
+    r = client.post("/checkout", data={"idempotency_key": "k" * 32}, follow_redirects=True)
+    assert r.status_code == 200
+    assert b"Order received" in r.data
+    assert _order_count() == before  # not written yet
+
+    r = client.get("/orders")
+    assert b"RECEIVED" in r.data.upper()
+
+    ref = main.get_order_intake().pending_for_user(1)[0]["ref"]
+    assert client.get(f"/orders/intake/{ref}").get_json()["status"] == "received"
+
+    assert main.drain_order_intake() == 1
+    assert _order_count() == before + 1
+
+    status = client.get(f"/orders/intake/{ref}").get_json()
+    assert status["status"] == "persisted"
+    assert status["order_id"]
+
+
+def test_intake_dedups_repeated_key(client, intake):
+    main = intake
+    _login(client, "testuser", "Password123!")
+    client.post("/cart/add/1")
+    client.post("/checkout", data={"idempotency_key": "d" * 32})
+    client.post("/cart/add/1")
+    client.post("/checkout", data={"idempotency_key": "d" * 32})
+
+    assert main.get_order_intake().depth() == 1
+
+
+def test_intake_takes_orders_while_the_database_is_down(client, intake, monkeypatch):
+    from sqlalchemy import create_engine
+
+    main = intake
+    _login(client, "testuser", "Password123!")
+    client.post("/cart/add/1")
+    client.get("/checkout")                    # the cart was priced once
+    working = main.get_engine()
+    before = _order_count()
+
+    down = create_engine("sqlite:////nonexistent/dir/db.sqlite3")
+    monkeypatch.setattr(main, "get_engine", lambda: down)
+    r = client.post("/checkout", data={"idempotency_key": "e" * 32})
+    assert r.status_code == 302 and r.headers["Location"].endswith("/orders")
+    r = client.post("/checkout", data={"idempotency_key": "e" * 32})      # the retry
+    assert r.status_code == 302
+    assert main.get_order_intake().depth() == 1
+
+    monkeypatch.setattr(main, "get_engine", lambda: working)
+    assert main.drain_order_intake() == 1
+    assert _order_count() == before + 1
+
+
+def test_intake_backpressure_when_full(client, intake, monkeypatch):
+    main = intake
+    monkeypatch.setitem(main.app.config, "ORDER_INTAKE_MAX_PENDING", 1)
+    _login(client, "testuser", "Password123!")
+
+    client.post("/cart/add/1")
+    client.post("/checkout")
+    client.post("/cart/add/2")
+    r = client.post("/checkout", follow_redirects=False)
+    assert "/checkout" in r.headers["Location"]
+    assert main.get_order_intake().depth() == 1
+
+
+def test_reclaimed_batch_without_key_is_not_inserted_twice(client, intake, monkeypatch):
+    import order_intake
+    main = intake
+    _login(client, "testuser", "Password123!")
+    client.post("/cart/add/1")
+    client.post("/checkout")                     # no idempotency key
+    before = _order_count()
+
+    # a worker writes the batch, then dies before marking it persisted
+    queue = main.get_order_intake()
+    persisted, failed = main.persist_intake_batch(queue.claim_batch(10, "dead-worker"))
+    assert _order_count() == before + 1
+
+    monkeypatch.setattr(order_intake, "CLAIM_TIMEOUT", -1)   # its claim has timed out
+    assert main.drain_order_intake() == 1
+    assert _order_count() == before + 1
+    ref = next(iter(persisted))
+    assert queue.lookup(ref)["order_id"] == persisted[ref]
@@ -1,3 +1,6 @@
+from order_feed import OrderFeed
+
+
 def _login(client, username, password):
     return client.post(
         "/login",
@@ -47,3 +50,204 @@ def test_admin_can_view_admin_orders_page(client):
     r = client.get("/admin/orders")
     assert r.status_code == 200
     assert b"orders" in (r.data or b"").lower()
+
+
+def _stamp_orders(updated_at):
+    import main
+    with main.get_engine().begin() as conn:
+        conn.execute(main.text("UPDATE orders SET updated_at = :t"), {"t": updated_at})
+
+
+def test_admin_orders_stream_resumes_from_the_database(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "SSE_MAX_STREAM_SECONDS", 0)
+    _place_orders(client, 1)
+    _stamp_orders("2026-01-01 10:00:00")
+
+    # a fresh feed: the reconnect landed on another worker or instance
+    monkeypatch.setattr(main, "order_feed", OrderFeed())
+    _login(client, "admin", "AdminPass123!")
+    r = client.get("/admin/orders/stream", headers={"Last-Event-ID": "20260101095000"})
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+    body = r.get_data(as_text=True)
+    assert "event: order_created" in body and "event: order_status" in body
+    assert "id: 20260101100000" in body
+
+    # nothing new past the cursor (give or take the grace window)
+    r = client.get("/admin/orders/stream", headers={"Last-Event-ID": "20260101100010"})
+    body = r.get_data(as_text=True)
+    assert "event: order_created" not in body and "id: 20260101100010" in body
+
+    # an id from before cursors can't be resumed
+    r = client.get("/admin/orders/stream", headers={"Last-Event-ID": "42"})
+    assert "event: reset" in r.get_data(as_text=True)
+    assert main._streams.count == 0
+
+
+def test_admin_orders_stream_is_capped_per_process(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "SSE_MAX_STREAMS", 1)
+    monkeypatch.setitem(main.app.config, "SSE_MAX_STREAM_SECONDS", 0)
+    _login(client, "admin", "AdminPass123!")
+
+    main._streams.enter()                         # a board already streaming
+    try:
+        r = client.get("/admin/orders/stream")
+        body = r.get_data(as_text=True)
+        assert r.status_code == 200 and "event: busy" in body and "retry: 30000" in body
+    finally:
+        main._streams.leave()
+
+    r = client.get("/admin/orders/stream")
+    assert "event: busy" not in r.get_data(as_text=True)
+    assert main._streams.count == 0               # released when the stream closed
+
+
+def test_admin_orders_stream_polls_the_cache_bus(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "SSE_MAX_STREAM_SECONDS", 1)
+    monkeypatch.setattr(main.cache_bus, "poll_seconds", 0.2)
+    _login(client, "admin", "AdminPass123!")
+    with main.get_engine().begin() as conn:         # an order taken on another instance
+        conn.execute(main.text("INSERT INTO orders (user_id, status, total_price) VALUES (1, 'pending', 5)"))
+
+    main.cache_bus.version("orders")              # polled just now: the request itself won't
+    main.cache_bus.store.bump("orders")
+    r = client.get("/admin/orders/stream")
+    # once when the bus moved, again in the closing catch-up
+    assert r.get_data(as_text=True).count("event: order_created") == 2
+
+
+def test_admin_orders_stream_requires_admin(client):
+    _login(client, "testuser", "Password123!")
+    r = client.get("/admin/orders/stream", follow_redirects=False)
+    assert r.status_code in (302, 401, 403)
+
+
+def _place_orders(client, n):
+    _login(client, "testuser", "Password123!")
+    for _ in range(n):
+        _add_to_cart(client, 1)
+        client.post("/checkout", follow_redirects=True)
+    client.post("/logout")
+
+
+def test_admin_bulk_status_update(client):
+    import main
+    _place_orders(client, 3)
+
+    with main.get_engine().begin() as conn:
+        ids = [r.id for r in conn.execute(main.text("SELECT id FROM orders ORDER BY id"))]
+        conn.execute(main.text("UPDATE orders SET status='completed' WHERE id=:id"), {"id": ids[0]})
+
+    _login(client, "admin", "AdminPass123!")
+    r = client.post("/admin/orders/status", json={"order_ids": ids + [9999], "status": "preparing"})
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data["updated"] == ids[1:]
+    reasons = {x["id"]: x["reason"] for x in data["rejected"]}
+    assert reasons[9999] == "not found"
+    assert "completed" in reasons[ids[0]]
+
+    with main.get_engine().begin() as conn:
+        statuses = dict(conn.execute(main.text("SELECT id, status FROM orders")).all())
+    assert statuses[ids[0]] == "completed"
+    assert all(statuses[i] == "preparing" for i in ids[1:])
+
+    # one batched audit record
+    logs = [d for d in main.db_fs.store.get("audit_logs", []) if d["event"] == "order_status_bulk_updated"]
+    assert len(logs) == 1
+
+
+def test_status_moves_only_report_rows_that_changed(client, monkeypatch):
+    import main
+    _place_orders(client, 2)
+    with main.get_engine().begin() as conn:
+        ids = [r.id for r in conn.execute(main.text("SELECT id FROM orders ORDER BY id"))]
+        conn.execute(main.text("UPDATE orders SET status='completed' WHERE id=:id"), {"id": ids[0]})
+        conn.execute(main.text("DELETE FROM rollup_pending"))
+
+    # the first read still sees both pending, as if ids[0] completed right after it
+    real = main.sql.execute
+    reads = []
+
+    def stale(conn, name, params=None):
+        if name == "orders.statuses" and not reads:
+            reads.append(1)
+            return [type("Row", (), {"id": i, "status": "pending"}) for i in params["ids"]]
+        return real(conn, name, params)
+
+    monkeypatch.setattr(main.sql, "execute", stale)
+    start = main.order_feed.last_id
+    _login(client, "admin", "AdminPass123!")
+    data = client.post("/admin/orders/status", json={"order_ids": ids, "status": "cancelled"}).get_json()
+
+    assert data["updated"] == [ids[1]]
+    assert data["rejected"] == [{"id": ids[0], "from": "completed", "reason": "changed meanwhile"}]
+    assert [e[2]["id"] for e in main.order_feed.since(start)[0]] == [ids[1]]
+    with main.get_engine().begin() as conn:
+        assert conn.execute(main.text("SELECT order_id FROM rollup_pending")).scalars().all() == [ids[1]]
+
+
+def test_single_status_change_follows_the_transitions(client):
+    import main
+    _place_orders(client, 1)
+    _login(client, "admin", "AdminPass123!")
+    client.post("/admin/orders/1/status", data={"status": "completed"})
+    r = client.post("/admin/orders/1/status", data={"status": "preparing"}, follow_redirects=True)
+    assert b"cannot move completed -&gt; preparing" in r.data
+    r = client.post("/admin/orders/99/status", data={"status": "preparing"}, follow_redirects=True)
+    assert b"not found" in r.data
+    with main.get_engine().begin() as conn:
+        assert conn.execute(main.text("SELECT status FROM orders WHERE id = 1")).scalar() == "completed"
+
+
+def test_admin_bulk_status_rejects_bad_input(client):
+    _login(client, "admin", "AdminPass123!")
+    assert client.post("/admin/orders/status", json={"order_ids": [1], "status": "eaten"}).status_code == 400
+    assert client.post("/admin/orders/status", json={"order_ids": [], "status": "completed"}).status_code == 400
+
+
+def _order_count():
+    import main
+    with main.get_engine().begin() as conn:
+        return conn.execute(main.text("SELECT COUNT(*) FROM orders")).scalar()
+
+
+def test_checkout_page_issues_idempotency_key(client):
+    _login(client, "testuser", "Password123!")
+    _add_to_cart(client, 1)
+    r = client.get("/checkout")
+    assert b'name="idempotency_key"' in r.data
+
+
+def test_repeated_checkout_with_same_key_creates_one_order(client):
+    _login(client, "testuser", "Password123!")
+    _add_to_cart(client, 1)
+    before = _order_count()
+
+    key = "a" * 32
+    r1 = client.post("/checkout", data={"idempotency_key": key}, follow_redirects=True)
+    assert r1.status_code == 200
+    assert _order_count() == before + 1
+
+    # retry (cart already empty) and a retry with items back in the cart
+    client.post("/checkout", data={"idempotency_key": key}, follow_redirects=True)
+    _add_to_cart(client, 2)
+    r3 = client.post("/checkout", data={"idempotency_key": key}, follow_redirects=True)
+    assert _order_count() == before + 1
+    assert b"already placed" in r3.data
+
+
+def test_expired_checkout_keys_are_swept(client):
+    import main
+    from datetime import datetime, timedelta, timezone
+
+    with main.get_engine().begin() as conn:
+        conn.execute(
+            main.text("INSERT INTO checkout_keys (idem_key, user_id, order_id, created_at, expires_at) VALUES ('old', 1, NULL, :t, :t)"),
+            {"t": datetime.now(timezone.utc) - timedelta(days=2)},
+        )
+
+    assert main.sweep_checkout_keys(force=True) == 1
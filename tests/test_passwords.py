@@ -0,0 +1,65 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from passwords import HasherBusy, PasswordHasher
+
+
+def _stored_hash(username):
+    import main
+    with main.get_engine().begin() as conn:
+        return conn.execute(main.text("SELECT password_hash FROM users WHERE username=:u"), {"u": username}).scalar()
+
+
+def test_login_rehashes_outdated_hash(client):
+    import main
+    with main.get_engine().begin() as conn:
+        conn.execute(
+            main.text("UPDATE users SET password_hash=:ph WHERE username='testuser'"),
+            {"ph": generate_password_hash("Password123!", "pbkdf2:sha256:1000")},
+        )
+
+    r = client.post("/login", data={"username": "testuser", "password": "Password123!"})
+    assert r.status_code == 302
+
+    upgraded = _stored_hash("testuser")
+    assert upgraded.startswith("scrypt:")
+    assert not main.password_hasher.needs_rehash(upgraded)
+
+    # and the upgraded hash still logs in
+    client.post("/logout")
+    r = client.post("/login", data={"username": "testuser", "password": "Password123!"}, follow_redirects=True)
+    assert b"Logged in successfully" in r.data
+
+
+def test_register_uses_configured_method(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "password_hasher", PasswordHasher("pbkdf2:sha256:1000", workers=0))
+    client.post("/register", data={"username": "newbie", "password": "Password123!", "password2": "Password123!"})
+    assert _stored_hash("newbie").startswith("pbkdf2:sha256:1000$")
+
+
+def test_busy_hasher_returns_503(client, monkeypatch):
+    import main
+
+    class _Busy(PasswordHasher):
+        def verify(self, stored, password):
+            raise HasherBusy()
+
+    monkeypatch.setattr(main, "password_hasher", _Busy(workers=0))
+    r = client.post("/login", data={"username": "testuser", "password": "Password123!"})
+    assert r.status_code == 503
+    assert "Retry-After" in r.headers
+
+
+def test_pool_bounds_in_flight_hashes():
+    hasher = PasswordHasher("pbkdf2:sha256:1000", workers=1, max_queue=0)
+    try:
+        assert hasher.verify(hasher.hash("pw"), "pw")
+
+        # hold the only slot and make sure the next caller is refused immediately
+        hasher._slots.acquire()
+        with pytest.raises(HasherBusy):
+            hasher.hash("pw")
+        hasher._slots.release()
+    finally:
+        hasher.shutdown()
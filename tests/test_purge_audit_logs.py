@@ -0,0 +1,81 @@
+import gzip
+import importlib.util
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+from conftest import FakeFirestoreClient
+
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture()
+def purge(monkeypatch):
+    # the function deploys as its own main.py; load it under another name
+    path = Path(__file__).resolve().parents[1] / "functions" / "purge_audit_logs" / "main.py"
+    spec = importlib.util.spec_from_file_location("purge_audit_logs_main", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "db", FakeFirestoreClient())
+    return module
+
+
+def _seed(db, days_old, now=NOW):
+    for i, age in enumerate(days_old):
+        created = now - timedelta(days=age, minutes=i)
+        db.collection("audit_logs").add({"event": f"e{i}", "created_at": created,
+                                         "expires_at": created + timedelta(days=97)})
+
+
+def _events(db):
+    return sorted(d["event"] for d in db.store.get("audit_logs", []))
+
+
+def test_archives_each_batch_then_deletes_only_expired_logs(purge):
+    _seed(purge.db, [120, 110, 100, 95, 91, 30, 1])
+    archived = {}
+
+    result = purge.purge_expired(NOW - timedelta(days=90), archive=archived.__setitem__, batch_size=2)
+
+    assert result == {"deleted": 5, "batches": 3, "more": False}
+    assert _events(purge.db) == ["e5", "e6"]
+    assert len(archived) == 3 and all(n.startswith("audit_logs/") and n.endswith(".ndjson.gz") for n in archived)
+    lines = [json.loads(ln) for gz in archived.values() for ln in gzip.decompress(gz).decode().splitlines()]
+    # oldest first, every deleted log archived once with its id and ISO dates
+    assert [ln["event"] for ln in lines] == ["e0", "e1", "e2", "e3", "e4"]
+    assert all(ln["id"] and ln["created_at"].startswith("20") for ln in lines)
+
+
+def test_failed_upload_keeps_the_logs(purge):
+    _seed(purge.db, [120, 100])
+
+    def broken(name, payload):
+        raise RuntimeError("bucket unavailable")
+
+    with pytest.raises(RuntimeError):
+        purge.purge_expired(NOW - timedelta(days=90), archive=broken)
+    assert _events(purge.db) == ["e0", "e1"]
+
+
+def test_one_call_is_bounded(purge):
+    _seed(purge.db, [100 + i for i in range(5)])
+    result = purge.purge_expired(NOW - timedelta(days=90), batch_size=2, max_batches=2)
+    assert result == {"deleted": 4, "batches": 2, "more": True}
+    assert len(_events(purge.db)) == 1
+
+
+def test_http_entry_point_checks_the_token(purge, monkeypatch):
+    class _Req:
+        def __init__(self, token, args=None):
+            self.headers = {"X-Internal-Token": token}
+            self.args = args or {}
+
+    monkeypatch.setattr(purge, "INTERNAL_TOKEN", "secret")
+    assert purge.purge_audit_logs_http(_Req("wrong"))[1] == 401
+
+    _seed(purge.db, [400, 1], now=datetime.now(timezone.utc))   # the endpoint cuts off from today
+    body, status, _ = purge.purge_audit_logs_http(_Req("secret", {"days": "90"}))
+    assert status == 200 and json.loads(body)["deleted"] == 1
+    assert _events(purge.db) == ["e1"]
@@ -0,0 +1,78 @@
+import logging
+
+import pytest
+from sqlalchemy import create_engine
+
+from queries import QueryRegistry
+
+
+def test_registry_times_statements_and_logs_slow_ones(caplog):
+    reg = QueryRegistry(slow_ms=0)
+    reg.add("one", "SELECT :x AS x")
+    reg.add("many", "SELECT value FROM (SELECT 1 AS value UNION SELECT 2) WHERE value IN :v", expanding=("v",))
+    with pytest.raises(ValueError):
+        reg.add("one", "SELECT 2")
+
+    engine = create_engine("sqlite://")
+    with caplog.at_level(logging.WARNING, logger="queries"), engine.connect() as conn:
+        assert reg.execute(conn, "one", {"x": 5}).scalar() == 5
+        assert sorted(reg.execute(conn, "many", {"v": [1, 2]}).scalars()) == [1, 2]
+        with pytest.raises(Exception):
+            reg.execute(conn, "one", {})          # missing parameter
+    assert "slow query one" in caplog.text
+
+    stats = {s["name"]: s for s in reg.stats()}
+    assert stats["one"]["calls"] == 2 and stats["one"]["errors"] == 1
+    assert stats["many"]["calls"] == 1 and stats["many"]["avg_ms"] is not None
+
+    reg.reset()
+    assert all(s["calls"] == 0 for s in reg.stats())
+
+
+def test_admin_metrics_reports_named_queries(client):
+    client.post("/login", data={"username": "admin", "password": "AdminPass123!"})
+    client.get("/menu")
+    client.post("/cart/add/1")
+    client.get("/cart")
+
+    r = client.get("/admin/metrics")
+    assert r.status_code == 200
+    names = {s["name"]: s for s in r.get_json()["queries"]}
+    assert names["menu.by_ids"]["calls"] >= 1
+    assert names["users.by_username"]["calls"] >= 1
+
+
+def test_admin_metrics_requires_admin(client):
+    assert client.get("/admin/metrics").status_code in (302, 401, 403)
+
+
+def test_mysql_variant_used_on_mysql():
+    reg = QueryRegistry()
+    reg.add("upsert", "SELECT 'sqlite'", mysql="SELECT 'mysql'")
+
+    class _Conn:
+        class dialect:
+            name = "mysql"
+
+        def execute(self, clause, params=None):
+            return str(clause)
+
+    assert reg.execute(_Conn(), "upsert") == "SELECT 'mysql'"
+    with create_engine("sqlite://").connect() as conn:
+        assert reg.execute(conn, "upsert").scalar() == "sqlite"
+
+
+def test_checkout_menu_and_cache_bus_statements_are_named(client):
+    import main
+    main.sql.reset()
+    client.post("/login", data={"username": "testuser", "password": "Password123!"})
+    client.post("/cart/add/1")
+    client.post("/checkout", data={"idempotency_key": "k" * 32})
+    client.get("/api/menu")
+    main.bump_cache_version("menu")
+    main.cache_bus.store.read()
+
+    calls = {s["name"]: s["calls"] for s in main.sql.stats()}
+    for name in ("checkout_keys.claim", "rollup_pending.queue", "menu_version.current",
+                 "cache_versions.bump", "cache_versions.get", "cache_versions.all"):
+        assert calls[name] >= 1, name
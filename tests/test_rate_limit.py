@@ -0,0 +1,105 @@
+import pytest
+
+from rate_limit import Limit, TokenBucketLimiter, parse_limits
+
+
+class _Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_parse_limits():
+    assert parse_limits("ip:20/60, user:5/30") == (Limit("ip", 20, 60.0), Limit("user", 5, 30.0))
+    assert parse_limits("") == ()
+    with pytest.raises(ValueError):
+        parse_limits("country:5/60")
+
+
+def test_bucket_refills_and_idle_buckets_are_evicted():
+    clock = _Clock()
+    limiter = TokenBucketLimiter(sweep_interval=10, clock=clock)
+    limit = Limit("ip", 2, 10.0)   # 1 token every 5s
+
+    assert limiter.hit("a", limit) == 0
+    assert limiter.hit("a", limit) == 0
+    assert limiter.hit("a", limit) == pytest.approx(5.0)
+
+    clock.t += 5
+    assert limiter.hit("a", limit) == 0
+
+    # once a bucket would be full again it is dropped on the next sweep
+    clock.t += 60
+    limiter.hit("b", limit)
+    assert len(limiter) == 1
+
+
+def test_max_keys_evicts_least_recent():
+    limiter = TokenBucketLimiter(max_keys=2)
+    limit = Limit("ip", 5, 60.0)
+    for key in ("a", "b", "a", "c"):
+        limiter.hit(key, limit)
+    assert len(limiter) == 2 and "b" not in limiter._buckets
+
+
+def test_login_rate_limited_per_user_with_retry_after(client):
+    for _ in range(5):
+        r = client.post("/login", data={"username": "testuser", "password": "wrong"})
+        assert r.status_code == 302
+
+    r = client.post("/login", data={"username": "TestUser", "password": "wrong"})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+
+    # a different account from the same IP is still allowed
+    r = client.post("/login", data={"username": "admin", "password": "wrong"})
+    assert r.status_code == 302
+
+
+def test_stats_shed_when_busy_but_checkout_is_not(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "SHED_MAX_INFLIGHT", 2)
+    for _ in range(2):
+        main._inflight.enter()       # two requests already running
+    try:
+        r = client.get("/stats")
+        assert r.status_code == 503
+        assert "Retry-After" in r.headers
+
+        r = client.get("/api/stats")
+        assert r.status_code == 503 and r.get_json()["error"]
+
+        assert client.get("/checkout").status_code != 503
+    finally:
+        for _ in range(2):
+            main._inflight.leave()
+
+    assert client.get("/stats").status_code == 200
+
+
+def test_register_limit_is_per_client_behind_the_front_end(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "CLIENT_IP_HEADER", "X-Appengine-User-Ip")
+    monkeypatch.setitem(main.app.config, "RATE_LIMITS",
+                        {"register": (("POST",), parse_limits("ip:2/300"))})
+
+    def register(ip, n):
+        return client.post("/register", data={"username": f"u{ip}{n}", "password": "x"},
+                           headers={"X-Appengine-User-Ip": ip}).status_code
+
+    # every request arrives from the same front end address (remote_addr)
+    assert [register("203.0.113.1", n) for n in range(3)][-1] == 429
+    assert register("203.0.113.2", 0) != 429
+
+
+def test_forwarded_for_hops(client, monkeypatch):
+    import main
+    monkeypatch.setitem(main.app.config, "TRUSTED_PROXY_COUNT", 1)
+    with main.app.test_request_context(headers={"X-Forwarded-For": "1.2.3.4, 198.51.100.7"}):
+        assert main.client_ip() == "198.51.100.7"     # the entry our proxy appended
+    monkeypatch.setitem(main.app.config, "CLIENT_IP_HEADER", "X-Appengine-User-Ip")
+    with main.app.test_request_context(headers={"X-Appengine-User-Ip": "203.0.113.9",
+                                                "X-Forwarded-For": "1.2.3.4"}):
+        assert main.client_ip() == "203.0.113.9"
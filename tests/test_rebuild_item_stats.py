@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from rebuild_item_stats import main as rebuild_main
+from rebuild_item_stats import rebuild
+
+
+def _seed(db):
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for item_id, ratings in {1: [5, 4, 3], 2: [2], 3: [5, 5]}.items():
+        for r in ratings:
+            db.collection("reviews").add({"username": "u", "item_id": item_id, "rating": r, "created_at": now})
+    db.collection("reviews").add({"username": "u", "item_id": "junk", "rating": 5, "created_at": now})
+
+    stats = db.store.setdefault("item_stats", [])
+    stats.append({"item_id": "1", "review_count": 3, "total_rating": 12.0, "avg_rating": 4.0})   # correct
+    stats.append({"item_id": "2", "review_count": 5, "total_rating": 20.0, "avg_rating": 4.0})   # drifted
+    stats.append({"item_id": "4", "review_count": 1, "total_rating": 3.0, "avg_rating": 3.0})    # no reviews
+    # item 3 has no stats doc at all (the function call failed)
+
+
+def test_dry_run_reports_diff_without_writing():
+    import main
+    db = main.db_fs
+    _seed(db)
+    before = [dict(d) for d in db.store["item_stats"]]
+
+    report = rebuild(db, workers=3, page_size=2, dry_run=True)
+
+    diff = report["diff"]
+    assert [a["item_id"] for a in diff["added"]] == ["3"]
+    assert [c["item_id"] for c in diff["changed"]] == [2]
+    assert diff["changed"][0]["new"] == {"review_count": 1, "total_rating": 2.0, "avg_rating": 2.0}
+    assert diff["zeroed"] == [4]
+    assert diff["unchanged"] == 1
+
+    m = report["metrics"]
+    assert m["reviews_scanned"] == 7 and m["reviews_skipped"] == 1
+    assert m["pages"] == 4           # 7 reviews in pages of 2
+    assert m["docs_written"] == 0
+    assert db.store["item_stats"] == before
+
+
+def test_rebuild_writes_and_is_then_a_no_op():
+    import main
+    db = main.db_fs
+    _seed(db)
+
+    report = rebuild(db, workers=2, page_size=3, batch_size=2)
+    assert report["metrics"]["docs_written"] == 3
+
+    stats = {d["item_id"]: d for d in db.store["item_stats"]}
+    assert stats["2"]["review_count"] == 1 and stats["2"]["avg_rating"] == 2.0
+    assert stats["3"]["review_count"] == 2 and stats["3"]["avg_rating"] == 5.0
+    assert stats["4"]["review_count"] == 0
+
+    again = rebuild(db, workers=2, page_size=3, dry_run=True)["diff"]
+    assert not again["added"] and not again["changed"] and not again["zeroed"]
+
+
+def test_refuses_to_run_for_the_sql_store(capsys):
+    # exits before it would build a Firestore client
+    with pytest.raises(SystemExit) as e:
+        rebuild_main(["--store", "sql"])
+    assert e.value.code == 1
+    assert "no item_stats to rebuild" in capsys.readouterr().err
@@ -0,0 +1,72 @@
+from recommendations import CoOccurrenceIndex, count_pairs
+
+
+def _login(client, username, password):
+    client.post("/login", data={"username": username, "password": password})
+
+
+def _place_order(client, *item_ids):
+    for iid in item_ids:
+        client.post(f"/cart/add/{iid}")
+    client.post("/checkout")
+
+
+def _pairs(conn):
+    import main
+    return {(r.item_a, r.item_b): r.orders
+            for r in conn.execute(main.text("SELECT item_a, item_b, orders FROM item_pairs"))}
+
+
+def test_count_pairs_is_upper_triangular_with_support_on_diagonal():
+    counts = count_pairs([[3, 1, 1], [1, 2], [2]])
+    assert counts == {(1, 1): 2, (3, 3): 1, (2, 2): 2, (1, 3): 1, (1, 2): 1}
+
+
+def test_index_ranks_by_confidence_and_prunes():
+    items = {i: {"id": i, "name": f"item{i}", "price": 1.0} for i in (1, 2, 3, 4)}
+    pairs = [(1, 1, 10), (2, 2, 4), (3, 3, 5), (4, 4, 1),
+             (1, 2, 4), (1, 3, 2), (1, 4, 1), (2, 3, 3),
+             (1, 9, 8)]                  # 9 is not on the menu any more
+    idx = CoOccurrenceIndex(pairs, items, top_k=1, min_support=2)
+
+    # 1 -> 2 (4/10) beats 1 -> 3 (2/10); top_k=1 drops 3; (1, 4) is below support
+    assert [m["id"] for m in idx.for_item(1)] == [2]
+    assert [m["id"] for m in idx.for_item(2)] == [1]   # 4/4 beats 3/4
+    assert idx.for_item(4) == []
+
+    # cart items are never suggested, scores add up across the cart
+    assert [s["id"] for s in idx.suggest([2, 3])] == [1]
+    assert idx.suggest([1, 2]) == []
+
+    # the fragment cache version only moves when a ranking does
+    assert CoOccurrenceIndex(pairs, items, top_k=1, min_support=2, previous=idx).version == idx.version
+    moved = CoOccurrenceIndex(pairs + [(3, 4, 5)], items, top_k=1, min_support=2, previous=idx)
+    assert moved.version == idx.version + 1
+
+
+def test_checkout_updates_pairs_and_cart_suggests(client):
+    import main
+    _login(client, "testuser", "Password123!")
+    _place_order(client, 1, 3)
+    _place_order(client, 1, 1, 3)
+    _place_order(client, 2)
+
+    with main.get_engine().begin() as conn:
+        assert _pairs(conn) == {}                    # nothing written on the checkout path
+    main.flush_rollups()
+
+    with main.get_engine().begin() as conn:
+        live = _pairs(conn)
+        assert live == {(1, 1): 2, (3, 3): 2, (1, 3): 2, (2, 2): 1}
+        # the rebuild job agrees with what checkout recorded
+        assert main.rebuild_pairs(conn) == {"orders": 3, "pairs": 4}
+        assert _pairs(conn) == live
+
+    main._recs["index"] = None
+    client.post("/cart/add/1")
+    html = client.get("/cart").get_data(as_text=True)
+    assert "Customers also ordered" in html
+    assert "/cart/add/3" in html
+
+    html = client.get("/menu").get_data(as_text=True)
+    assert "Customers also ordered: Chicken Burger" in html
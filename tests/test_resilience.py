@@ -0,0 +1,184 @@
+import threading
+import time
+
+import pytest
+
+from conftest import FaultyFirestoreClient
+from resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, Resilience, Unavailable
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    clock = _Clock()
+    b = CircuitBreaker("x", failures=2, reset_seconds=10, clock=clock)
+    b.record_failure()
+    assert b.allow() and b.state == "closed"
+    b.record_failure()
+    assert b.state == "open" and not b.allow()
+
+    clock.now = 10
+    assert b.allow() and b.state == "half_open"
+    assert not b.allow()              # only one trial at a time
+    b.record_failure()                # trial failed: open again
+    assert b.state == "open" and b.times_opened == 2
+
+    clock.now = 20
+    assert b.allow()
+    b.record_success()
+    assert b.state == "closed" and b.allow()
+
+
+def test_deadline_breaker_and_stale_fallback():
+    guard = Resilience(max_workers=4)
+    guard.policy("read", breaker="svc", timeout=0.05, failures=2, reset_seconds=60)
+
+    assert guard.call("read", lambda: "fresh", stale_key="k") == "fresh"
+
+    def slow():
+        time.sleep(0.5)
+        return "late"
+
+    # times out, the remembered answer is served instead
+    assert guard.call("read", slow, stale_key="k") == "fresh"
+    with pytest.raises(DeadlineExceeded):
+        guard.call("read", slow)
+
+    # two failures in a row: breaker open, no call is even attempted
+    called = []
+    with pytest.raises(CircuitOpen):
+        guard.call("read", lambda: called.append(1))
+    assert called == []
+
+    counts = guard.stats()["policies"]["read"]
+    assert counts["timeouts"] == 2 and counts["short_circuits"] == 1 and counts["stale_served"] == 1
+    assert guard.stats()["breakers"]["svc"]["state"] == "open"
+
+
+def test_errors_are_wrapped_as_unavailable():
+    guard = Resilience(max_workers=2)
+    guard.policy("read", breaker="svc", timeout=1.0)
+
+    def boom():
+        raise RuntimeError("nope")
+
+    with pytest.raises(Unavailable):
+        guard.call("read", boom)
+    assert guard.stats()["policies"]["read"]["errors"] == 1
+
+
+def test_caller_errors_propagate_without_tripping_the_breaker():
+    guard = Resilience(max_workers=2)
+    guard.policy("read", breaker="svc", timeout=1.0, failures=2)
+
+    def bad_input():
+        raise ValueError("invalid cursor")
+
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            guard.call("read", bad_input, stale_key="k")
+    stats = guard.stats()
+    assert stats["breakers"]["svc"]["state"] == "closed"
+    assert stats["policies"]["read"]["caller_errors"] == 5 and stats["policies"]["read"]["errors"] == 0
+
+
+def test_bad_review_cursors_are_400_and_leave_firestore_closed(client):
+    import main
+    for _ in range(8):
+        for cursor in ("garbage!!", "MjAyNi0wMS0wMXxhL2I"):     # the second: an id with a "/"
+            r = client.get(f"/api/reviews?cursor={cursor}")
+            assert r.status_code == 400
+    assert main.guard.stats()["breakers"]["firestore"]["state"] == "closed"
+    assert client.get("/api/reviews").status_code == 200
+
+
+def test_hedged_read_returns_the_faster_attempt():
+    guard = Resilience(max_workers=4)
+    guard.policy("read", breaker="svc", timeout=2.0, hedge_after=0.05)
+
+    attempts = []
+    lock = threading.Lock()
+
+    def read():
+        with lock:
+            attempts.append(1)
+            n = len(attempts)
+        time.sleep(1.0 if n == 1 else 0.0)   # the first attempt is stuck
+        return n
+
+    started = time.monotonic()
+    assert guard.call("read", read) == 2
+    assert time.monotonic() - started < 0.9
+    counts = guard.stats()["policies"]["read"]
+    assert counts["hedges"] == 1 and counts["hedge_wins"] == 1
+
+
+def test_pages_degrade_when_firestore_fails(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "db_fs", FaultyFirestoreClient(fail=1000))
+
+    r = client.get("/api/stats?limit=2")
+    assert r.status_code == 200 and r.headers["X-Degraded"] == "review-stats"
+    assert [row["id"] for row in r.get_json()] == [1, 2]
+
+    assert client.get("/api/reviews").status_code == 503
+    assert client.get("/stats").status_code == 200
+    assert client.get("/menu").status_code == 200
+
+    # the breaker is open now: further calls fail fast without an RPC
+    rpcs = main.db_fs.rpcs
+    client.get("/api/stats")
+    assert main.db_fs.rpcs == rpcs
+
+    client.post("/login", data={"username": "admin", "password": "AdminPass123!"})
+    res = client.get("/admin/metrics").get_json()["resilience"]
+    assert res["breakers"]["firestore"]["state"] == "open"
+    assert res["policies"]["firestore.read"]["short_circuits"] >= 1
+
+
+def test_slow_firestore_read_hits_its_deadline(client, monkeypatch):
+    import main
+    monkeypatch.setattr(main, "db_fs", FaultyFirestoreClient(slow=1, delay=1.0))
+    monkeypatch.setattr(main.guard.policies["firestore.read"], "timeout", 0.1)
+
+    started = time.monotonic()
+    r = client.get("/api/stats?limit=2")
+    assert r.status_code == 200 and r.headers["X-Degraded"] == "review-stats"
+    assert time.monotonic() - started < 0.9
+    assert main.guard.stats()["policies"]["firestore.read"]["timeouts"] == 1
+
+
+def test_stale_results_are_bounded():
+    guard = Resilience(max_workers=2, max_stale=3)
+    guard.policy("read", breaker="svc", timeout=1.0)
+    for i in range(10):
+        guard.call("read", lambda i=i: i, stale_key=("item", i))
+    assert list(guard._stale) == [("read", ("item", i)) for i in (7, 8, 9)]
+
+
+def test_review_retry_after_write_deadline_does_not_duplicate(client, monkeypatch):
+    import re
+    import main
+    monkeypatch.setattr(main, "db_fs", FaultyFirestoreClient())
+    monkeypatch.setattr(main.guard.policies["firestore.write"], "timeout", 0.1)
+    client.post("/login", data={"username": "testuser", "password": "Password123!"})
+    main.db_fs.slow, main.db_fs.delay = 1, 0.5
+
+    form = {"item_id": "2", "rating": "4", "comment": "crispy", "review_key": "r" * 32}
+    r = client.post("/reviews", data=form)
+    assert r.status_code == 503
+    page = r.get_data(as_text=True)
+    assert re.search(r'name="review_key" value="r{32}"', page) and "crispy" in page
+
+    time.sleep(0.6)          # the abandoned write lands in the background
+    assert client.post("/reviews", data=form).status_code == 302
+
+    reviews = main.db_fs.store["reviews"]
+    assert len(reviews) == 1 and reviews[0]["comment"] == "crispy"
+    assert [d.id for d in main.db_fs.collection("reviews").stream()] == ["r" * 32]
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+from review_cache import LatestReviewsCache
+
+
+class _Repo:
+    """In-memory review store that counts queries."""
+
+    def __init__(self, reviews=()):
+        self.reviews = list(reviews)   # newest first
+        self.queries = 0
+
+    def latest(self, limit, item_id=None, cursor=None):
+        self.queries += 1
+        rows = [r for r in self.reviews if item_id is None or r["item_id"] == item_id]
+        return [dict(r) for r in rows[:limit]]
+
+
+class _Clock:
+    t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _review(i, item_id):
+    return {"id": f"r{i}", "item_id": item_id, "rating": 5,
+            "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i)}
+
+
+def test_serves_overall_and_item_windows_from_memory():
+    repo = _Repo([_review(i, i % 3) for i in range(30, 0, -1)])
+    cache = LatestReviewsCache(lambda: repo, depth=10, item_depth=5, clock=_Clock())
+
+    assert [r["id"] for r in cache.latest(3)] == ["r30", "r29", "r28"]
+    assert repo.queries == 1
+    assert cache.latest(10) is not None and repo.queries == 1
+    # beyond the window -> caller must use the store
+    assert cache.latest(11) is None
+
+    # per-item window is filled once, then answered from memory
+    assert len(cache.latest(5, item_id=1)) == 5
+    assert len(cache.latest(2, item_id=1)) == 2
+    assert repo.queries == 2
+
+
+def test_write_through_and_reconcile_with_other_instances():
+    clock = _Clock()
+    repo = _Repo([_review(2, 1), _review(1, 2)])
+    cache = LatestReviewsCache(lambda: repo, depth=10, item_depth=5, reconcile_seconds=30, clock=clock)
+    assert len(cache.latest(10, item_id=1)) == 1
+
+    # posted through this process: visible at once, no query
+    mine = _review(3, 1)
+    repo.reviews.insert(0, mine)
+    cache.record(mine)
+    queries = repo.queries
+    assert cache.latest(1)[0]["id"] == "r3"
+    assert [r["id"] for r in cache.latest(5, item_id=1)] == ["r3", "r2"]
+    assert repo.queries == queries
+
+    # written by another instance: picked up on the next reconcile
+    repo.reviews.insert(0, _review(4, 1))
+    assert cache.latest(1)[0]["id"] == "r3"
+    clock.t += 31
+    assert cache.latest(1)[0]["id"] == "r4"
+    assert [r["id"] for r in cache.latest(5, item_id=1)] == ["r4", "r3", "r2"]
+
+
+def test_reconcile_keeps_local_writes_the_read_does_not_show():
+    clock = _Clock()
+    repo = _Repo()
+    cache = LatestReviewsCache(lambda: repo, depth=10, reconcile_seconds=30, clock=clock)
+    assert cache.latest(5) == []
+
+    # the store doesn't return it yet (new store, lagging replica...)
+    cache.record(_review(1, 1))
+    clock.t += 31
+    assert [r["id"] for r in cache.latest(5)] == ["r1"]
+
+    # merged by time with what other instances wrote
+    repo.reviews = [_review(3, 2), _review(0, 2)]
+    clock.t += 31
+    assert [r["id"] for r in cache.latest(5)] == ["r3", "r1", "r0"]
+
+    # once the store has it, the store's copy is the one kept
+    repo.reviews = [_review(3, 2), {**_review(1, 1), "comment": "stored"}, _review(0, 2)]
+    clock.t += 31
+    assert cache.latest(5)[1]["comment"] == "stored"
+
+
+def test_api_reviews_answered_from_memory_after_post(client, monkeypatch):
+    import main
+    client.post("/login", data={"username": "testuser", "password": "Password123!"})
+    client.post("/reviews", data={"item_id": "1", "rating": "5", "comment": "great"})
+
+    def _boom(*a, **kw):
+        raise AssertionError("store should not be queried")
+
+    # the window was loaded by the first read; later reads stay in memory
+    assert client.get("/api/reviews?limit=5").get_json()[0]["comment"] == "great"
+    monkeypatch.setattr(main.review_repo, "latest", _boom)
+    r = client.get("/api/reviews?limit=5&item_id=1")
+    assert r.status_code == 200 and r.get_json()[0]["comment"] == "great"
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+@pytest.fixture()
+def sql_reviews(monkeypatch):
+    import main
+    from review_store import SqlReviewRepository
+    repo = SqlReviewRepository(main.get_engine)
+    monkeypatch.setattr(main, "review_repo", repo)
+    return repo
+
+
+def _add(repo, item_id, rating, minutes_ago, username="testuser"):
+    return repo.add({
+        "username": username,
+        "item_id": item_id,
+        "rating": rating,
+        "comment": f"r{rating}",
+        "created_at": datetime(2026, 1, 1, 12, tzinfo=timezone.utc) - timedelta(minutes=minutes_ago),
+    })
+
+
+def test_sql_store_post_and_read_back(client, sql_reviews):
+    client.post("/login", data={"username": "testuser", "password": "Password123!"})
+    r = client.post("/reviews", data={"item_id": "2", "rating": "4", "comment": "nice"}, follow_redirects=True)
+    assert r.status_code == 200
+
+    r = client.get("/api/reviews?item_id=2")
+    data = r.get_json()
+    assert len(data) == 1
+    # the item name comes from the join, not a second lookup
+    assert data[0]["item_name"] == "Margherita Pizza"
+    assert data[0]["rating"] == 4
+
+    stats = {s["id"]: s for s in client.get("/api/stats").get_json()}
+    assert stats[2]["review_count"] == 1 and stats[2]["avg_rating"] == 4.0
+    assert stats[1]["review_count"] == 0
+
+
+def test_sql_store_cursor_pagination(client, sql_reviews):
+    for i in range(5):
+        _add(sql_reviews, 1, 5 - i % 2, minutes_ago=i)
+    _add(sql_reviews, 3, 1, minutes_ago=10)
+
+    seen, cursor = [], None
+    while True:
+        url = "/api/reviews?item_id=1&limit=2" + (f"&cursor={cursor}" if cursor else "")
+        r = client.get(url)
+        seen += [rv["id"] for rv in r.get_json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == 5 and len(set(seen)) == 5
+
+    assert client.get("/api/reviews?cursor=garbage").status_code == 400
+
+
+def test_sql_store_top_rated_and_stats_page(client, sql_reviews):
+    _add(sql_reviews, 3, 5, 1)
+    _add(sql_reviews, 3, 4, 2)
+    _add(sql_reviews, 1, 2, 3)
+
+    top = sql_reviews.top_rated(10)
+    assert [t["item_id"] for t in top] == [3, 1]
+    assert top[0]["name"] == "Fries" and top[0]["avg_rating"] == 4.5
+
+    r = client.get("/stats")
+    assert r.status_code == 200
+    assert b"Fries" in r.data
+
+
+def test_backfill_is_idempotent():
+    import main
+    from review_store import FirestoreReviewRepository, SqlReviewRepository, backfill_reviews_to_sql
+
+    for i in range(3):
+        main.db_fs.collection("reviews").add({
+            "username": "testuser", "item_id": 1, "rating": 5, "comment": "",
+            "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i),
+        })
+    source = FirestoreReviewRepository(lambda: main.db_fs)
+    target = SqlReviewRepository(main.get_engine)
+
+    assert backfill_reviews_to_sql(source, target) == {"scanned": 3, "inserted": 3}
+    assert backfill_reviews_to_sql(source, target) == {"scanned": 3, "inserted": 0}
+    assert target.item_stats([1])[1]["review_count"] == 3
+
+
+def test_firestore_pages_dont_skip_reviews_of_the_same_instant():
+    import main
+    from review_store import FirestoreReviewRepository, SqlReviewRepository, backfill_reviews_to_sql, encode_cursor
+
+    same = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i in range(5):
+        main.db_fs.collection("reviews").add({
+            "username": "testuser", "item_id": 1, "rating": 5, "comment": f"c{i}", "created_at": same,
+        })
+    repo = FirestoreReviewRepository(lambda: main.db_fs)
+
+    seen, cursor = [], None
+    while True:
+        page = repo.latest(2, cursor=cursor)
+        seen += [r["comment"] for r in page]
+        if len(page) < 2:
+            break
+        cursor = encode_cursor(page[-1])
+    assert seen == ["c4", "c3", "c2", "c1", "c0"]
+
+    target = SqlReviewRepository(main.get_engine)
+    assert backfill_reviews_to_sql(repo, target, page_size=2) == {"scanned": 5, "inserted": 5}
+
+
+def test_sql_store_exports_without_the_function(client, sql_reviews, monkeypatch):
+    import main
+
+    def no_function(*a, **kw):
+        raise AssertionError("export function called in sql mode")
+    monkeypatch.setattr(main.requests, "get", no_function)
+    _add(sql_reviews, 3, 4, 1, username="ann")
+    client.post("/login", data={"username": "admin", "password": "AdminPass123!"})
+
+    r = client.get("/admin/export-reviews")
+    assert r.status_code == 200 and r.mimetype == "text/csv"
+    lines = r.get_data(as_text=True).splitlines()
+    assert lines[0] == "id,username,item_id,rating,comment,created_at"
+    assert lines[1].split(",")[1:5] == ["ann", "3", "4", "r4"]
+
+
+def test_repository_interface_is_abstract():
+    from review_store import ReviewRepository
+    with pytest.raises(TypeError):
+        ReviewRepository()
+
+
+def test_unknown_review_store_rejected():
+    from review_store import make_review_repository
+    with pytest.raises(ValueError):
+        make_review_repository("mongo", lambda: None, lambda: None)
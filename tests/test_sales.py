@@ -0,0 +1,158 @@
+from datetime import datetime, timezone
+
+
+def _login(client, username, password):
+    client.post("/login", data={"username": username, "password": password})
+
+
+def _place_order(client, *item_ids):
+    for iid in item_ids:
+        client.post(f"/cart/add/{iid}")
+    client.post("/checkout")
+
+
+def _flush():
+    # what the background flusher does every ROLLUP_FLUSH_SECONDS
+    import main
+    while main.flush_rollups():
+        pass
+
+
+def _sales(client, group="day"):
+    _flush()
+    today = datetime.now(timezone.utc).date().isoformat()
+    r = client.get(f"/api/sales?from={today}&to={today}&group={group}")
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def test_checkout_and_cancel_keep_rollups_in_step(client):
+    _login(client, "testuser", "Password123!")
+    _place_order(client, 1, 1, 3)        # 2 x 10.49 + 3.49
+    _place_order(client, 2)              # 9.99
+    client.post("/logout")
+
+    _login(client, "admin", "AdminPass123!")
+    day = _sales(client)
+    assert day["totals"] == {"revenue": 34.46, "orders": 2, "items": 4}
+    assert _sales(client, "hour")["totals"]["orders"] == 2
+
+    items = {r["menu_item_id"]: r for r in _sales(client, "item")["rows"]}
+    assert items[1]["qty"] == 2 and items[1]["revenue"] == 20.98
+    assert items[1]["name"] == "Chicken Burger"
+
+    # single-order cancel takes the order out; cancelled orders stay cancelled
+    client.post("/admin/orders/2/status", data={"status": "cancelled"})
+    assert _sales(client)["totals"]["orders"] == 1
+    r = client.post("/admin/orders/2/status", data={"status": "pending"}, follow_redirects=True)
+    assert b"cannot move cancelled -&gt; pending" in r.data
+    assert _sales(client)["totals"]["orders"] == 1
+
+    # bulk cancel only counts the order that actually moved
+    r = client.post("/admin/orders/status", json={"order_ids": [1, 2], "status": "cancelled"}).get_json()
+    assert r["updated"] == [1]
+    assert r["rejected"] == [{"id": 2, "from": "cancelled", "reason": "unchanged"}]
+    assert _sales(client)["rows"] == []
+    assert _sales(client, "item")["rows"] == []
+
+
+def test_sales_api_reports_the_backlog_without_flushing(client):
+    import main
+    _login(client, "testuser", "Password123!")
+    _place_order(client, 3)
+    _place_order(client, 1)
+    client.post("/logout")
+
+    _login(client, "admin", "AdminPass123!")
+    today = datetime.now(timezone.utc).date().isoformat()
+    r = client.get(f"/api/sales?from={today}&to={today}").get_json()
+    assert r["rows"] == [] and r["pending"] == {"changes": 2, "oldest_id": 1}
+    with main.get_engine().begin() as conn:
+        assert conn.execute(main.text("SELECT COUNT(*) FROM rollup_pending")).scalar() == 2
+
+    _flush()
+    r = client.get(f"/api/sales?from={today}&to={today}").get_json()
+    assert r["totals"]["orders"] == 2 and r["pending"] == {"changes": 0, "oldest_id": None}
+
+
+def test_rebuild_command_matches_history(client):
+    import main
+    with main.get_engine().begin() as conn:
+        for ts, status in (("2026-02-01 09:15:00", "completed"),
+                           ("2026-02-01 18:40:00", "completed"),
+                           ("2026-02-02 12:00:00", "cancelled")):
+            conn.execute(main.text(
+                "INSERT INTO orders (user_id, status, total_price, created_at) VALUES (1, :s, 3.49, :t)"
+            ), {"s": status, "t": ts})
+            oid = conn.execute(main.text("SELECT MAX(id) FROM orders")).scalar()
+            conn.execute(main.text(
+                "INSERT INTO order_items (order_id, menu_item_id, qty, unit_price) VALUES (:o, 3, 1, 3.49)"
+            ), {"o": oid})
+
+    result = main.app.test_cli_runner().invoke(args=["rebuild-sales"])
+    assert "from 2 orders" in result.output
+
+    _login(client, "admin", "AdminPass123!")
+    r = client.get("/api/sales?from=2026-02-01&to=2026-02-02&group=hour").get_json()
+    assert [row["hour"] for row in r["rows"]] == ["2026-02-01T09:00", "2026-02-01T18:00"]
+    r = client.get("/api/sales?from=2026-02-01&to=2026-02-02").get_json()
+    assert r["rows"] == [{"day": "2026-02-01", "orders": 2, "items": 2, "revenue": 6.98}]
+
+
+def test_sales_api_validation_and_access(client):
+    assert client.get("/api/sales").status_code in (302, 401, 403)
+
+    _login(client, "admin", "AdminPass123!")
+    assert client.get("/api/sales?group=week").status_code == 400
+    assert client.get("/api/sales?from=2026-13-01").status_code == 400
+    assert client.get("/api/sales?from=2026-01-01&to=2026-03-01&group=hour").status_code == 400
+
+
+def test_checkout_only_queues_the_rollup_change(client):
+    import main
+    _login(client, "testuser", "Password123!")
+    _place_order(client, 3)
+
+    with main.get_engine().begin() as conn:
+        # no hot rollup row was written (or locked) by the order transaction
+        assert conn.execute(main.text("SELECT COUNT(*) FROM sales_daily")).scalar() == 0
+        assert conn.execute(main.text("SELECT order_id, sales_sign FROM rollup_pending")).all() == [(1, 1)]
+
+    assert main.flush_rollups() == 1
+    assert main.flush_rollups() == 0          # applied rows are gone, nothing counts twice
+    with main.get_engine().begin() as conn:
+        assert conn.execute(main.text("SELECT orders, revenue FROM sales_daily")).one() == (1, 3.49)
+
+
+def test_rebuild_drops_queued_sales_changes(client):
+    import main
+    _login(client, "testuser", "Password123!")
+    _place_order(client, 3)
+    main.app.test_cli_runner().invoke(args=["rebuild-sales"])
+    main.flush_rollups()
+    with main.get_engine().begin() as conn:
+        assert conn.execute(main.text("SELECT orders FROM sales_daily")).scalar() == 1
+
+
+def test_flusher_thread_applies_in_the_background(client):
+    import threading
+    import main
+    from sales import RollupFlusher
+    _login(client, "testuser", "Password123!")
+    _place_order(client, 3)
+
+    flushed = threading.Event()
+
+    def flush(limit):
+        n = main.flush_rollups(limit)
+        flushed.set()
+        return n
+
+    worker = RollupFlusher(flush, interval=0.01)
+    worker.start()
+    try:
+        assert flushed.wait(2)
+    finally:
+        worker.stop()
+    with main.get_engine().begin() as conn:
+        assert conn.execute(main.text("SELECT COUNT(*) FROM rollup_pending")).scalar() == 0
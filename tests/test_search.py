@@ -0,0 +1,50 @@
+def test_menu_search_prefix(client):
+    r = client.get("/api/menu/search?q=burg")
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data and data[0]["name"] == "Chicken Burger"
+
+
+def test_menu_search_fuzzy(client):
+    r = client.get("/api/menu/search?q=piza")
+    assert r.status_code == 200
+    names = [d["name"] for d in r.get_json()]
+    assert "Margherita Pizza" in names
+
+
+def test_menu_search_matches_category(client):
+    r = client.get("/api/menu/search?q=drink")
+    names = [d["name"] for d in r.get_json()]
+    assert names == ["Coke"]
+
+
+def test_menu_search_empty_query(client):
+    r = client.get("/api/menu/search?q=")
+    assert r.status_code == 200
+    assert r.get_json() == []
+
+
+def test_menu_search_index_rebuilds_on_menu_version_bump(client):
+    import main
+
+    first = main.menu_search_index()
+    assert main.menu_search_index() is first
+
+    main.bump_cache_version("menu")
+    assert main.menu_search_index() is not first
+
+
+def test_new_ratings_reorder_results_without_rebuilding_the_index(client):
+    import main
+
+    names = [d["name"] for d in client.get("/api/menu/search?q=item").get_json()]
+    assert names[0] == "Chicken Burger"          # equal text scores, by id
+    index = main.menu_search_index()
+
+    main.db_fs.store["item_stats"] = [
+        {"item_id": "3", "review_count": 12, "total_rating": 60.0, "avg_rating": 5.0},
+    ]
+    main.bump_cache_version("stats")
+    names = [d["name"] for d in client.get("/api/menu/search?q=item").get_json()]
+    assert names[0] == "Fries"
+    assert main.menu_search_index() is index